@@ -0,0 +1,722 @@
+#!/usr/bin/env python3
+"""
+Multi-node detection aggregator
+Pi5 nodes post compact alert events here in batches over keep-alive HTTP
+instead of calling Discord themselves. The aggregator stores every event in
+SQLite (WAL, batched inserts, time and camera indexes), groups sightings of
+the same person on neighbouring cameras into one incident, and is the only
+place that sends notifications, so there is one webhook to rate-limit.
+
+Thumbnails stay on the node. The reply to a batch lists the events whose
+thumbnail the aggregator wants (the first event of each new incident) and
+the node uploads only those.
+
+Standard library only (asyncio server, minimal HTTP/1.1), so it runs on a
+Pi or any small box. `requests` is only needed when a webhook is set.
+
+Endpoints:
+    POST /events                        {"node": "pi-1", "events": [{"id", "camera", "ts", "track", "conf", "box"?, "thumb"?}]}
+    PUT  /thumbnails/<node>/<id>        JPEG body
+    GET  /thumbnails/<node>/<id>
+    GET  /events?since=<ts>&camera=<name>&limit=<n>
+    GET  /stats
+
+cameras.json (optional, cameras that can see the same person within the window):
+    {"door": ["hall"], "hall": ["door", "kitchen"]}
+
+Usage:
+    python aggregator.py --port 8765 --db aggregator.db --webhook <url>
+    python aggregator.py --simulate --nodes 8 --rate 4000 --seconds 10
+"""
+
+import argparse
+import asyncio
+import http.client
+import itertools
+import json
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+MAX_BODY = 4 * 1024 * 1024
+MAX_THUMBNAIL = 2 * 1024 * 1024
+TOKEN_HEADER = 'x-aggregator-token'
+REASONS = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    node TEXT NOT NULL,
+    camera TEXT NOT NULL,
+    ts REAL NOT NULL,
+    track INTEGER,
+    confidence REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    incident INTEGER NOT NULL,
+    has_thumbnail INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_camera_ts ON events (camera, ts);
+CREATE INDEX IF NOT EXISTS events_incident ON events (incident);
+CREATE TABLE IF NOT EXISTS thumbnails (
+    event_id TEXT PRIMARY KEY,
+    jpeg BLOB NOT NULL
+);
+"""
+EVENT_COLUMNS = ('id', 'node', 'camera', 'ts', 'track', 'confidence', 'x1', 'y1', 'x2', 'y2',
+                 'incident', 'has_thumbnail')
+
+
+def load_adjacency(path):
+    """Camera adjacency from JSON (None = every camera neighbours every other)"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+class EventStore:
+    """SQLite in WAL mode. One thread owns the connection; the event loop
+    hands it whole batches, so each flush is a single transaction."""
+
+    def __init__(self, path):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._db = None
+        self._executor.submit(self._open).result()
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')  # Durable at checkpoints; fine for WAL
+        self._db.executescript(SCHEMA)
+
+    def _write(self, events, thumbnails):
+        """Rows actually inserted; a re-sent event (same id) is ignored"""
+        inserted = 0
+        with self._db:
+            if events:
+                inserted = self._db.executemany(
+                    f"INSERT OR IGNORE INTO events VALUES ({','.join('?' * len(EVENT_COLUMNS))})", events).rowcount
+            if thumbnails:
+                self._db.executemany('INSERT OR IGNORE INTO thumbnails VALUES (?, ?)', thumbnails)
+        return inserted
+
+    def _fetch(self, sql, args):
+        return self._db.execute(sql, args).fetchall()
+
+    async def write(self, events, thumbnails=()):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._write, events, thumbnails)
+
+    async def fetch(self, sql, args=()):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._fetch, sql, args)
+
+    def last_incident(self):
+        return self._executor.submit(self._fetch, 'SELECT MAX(incident) FROM events', ()).result()[0][0] or 0
+
+    def close(self):
+        self._executor.submit(self._db.close).result()
+        self._executor.shutdown()
+
+
+class IncidentTracker:
+    """Groups events of the same person into incidents.
+
+    An event joins the most recent incident whose last event is within
+    `window` seconds, that started on the same camera or a neighbouring one
+    and that is less than `max_duration` seconds old. A new track id on a
+    camera already in the incident is a different person. Anything else
+    opens a new incident, which is what gets notified. Checking against the
+    starting camera and capping the age keeps a ring of busy cameras from
+    chaining everything into one endless incident.
+    """
+
+    def __init__(self, window=5.0, adjacency=None, first_id=1, max_duration=60.0):
+        self.window = window
+        self.max_duration = max_duration
+        self.adjacency = None
+        if adjacency is not None:
+            self.adjacency = {}
+            for camera, neighbours in adjacency.items():  # Symmetric, and every camera neighbours itself
+                for other in list(neighbours) + [camera]:
+                    self.adjacency.setdefault(camera, {camera}).add(other)
+                    self.adjacency.setdefault(other, {other}).add(camera)
+        self.next_id = first_id
+        self.active = OrderedDict()  # incident -> [last_ts, start_ts, camera, {camera: track}]; most recent last
+        self.latest = 0.0
+
+    def _neighbours(self, camera, other):
+        if self.adjacency is None:
+            return True
+        return other in self.adjacency.get(camera, {camera})
+
+    def assign(self, camera, ts, track=None):
+        """(incident id, True if the incident is new)"""
+        self.latest = max(self.latest, ts)
+        while self.active:
+            incident, (last_ts, *_) = next(iter(self.active.items()))
+            if self.latest - last_ts <= self.window:
+                break
+            del self.active[incident]
+
+        for incident in reversed(self.active):
+            last_ts, start_ts, origin, tracks = self.active[incident]
+            if (abs(ts - last_ts) <= self.window and ts - start_ts <= self.max_duration
+                    and self._neighbours(camera, origin) and tracks.setdefault(camera, track) == track):
+                self.active[incident][0] = max(last_ts, ts)
+                self.active.move_to_end(incident)
+                return incident, False
+
+        incident = self.next_id
+        self.next_id += 1
+        self.active[incident] = [ts, ts, camera, {camera: track}]
+        return incident, True
+
+
+class Notifier:
+    """The single notification fan-out: one webhook, at most one message
+    per `min_interval`. A backlog is collapsed into one summary message.
+    Without a webhook it only prints (dry run)."""
+
+    def __init__(self, webhook_url=None, min_interval=2.0, collapse_after=5):
+        self.webhook_url = webhook_url
+        self.min_interval = min_interval
+        self.collapse_after = collapse_after
+        self.queue = asyncio.Queue()
+        self.sent = 0
+        self.collapsed = 0
+
+    def _post(self, payload, files=None):
+        if self.webhook_url is None:
+            print(f"🔔 {payload['content']}")
+            return
+        import requests
+        for _ in range(2):
+            r = requests.post(self.webhook_url, data=payload, files=files or None, timeout=8)
+            if r.status_code != 429:
+                break
+            time.sleep(float(r.headers.get('Retry-After', 1)))  # Webhook rate limit
+        if r.status_code not in (200, 204):
+            print(f"⚠ Webhook returned HTTP {r.status_code}")
+
+    def _send(self, item):
+        if self.webhook_url is None:
+            self._post({'content': f"Incident {item['incident']}: {item['camera']} ID {item['track']} "
+                                   f"({item['confidence']*100:.1f}%)"})
+            return
+        from alerts import build_alert_payload  # Needs OpenCV only when a webhook is set
+        payload, files = build_alert_payload(item['jpeg'], f"{item['camera']} #{item['track']}", item['confidence'])
+        self._post(payload, files)
+
+    def _send_summary(self, items):
+        cameras = sorted({i['camera'] for i in items})
+        self._post({'content': f"👂 **{len(items)} new ear detections** on {', '.join(cameras)}"})
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self.queue.get()
+            items = [item]
+            if self.queue.qsize() >= self.collapse_after:
+                while not self.queue.empty():
+                    items.append(self.queue.get_nowait())
+            try:
+                if len(items) == 1:
+                    await loop.run_in_executor(None, self._send, item)
+                else:
+                    await loop.run_in_executor(None, self._send_summary, items)
+                    self.collapsed += len(items) - 1
+                self.sent += 1
+            except Exception as e:
+                print(f"⚠ Notification failed: {e}")
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+            await asyncio.sleep(self.min_interval)
+
+
+def _response(status, body=b'', content_type='application/json', keep_alive=True, headers=()):
+    head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}", f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    if body:
+        head.append(f"Content-Type: {content_type}")
+    head.extend(headers)
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body
+
+
+def _json(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+class Aggregator:
+    """Ingest server: HTTP handlers only touch in-memory state; a flush task
+    writes the accumulated rows every `flush_interval` seconds."""
+
+    def __init__(self, db_path='aggregator.db', window=5.0, adjacency=None, webhook_url=None, token=None,
+                 thumbnail_wait=2.0, notify_interval=2.0, flush_interval=0.2, max_pending=100000,
+                 max_incident=60.0):
+        self.db_path = db_path
+        self.token = token
+        self.thumbnail_wait = thumbnail_wait
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.tracker = IncidentTracker(window, adjacency, max_duration=max_incident)
+        self.notifier = Notifier(webhook_url, notify_interval)
+
+        self._rows = []
+        self._thumbnails = []
+        self._wanted = {}    # node -> event ids whose thumbnail to request
+        self._awaiting = {}  # event key -> notification waiting for its thumbnail
+        self._tasks = []
+        self.store = None
+        self.server = None
+        self.stats = {'received': 0, 'stored': 0, 'duplicates': 0, 'batches': 0, 'flushes': 0, 'incidents': 0,
+                      'thumbnails': 0, 'rejected': 0, 'connections': 0}
+
+    async def start(self, host='0.0.0.0', port=8765):
+        self.store = EventStore(self.db_path)
+        self.tracker.next_id = self.store.last_incident() + 1
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self._tasks = [asyncio.create_task(self._flush_loop()), asyncio.create_task(self.notifier.run())]
+        return self.server
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self, drain_timeout=10.0):
+        """Stop accepting, send what is still owed (notifications waiting for
+        a thumbnail go out without one), then write the last rows."""
+        self.server.close()
+        for _, item in self._awaiting.values():
+            self.notifier.queue.put_nowait(item)
+        self._awaiting.clear()
+        try:
+            await asyncio.wait_for(self.notifier.queue.join(), drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠ {self.notifier.queue.qsize()} notifications not sent before shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await self._flush()
+        self.store.close()
+
+    # ------------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------------
+    async def handle(self, reader, writer):
+        self.stats['connections'] += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = h.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY:
+                    writer.write(_response(413, keep_alive=False))
+                    break
+                body = await reader.readexactly(length) if length else b''
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                if self.token and headers.get(TOKEN_HEADER) != self.token:
+                    status, payload, extra = 401, b'', ()
+                else:
+                    status, payload, extra = await self.route(method, target, body)
+                content_type = 'image/jpeg' if target.startswith('/thumbnails') else 'application/json'
+                writer.write(_response(status, payload, content_type, keep_alive, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, target, body):
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip('/').split('/')]
+        if parts[0] == 'events' and len(parts) == 1:
+            if method == 'POST':
+                return self.ingest(body)
+            if method == 'GET':
+                return await self.query(parse_qs(url.query))
+        elif parts[0] == 'thumbnails' and len(parts) == 3:
+            if method == 'PUT':
+                return self.receive_thumbnail(parts[1], parts[2], body)
+            if method == 'GET':
+                rows = await self.store.fetch('SELECT jpeg FROM thumbnails WHERE event_id = ?',
+                                              (f"{parts[1]}:{parts[2]}",))
+                return (200, rows[0][0], ()) if rows else (404, b'', ())
+        elif parts == ['stats'] and method == 'GET':
+            return 200, _json(self.snapshot_stats()), ()
+        else:
+            return 404, b'', ()
+        return 405, b'', ()
+
+    # ------------------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------------------
+    def ingest(self, body):
+        if len(self._rows) >= self.max_pending:
+            self.stats['rejected'] += 1
+            return 503, b'', ('Retry-After: 1',)  # Disk can't keep up; the node keeps the batch
+        try:
+            batch = json.loads(body)
+            node = str(batch['node'])
+            events = batch['events']
+            rows = []
+            for e in events:
+                box = e.get('box') or (None, None, None, None)
+                if len(box) != 4:
+                    raise ValueError('box needs 4 values')
+                rows.append([f"{node}:{e['id']}", node, str(e['camera']), float(e['ts']), int(e['track']),
+                             float(e['conf']), *box, 0, 1 if e.get('thumb') else 0])
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, _json({'error': str(e)}), ()
+
+        now = time.monotonic()
+        for row, event in zip(rows, events):
+            incident, new = self.tracker.assign(row[2], row[3], row[4])
+            row[10] = incident
+            if not new:
+                continue
+            self.stats['incidents'] += 1
+            item = {'incident': incident, 'camera': row[2], 'track': row[4], 'confidence': row[5], 'jpeg': None}
+            if row[11]:
+                self._wanted.setdefault(node, []).append(event['id'])
+                self._awaiting[row[0]] = (now + self.thumbnail_wait, item)
+            else:
+                self.notifier.queue.put_nowait(item)
+
+        self._rows.extend(rows)
+        self.stats['received'] += len(rows)
+        self.stats['batches'] += 1
+        return 200, _json({'accepted': len(rows), 'want_thumbnails': self._wanted.pop(node, [])}), ()
+
+    def receive_thumbnail(self, node, event_id, body):
+        if len(body) > MAX_THUMBNAIL:
+            return 413, b'', ()
+        key = f"{node}:{event_id}"
+        self._thumbnails.append((key, body))
+        self.stats['thumbnails'] += 1
+        waiting = self._awaiting.pop(key, None)
+        if waiting is not None:
+            waiting[1]['jpeg'] = body
+            self.notifier.queue.put_nowait(waiting[1])
+        return 204, b'', ()
+
+    async def query(self, params):
+        since = float(params.get('since', [time.time() - 3600])[0])
+        limit = min(int(params.get('limit', [100])[0]), 1000)
+        sql = f"SELECT {', '.join(EVENT_COLUMNS)} FROM events WHERE ts >= ?"
+        args = [since]
+        if 'camera' in params:
+            sql += ' AND camera = ?'
+            args.append(params['camera'][0])
+        rows = await self.store.fetch(sql + ' ORDER BY ts DESC LIMIT ?', args + [limit])
+        return 200, _json([dict(zip(EVENT_COLUMNS, r)) for r in rows]), ()
+
+    async def _flush(self):
+        rows, self._rows = self._rows, []
+        thumbnails, self._thumbnails = self._thumbnails, []
+        if rows or thumbnails:
+            inserted = await self.store.write(rows, thumbnails)
+            self.stats['stored'] += inserted
+            self.stats['duplicates'] += len(rows) - inserted
+            self.stats['flushes'] += 1
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            now = time.monotonic()
+            for key in [k for k, (deadline, _) in self._awaiting.items() if deadline <= now]:
+                self.notifier.queue.put_nowait(self._awaiting.pop(key)[1])  # Thumbnail never came
+            await self._flush()
+
+    def snapshot_stats(self):
+        return dict(self.stats, pending=len(self._rows), active_incidents=len(self.tracker.active),
+                    notifications=self.notifier.sent, collapsed=self.notifier.collapsed,
+                    notify_backlog=self.notifier.queue.qsize())
+
+
+class AggregatorClient:
+    """Node side: post() queues an event and returns immediately; a
+    background thread sends batches over one keep-alive connection and
+    uploads the thumbnails the aggregator asks for. Standard library only."""
+
+    def __init__(self, url, node, camera, batch_size=200, flush_interval=0.5, max_queue=10000,
+                 max_thumbnails=64, token=None, timeout=5.0):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.node = node
+        self.camera = camera
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_thumbnails = max_thumbnails
+        self.timeout = timeout
+        self.headers = {TOKEN_HEADER: token} if token else {}
+
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.thumbnails_sent = 0
+        self.round_trips = deque(maxlen=5000)  # Seconds per batch request
+
+        # Event ids are "<session>-<seq>": the session (process start time) keeps ids
+        # unique across restarts, so a restarted node's events aren't taken for re-sends
+        self._session = int(time.time())
+        self._seq = itertools.count(1)
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thumbnails = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def post(self, track_id, confidence, box=None, thumbnail=None, ts=None):
+        """Queue one event (thumbnail: JPEG bytes kept until requested). Returns its id, None if dropped."""
+        event_id = f"{self._session}-{next(self._seq)}"
+        event = {'id': event_id, 'camera': self.camera, 'ts': round(time.time() if ts is None else ts, 3),
+                 'track': int(track_id), 'conf': round(float(confidence), 4)}
+        if box is not None:
+            event['box'] = [round(float(v), 4) for v in box]
+        if thumbnail is not None:
+            event['thumb'] = True
+            with self._lock:
+                self._thumbnails[event_id] = thumbnail
+                while len(self._thumbnails) > self.max_thumbnails:
+                    self._thumbnails.popitem(last=False)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return event_id
+
+    def _request(self, method, path, body, content_type):
+        for attempt in range(2):  # A keep-alive connection may have been closed by the server
+            if self._conn is None:
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self._conn.request(method, path, body=body, headers=dict(self.headers, **{'Content-Type': content_type}))
+                response = self._conn.getresponse()
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException):
+                self._conn.close()
+                self._conn = None
+                if attempt:
+                    raise
+
+    def _send(self, batch):
+        body = json.dumps({'node': self.node, 'events': batch}, separators=(',', ':')).encode()
+        start = time.perf_counter()
+        status, data = self._request('POST', '/events', body, 'application/json')
+        if status == 503:
+            return False
+        self.round_trips.append(time.perf_counter() - start)
+        if status != 200:
+            self.errors += 1
+            print(f"⚠ Aggregator rejected a batch of {len(batch)} events: HTTP {status}")
+            return True  # Retrying a malformed batch won't help
+        self.sent += len(batch)
+
+        for event_id in json.loads(data).get('want_thumbnails', []):
+            with self._lock:
+                jpeg = self._thumbnails.pop(event_id, None)
+            if jpeg is not None:
+                self._request('PUT', f"/thumbnails/{quote(self.node, safe='')}/{quote(event_id, safe='')}",
+                              jpeg, 'image/jpeg')
+                self.thumbnails_sent += 1
+        return True
+
+    def _run(self):
+        batch = []
+        failures = 0
+        while not (self._stop.is_set() and not batch and self._queue.empty()):
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if not batch:
+                continue
+            try:
+                ok = self._send(batch)
+            except (OSError, http.client.HTTPException, ValueError):
+                self.errors += 1
+                ok = False
+            if ok:
+                batch = []
+                failures = 0
+            else:
+                failures += 1
+                self._stop.wait(min(10.0, 0.25 * 2 ** min(failures, 6)))  # Aggregator down or busy: keep the batch
+
+    def close(self, timeout=5.0):
+        """Flush what is queued (up to timeout) and stop"""
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._conn is not None:
+            self._conn.close()
+
+    def stats(self):
+        return {'aggregator_sent': self.sent, 'aggregator_queue': self._queue.qsize(),
+                'aggregator_dropped': self.dropped, 'aggregator_errors': self.errors}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def simulate(nodes=8, rate=4000, seconds=10, window=1.0, db_path=None):
+    """Local load test: one aggregator and `nodes` simulated Pi5s on localhost.
+    Cameras form a ring (each neighbours the next); every node sees short
+    visits at random intervals and posts the first event of a visit with a
+    thumbnail, like a real alert."""
+    db_path = db_path or f"aggregator_sim_{int(time.time())}.db"
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    adjacency = {f"cam{i}": [f"cam{(i + 1) % nodes}"] for i in range(nodes)}
+    aggregator = Aggregator(db_path, window=window, adjacency=adjacency, notify_interval=0.2)
+    asyncio.run_coroutine_threadsafe(aggregator.start('127.0.0.1', 0), loop).result()
+    url = f"http://127.0.0.1:{aggregator.port}"
+    print(f"✓ Aggregator on {url}, database {db_path}")
+    print(f"  {nodes} nodes x {rate / nodes:.0f} events/s for {seconds} s")
+
+    clients = [AggregatorClient(url, node=f"sim-{i}", camera=f"cam{i}", max_queue=100000) for i in range(nodes)]
+    thumbnail = os.urandom(30 * 1024)
+    visit, gap = 0.5, (1.0, 5.0)  # Seconds a person is in view / between visits
+    burst_rate = rate / nodes * (visit + sum(gap) / 2) / visit
+
+    def node_loop(client, seed):
+        rng = random.Random(seed)
+        now = time.monotonic()
+        end = now + seconds
+        visit_start, visit_end, track = now + rng.uniform(*gap), 0.0, 0
+        while now < end:
+            if now >= visit_start:
+                track += 1
+                visit_end = visit_start + visit
+                visit_start = visit_end + rng.uniform(*gap)
+                client.post(track, rng.uniform(0.7, 0.99), (0.4, 0.3, 0.5, 0.45), thumbnail=thumbnail)
+                posted = 1
+            if now < visit_end:
+                due = int((now - (visit_end - visit)) * burst_rate)
+                for _ in range(due - posted):
+                    client.post(track, rng.uniform(0.7, 0.99), (0.4, 0.3, 0.5, 0.45))
+                posted = max(posted, due)
+            time.sleep(0.005)
+            now = time.monotonic()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=node_loop, args=(c, i)) for i, c in enumerate(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    sending = time.perf_counter() - start
+    closers = [threading.Thread(target=c.close, kwargs={'timeout': 30}) for c in clients]
+    for t in closers:
+        t.start()
+    for t in closers:
+        t.join()
+    posted = sum(c.sent + c._queue.qsize() for c in clients)
+    while aggregator.stats['stored'] + aggregator.stats['duplicates'] < aggregator.stats['received'] or aggregator.stats['received'] < posted:
+        if time.perf_counter() - start > seconds + 60:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    stats = aggregator.snapshot_stats()
+    asyncio.run_coroutine_threadsafe(aggregator.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+
+    with sqlite3.connect(db_path) as db:
+        rows = db.execute('SELECT COUNT(*), COUNT(DISTINCT incident) FROM events').fetchone()
+    round_trips = [rt for c in clients for rt in c.round_trips]
+
+    print(f"\n{'='*60}")
+    print("Load Test Results:")
+    print(f"{'='*60}")
+    print(f"  Events posted: {sum(c.sent for c in clients)} (dropped {sum(c.dropped for c in clients)}, "
+          f"errors {sum(c.errors for c in clients)})")
+    print(f"  Events stored: {rows[0]} in {elapsed:.1f} s ({rows[0] / elapsed:.0f} events/s; "
+          f"offered {sum(c.sent for c in clients) / sending:.0f} events/s)")
+    print(f"  Batches: {stats['batches']} requests, {stats['flushes']} SQLite transactions")
+    print(f"  Incidents: {rows[1]} (dedup {rows[0] / max(rows[1], 1):.1f} events/incident)")
+    print(f"  Thumbnails fetched: {stats['thumbnails']}")
+    print(f"  Notifications: {stats['notifications']} sent, {stats['collapsed']} collapsed, "
+          f"{stats['notify_backlog']} queued")
+    print(f"  Batch round trip: p50 {_percentile(round_trips, 0.5) * 1000:.1f} ms, "
+          f"p99 {_percentile(round_trips, 0.99) * 1000:.1f} ms")
+    print(f"  Connections: {stats['connections']} (keep-alive)")
+    print(f"{'='*60}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate detection events from several Pi5 nodes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db', default='aggregator.db')
+    parser.add_argument('--cameras', default='cameras.json', help='Camera adjacency for cross-camera dedup')
+    parser.add_argument('--window', type=float, default=5.0, help='Seconds within which sightings are one incident')
+    parser.add_argument('--max-incident', type=float, default=60.0, help='Longest an incident stays open (seconds)')
+    parser.add_argument('--webhook', default=os.environ.get('DISCORD_WEBHOOK_URL'),
+                        help='Discord webhook (default: $DISCORD_WEBHOOK_URL; none = print only)')
+    parser.add_argument('--token', default=os.environ.get('AGGREGATOR_TOKEN'), help='Shared secret nodes must send')
+    parser.add_argument('--notify-interval', type=float, default=2.0, help='Minimum seconds between notifications')
+    parser.add_argument('--simulate', action='store_true', help='Run a local load test with simulated nodes')
+    parser.add_argument('--nodes', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=4000, help='Total events/s across simulated nodes')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    if args.simulate:
+        simulate(args.nodes, args.rate, args.seconds)
+        return
+
+    async def serve():
+        aggregator = Aggregator(args.db, args.window, load_adjacency(args.cameras), args.webhook, args.token,
+                                notify_interval=args.notify_interval, max_incident=args.max_incident)
+        await aggregator.start(args.host, args.port)
+        print(f"✓ Aggregator listening on {args.host}:{aggregator.port} (database {args.db})")
+        if aggregator.tracker.adjacency is not None:
+            print(f"🗺 Camera adjacency for {len(aggregator.tracker.adjacency)} cameras from {args.cameras}")
+        if not args.webhook:
+            print("⚠ No webhook configured, notifications are only printed")
+        try:
+            while True:
+                await asyncio.sleep(60)
+                s = aggregator.snapshot_stats()
+                print(f"📊 {s['received']} events, {s['incidents']} incidents, {s['notifications']} notifications, "
+                      f"{s['pending']} pending")
+        finally:
+            await aggregator.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\nStopped")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+Alert payload helpers
+Builds the Discord alert (resized JPEG + message) in memory so it can be
+used by step4 and benchmarked off-device.
+"""
+
+import cv2
+
+ALERT_WIDTH = 1080
+JPEG_QUALITY = 90
+
+
+def encode_alert_image(frame, width=ALERT_WIDTH, quality=JPEG_QUALITY):
+    """RGB frame -> JPEG bytes resized to the alert width"""
+    h, w = frame.shape[:2]
+    scale = width / w
+    small_frame = cv2.resize(frame, (width, int(h * scale)))
+    small_frame_bgr = cv2.cvtColor(small_frame, cv2.COLOR_RGB2BGR)
+    ok, jpeg = cv2.imencode('.jpg', small_frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return jpeg.tobytes()
+
+
+def build_alert_payload(image, obj_id, confidence):
+    """(data, files) ready for requests.post.
+    image is an RGB frame, JPEG bytes that are sent as they are, or None
+    for a text-only alert."""
+    payload = {"content": f"👂 **New Ear Detected**\nObject ID: {obj_id}\nConfidence: {confidence*100:.1f}%"}
+    if image is None:
+        return payload, None
+    jpeg = image if isinstance(image, bytes) else encode_alert_image(image)
+    files = {"file": ("ear.jpg", jpeg, "image/jpeg")}
+    return payload, files
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the critical path
+Times each hot function on this machine, compares against a stored JSON
+baseline for the same machine fingerprint and exits non-zero when any
+case is slower than the baseline by more than the tolerance.
+Runs offline on plain x86 Linux (no Hailo device, no network needed).
+
+Usage:
+    python benchmark.py                  # run and compare with baseline
+    python benchmark.py --update         # run and store as new baseline
+    python benchmark.py --filter onnx    # only cases containing "onnx"
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from alerts import build_alert_payload
+from detection_log import DetectionLog
+from detections import DetectionExtractor, LabelTable, make_fake_roi, FAKE_DETECTION, FAKE_UNIQUE_ID
+from hard_example_miner import HardExampleMiner
+from inference_utils import preprocess, postprocess
+from tracker import ByteTracker
+from verify_worker import is_skin_color
+
+BASELINE_DIR = 'benchmarks'
+IMAGES_GLOB = 'test/images/*.jpg'
+ONNX_GLOB = 'models/onnx/*.onnx'
+TOLERANCE = 0.15  # Allowed slowdown before a case counts as a regression
+FRAME_SIZE = (1280, 720)
+DETECTIONS_PER_FRAME = 10
+
+CASES = []
+
+
+def case(name):
+    """Register a setup function returning the callable to time"""
+    def register(fn):
+        CASES.append((name, fn))
+        return fn
+    return register
+
+
+# ----------------------------------------------------------------------
+# Machine fingerprint
+# ----------------------------------------------------------------------
+def _cpu_model():
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name') or line.startswith('Model'):
+                    return line.split(':', 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or 'unknown'
+
+
+def machine_fingerprint():
+    """(short id, details) for the hardware and library versions that affect timings"""
+    try:
+        import onnxruntime as ort
+        ort_version = ort.__version__
+    except ImportError:
+        ort_version = None
+    details = {
+        'machine': platform.machine(),
+        'cpu': _cpu_model(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'onnxruntime': ort_version,
+    }
+    digest = hashlib.sha1(json.dumps(details, sort_keys=True).encode()).hexdigest()[:10]
+    return f"{details['machine']}-{digest}", details
+
+
+# ----------------------------------------------------------------------
+# Test data
+# ----------------------------------------------------------------------
+def _sample_images(count=8):
+    paths = sorted(glob.glob(IMAGES_GLOB))[:count]
+    if not paths:
+        raise FileNotFoundError(f"No images match {IMAGES_GLOB}")
+    return paths
+
+
+def _sample_frame():
+    """Camera-sized RGB frame built from a dataset image"""
+    image = cv2.imread(_sample_images(1)[0])
+    return cv2.cvtColor(cv2.resize(image, FRAME_SIZE), cv2.COLOR_BGR2RGB)
+
+
+def _sample_detections(n=DETECTIONS_PER_FRAME, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0.0, 0.8, (n, 2)).astype(np.float32)
+    wh = rng.uniform(0.05, 0.2, (n, 2)).astype(np.float32)
+    return np.concatenate([xy, xy + wh], axis=1), rng.uniform(0.2, 0.95, n).astype(np.float32)
+
+
+def _synthetic_output(num_classes=1, anchors=8400, candidates=200, seed=0):
+    """YOLOv8-shaped raw output with a few hundred boxes above threshold"""
+    rng = np.random.default_rng(seed)
+    out = np.zeros((1, 4 + num_classes, anchors), dtype=np.float32)
+    out[0, :2] = rng.uniform(0, 640, (2, anchors))
+    out[0, 2:4] = rng.uniform(10, 120, (2, anchors))
+    out[0, 4:] = rng.uniform(0, 0.2, (num_classes, anchors))
+    hot = rng.choice(anchors, candidates, replace=False)
+    out[0, 4, hot] = rng.uniform(0.3, 0.95, candidates)
+    return out
+
+
+# ----------------------------------------------------------------------
+# Cases
+# ----------------------------------------------------------------------
+@case('decode_jpeg')
+def bench_decode():
+    blobs = [open(p, 'rb').read() for p in _sample_images()]
+    arrays = [np.frombuffer(b, dtype=np.uint8) for b in blobs]
+    state = {'i': 0}
+
+    def run():
+        state['i'] = (state['i'] + 1) % len(arrays)
+        cv2.imdecode(arrays[state['i']], cv2.IMREAD_COLOR)
+    return run
+
+
+@case('preprocess_640')
+def bench_preprocess():
+    image = cv2.cvtColor(_sample_frame(), cv2.COLOR_RGB2BGR)
+    return lambda: preprocess(image, 640)
+
+
+@case('postprocess_nms')
+def bench_postprocess():
+    output = _synthetic_output()
+    return lambda: postprocess(output, scale=0.5, pad=(0, 140))
+
+
+@case('skin_check')
+def bench_skin_check():
+    frame = _sample_frame()
+    crop = frame[200:360, 500:620].copy()
+    return lambda: is_skin_color(crop)
+
+
+@case('alert_payload')
+def bench_alert_payload():
+    frame = _sample_frame()
+    try:
+        import requests
+    except ImportError:
+        requests = None
+
+    def run():
+        payload, files = build_alert_payload(frame, 42, 0.87)
+        if requests is not None:
+            # Multipart body as requests.post would build it, without sending
+            requests.Request('POST', 'http://localhost/', data=payload, files=files).prepare()
+    return run
+
+
+@case('callback_per_frame')
+def bench_callback(tmp_dir='/tmp/ear_benchmark'):
+    """Host-side work the streaming callback does for one frame of
+    detections: tracking, log appends, mining pre-check and one crop"""
+    boxes, scores = _sample_detections()
+    frame = _sample_frame()
+    height, width = frame.shape[:2]
+    tracker = ByteTracker()
+    log = DetectionLog(os.path.join(tmp_dir, 'detections'), flush_interval=3600)
+    miner = HardExampleMiner(os.path.join(tmp_dir, 'hard_examples'), max_rate=0.0)
+    rng = np.random.default_rng(1)
+
+    def run():
+        jitter = rng.normal(0, 0.002, boxes.shape).astype(np.float32)
+        ids = tracker.update(boxes + jitter, scores)
+        now = time.time()
+        for (x1, y1, x2, y2), conf, obj_id in zip(boxes.tolist(), scores.tolist(), ids.tolist()):
+            log.append(now, obj_id, x1, y1, x2, y2, conf)
+            miner.is_candidate(conf, obj_id)
+        x1, y1, x2, y2 = boxes[0]
+        frame[int(y1 * height):int(y2 * height), int(x1 * width):int(x2 * width)]
+        if len(log._batch) > 100_000:
+            log._batch = []  # Keep memory flat without timing the flusher
+    return run
+
+
+@case('extract_detections')
+def bench_extract():
+    """Pulling one buffer's detections into arrays (fake Hailo ROI)"""
+    roi = make_fake_roi(DETECTIONS_PER_FRAME * 2)
+    extractor = DetectionExtractor(LabelTable('ear', ['ear']), FAKE_UNIQUE_ID)
+    return lambda: extractor.extract(roi.get_objects_typed(FAKE_DETECTION))
+
+
+def _onnx_cases():
+    """One inference case per exported model variant"""
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return []
+
+    cases = []
+    for path in sorted(glob.glob(ONNX_GLOB)):
+        def setup(path=path):
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = os.cpu_count() or 1
+            session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+            inp = session.get_inputs()[0]
+            shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+            data = np.random.default_rng(0).random(shape).astype(np.float32)
+            if inp.type == 'tensor(uint8)':  # Folded-normalization export (*_uint8.onnx)
+                data = (data * 255).astype(np.uint8)
+            return lambda: session.run(None, {inp.name: data})
+        cases.append((f"onnx_{os.path.splitext(os.path.basename(path))[0]}", setup))
+    return cases
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+def measure(fn, min_time=0.5, repeats=7, warmup=3):
+    """Best seconds per call over several timed repeats.
+    The minimum is the least noisy estimate on a shared machine;
+    slower repeats measure interference, not the code."""
+    for _ in range(warmup):
+        fn()
+    # Calibrate the inner loop so each repeat lasts about min_time / repeats
+    start = time.perf_counter()
+    fn()
+    single = max(time.perf_counter() - start, 1e-7)
+    loops = max(1, int(min_time / repeats / single))
+
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        samples.append((time.perf_counter() - start) / loops)
+    return min(samples), loops
+
+
+def run_cases(name_filter=None, min_time=0.5, names=None):
+    results = {}
+    for name, setup in CASES + _onnx_cases():
+        if name_filter and name_filter not in name:
+            continue
+        if names is not None and name not in names:
+            continue
+        try:
+            fn = setup()
+        except Exception as e:
+            print(f"  ⚠ {name:<28} skipped: {e}")
+            continue
+        seconds, loops = measure(fn, min_time=min_time)
+        results[name] = {'seconds': seconds, 'ops_per_sec': 1.0 / seconds}
+        print(f"  {name:<30} {seconds * 1000:9.3f} ms  {1.0 / seconds:10.1f} /s  ({loops} loops)")
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """List of (name, current, baseline, slowdown) that exceed the tolerance"""
+    regressions = []
+    print(f"\n  {'case':<30} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"  {name:<30} {'-':>10} {current['seconds'] * 1000:8.3f}ms {'new':>8}")
+            continue
+        slowdown = current['seconds'] / previous['seconds'] - 1.0
+        flag = ' ❌' if slowdown > tolerance else ''
+        print(f"  {name:<30} {previous['seconds'] * 1000:8.3f}ms {current['seconds'] * 1000:8.3f}ms "
+              f"{slowdown * 100:+7.1f}%{flag}")
+        if slowdown > tolerance:
+            regressions.append((name, current['seconds'], previous['seconds'], slowdown))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks with per-machine baselines')
+    parser.add_argument('--update', action='store_true', help='Store results as the baseline')
+    parser.add_argument('--filter', default=None, help='Only run cases containing this string')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Allowed slowdown fraction (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds spent timing each case')
+    parser.add_argument('--baseline-dir', default=BASELINE_DIR)
+    args = parser.parse_args()
+
+    fingerprint, details = machine_fingerprint()
+    baseline_path = os.path.join(args.baseline_dir, f'{fingerprint}.json')
+
+    print("="*60)
+    print("Critical Path Benchmarks")
+    print("="*60)
+    print(f"  Machine: {fingerprint} ({details['cpu']}, {details['cpu_count']} CPUs)\n")
+
+    cv2.setNumThreads(1)  # Matches the single streaming thread; less noisy
+    results = run_cases(args.filter, args.min_time)
+    if not results:
+        print("❌ No benchmark cases ran")
+        sys.exit(1)
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f).get('results', {})
+
+    if args.update or not baseline:
+        merged = dict(baseline, **results)  # A filtered run only replaces its own cases
+        os.makedirs(args.baseline_dir, exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump({'machine': details, 'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'results': merged}, f, indent=2)
+        print(f"\n✅ Baseline saved: {baseline_path}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        # Re-time flagged cases once, longer, so a burst of background load
+        # on the machine doesn't fail the run on its own
+        print(f"\n  Re-checking {len(regressions)} case(s)...")
+        retry = run_cases(min_time=args.min_time * 2, names={r[0] for r in regressions})
+        for name, result in retry.items():
+            if result['seconds'] < results[name]['seconds']:
+                results[name] = result
+        regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n❌ {len(regressions)} case(s) slower than baseline by more than {args.tolerance * 100:.0f}%")
+        sys.exit(1)
+    print(f"\n✅ No regressions beyond {args.tolerance * 100:.0f}%")
+
+if __name__ == '__main__':
+    main()
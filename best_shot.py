@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Best-shot selection per track
+Instead of alerting on the first frame a track crosses the threshold, each
+track keeps a single JPEG crop over a short window: the frame with the
+highest confidence x sharpness x size. The shot is released when the
+window closes or the track disappears, whichever comes first.
+"""
+
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from crop_classifier import context_box
+
+# jpeg: encoded crop with context; box: (x1, y1, x2, y2) of the detection inside it;
+# bbox: the normalized detection box in the frame
+Shot = namedtuple('Shot', 'track_id jpeg box confidence score bbox')
+
+
+def sharpness(crop, size=64):
+    """Variance of the Laplacian on a fixed-size grayscale thumbnail,
+    so crops of different sizes are scored on the same scale"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    h, w = gray.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+class BestShotSelector:
+    """One candidate crop per active track.
+
+    offer() scores the detection on a downsampled crop and only encodes a
+    JPEG when the score beats the stored one, so most frames cost a small
+    resize and a Laplacian. collect() returns the finished shots.
+    """
+
+    def __init__(self, window=1.5, end_after=0.5, context=0.5, max_side=320, jpeg_quality=85):
+        self.window = window          # Seconds from the first qualifying frame
+        self.end_after = end_after    # Seconds without a sighting = track ended
+        self.context = context        # Margin around the box, as a fraction of its size
+        self.max_side = max_side
+        self.jpeg_quality = jpeg_quality
+        self._tracks = {}  # track_id -> [started, last_seen, Shot]
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def __contains__(self, track_id):
+        return track_id in self._tracks
+
+    def _cut(self, frame, bbox_norm):
+        """Crop with context (downscaled to max_side) and the box inside it"""
+        height, width = frame.shape[:2]
+        x1, y1, x2, y2 = bbox_norm
+        mx, my = (x2 - x1) * self.context, (y2 - y1) * self.context
+        cx1, cy1 = max(0, int((x1 - mx) * width)), max(0, int((y1 - my) * height))
+        cx2, cy2 = min(width, int((x2 + mx) * width)), min(height, int((y2 + my) * height))
+        crop = frame[cy1:cy2, cx1:cx2]
+        if crop.size == 0:
+            return None, None
+        box = np.array([x1 * width - cx1, y1 * height - cy1, x2 * width - cx1, y2 * height - cy1])
+        scale = self.max_side / max(crop.shape[:2])
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+            box *= scale
+        return crop, tuple(int(v) for v in np.clip(box, 0, [crop.shape[1], crop.shape[0]] * 2))
+
+    def offer(self, track_id, frame, bbox_norm, confidence, now=None):
+        """Score this sighting; keep it if it is the best so far. Returns the score."""
+        now = time.monotonic() if now is None else now
+        state = self._tracks.get(track_id)
+        if state is None:
+            state = self._tracks[track_id] = [now, now, None]
+        state[1] = now
+
+        crop, box = self._cut(frame, bbox_norm)
+        if crop is None:
+            return 0.0
+        x1, y1, x2, y2 = box
+        inner = crop[y1:y2, x1:x2]
+        if inner.size == 0:
+            return 0.0
+        height, width = frame.shape[:2]
+        size = np.sqrt((bbox_norm[2] - bbox_norm[0]) * width * (bbox_norm[3] - bbox_norm[1]) * height)
+        score = confidence * sharpness(inner) * size
+
+        best = state[2]
+        if best is None or score > best.score:
+            ok, jpeg = cv2.imencode('.jpg', cv2.cvtColor(crop, cv2.COLOR_RGB2BGR),
+                                    [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+            if ok:
+                state[2] = Shot(track_id, jpeg.tobytes(), box, confidence, score, tuple(bbox_norm))
+        return score
+
+    def seen(self, track_id, now=None):
+        """Mark a sighting that did not qualify (keeps the track from ending)"""
+        state = self._tracks.get(track_id)
+        if state is not None:
+            state[1] = time.monotonic() if now is None else now
+
+    def collect(self, now=None):
+        """Pop and return the shots whose window closed or whose track ended"""
+        now = time.monotonic() if now is None else now
+        done = [tid for tid, (started, last_seen, _) in self._tracks.items()
+                if now - started >= self.window or now - last_seen >= self.end_after]
+        shots = []
+        for tid in done:
+            shot = self._tracks.pop(tid)[2]
+            if shot is not None:
+                shots.append(shot)
+        return shots
+
+
+def decode_shot(shot, context=0.0):
+    """(RGB crop with context, RGB detection crop grown by `context`) for verification.
+    The stored crop carries more context than any verifier margin, so nothing is lost."""
+    crop = cv2.cvtColor(cv2.imdecode(np.frombuffer(shot.jpeg, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+    x1, y1, x2, y2 = context_box(shot.box, crop.shape[1], crop.shape[0], context)
+    return crop, crop[y1:y2, x1:x2]
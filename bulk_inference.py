@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Bulk inference over image folders and video files
+Runs an exported ONNX model as a bounded three-stage pipeline:
+
+    decode threads  ->  batched inference  ->  post-process + write
+    (images / video)     (ONNX Runtime)         (JSON Lines or CSV)
+
+Every stage talks through a small bounded queue, so memory stays flat no
+matter how large the input is, and decode threads scale with the cores.
+Use the dynamic-batch export from step 2 (*_dynamic.onnx) for batch > 1;
+*_uint8.onnx exports are fed the decoded frames without any conversion.
+
+Usage:
+    python bulk_inference.py footage/ --output results.jsonl
+    python bulk_inference.py archive.mp4 --stride 5 --output results.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+import yaml
+
+from inference_utils import letterbox, postprocess
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.h264', '.ts'}
+DEFAULT_MODEL = 'models/onnx/best_dynamic.onnx'
+
+_DONE = object()
+
+
+def collect_inputs(paths):
+    """Expand folders into image and video files (sorted, recursive)"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS | VIDEO_EXTENSIONS:
+                        files.append(os.path.join(root, name))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            print(f"⚠ Input not found: {path}")
+    return sorted(files)
+
+
+# ----------------------------------------------------------------------
+# Stage 1: decode + letterbox
+# ----------------------------------------------------------------------
+def _probe_video(path):
+    """(width, height) of the frames ffmpeg will output. ffmpeg applies the
+    rotation metadata of phone videos, so 90/270 degree streams come out
+    with width and height swapped relative to the coded size."""
+    out = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_streams', '-of', 'json', path],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    stream = json.loads(out)['streams'][0]
+    width, height = int(stream['width']), int(stream['height'])
+    rotation = stream.get('tags', {}).get('rotate', 0)  # Older containers/ffmpeg
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)  # Display matrix (ffmpeg >= 5)
+    if int(float(rotation)) % 180:
+        width, height = height, width
+    return width, height
+
+
+def iter_video_frames(path, stride=1):
+    """Yield (index, BGR frame). With ffmpeg the raw frames are read into
+    one reused buffer, so the caller must consume each frame before the next."""
+    if shutil.which('ffmpeg') and shutil.which('ffprobe'):
+        width, height = _probe_video(path)
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        view = memoryview(frame).cast('B')
+        proc = subprocess.Popen(
+            ['ffmpeg', '-v', 'error', '-i', path, '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-'],
+            stdout=subprocess.PIPE, bufsize=frame.nbytes,
+        )
+        try:
+            index = 0
+            while True:
+                read = 0
+                while read < frame.nbytes:
+                    n = proc.stdout.readinto(view[read:])
+                    if not n:
+                        break
+                    read += n
+                if read < frame.nbytes:
+                    break
+                if index % stride == 0:
+                    yield index, frame
+                index += 1
+        finally:
+            proc.kill()
+            proc.wait()
+        return
+
+    # No ffmpeg: OpenCV's own decoder (grab() skips frames without decoding them)
+    cap = cv2.VideoCapture(path)
+    index = 0
+    try:
+        while cap.grab():
+            if index % stride == 0:
+                ok, frame = cap.retrieve()
+                if not ok:
+                    break
+                yield index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def _decode_worker(tasks, out_queue, imgsz, stride, errors):
+    while True:
+        path = tasks.get()
+        if path is None:
+            out_queue.put(_DONE)
+            return
+        try:
+            if os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS:
+                frames = iter_video_frames(path, stride)
+            else:
+                image = cv2.imread(path)
+                if image is None:
+                    raise ValueError("cannot decode image")
+                frames = [(None, image)]
+            for index, image in frames:
+                padded, scale, pad = letterbox(image, imgsz)
+                rgb = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB)
+                out_queue.put(((path, index), rgb, scale, pad, image.shape[:2]))
+        except Exception as e:
+            errors.append((path, str(e)))
+            print(f"⚠ Skipping {path}: {e}")
+
+
+# ----------------------------------------------------------------------
+# Stage 2: batched inference
+# ----------------------------------------------------------------------
+def _inference_worker(session, in_queue, out_queue, producers, batch_size, imgsz, failures, max_wait=0.05):
+    """Batch decoded frames through the session. On an error the remaining
+    input is drained so the decoders don't block, and _DONE is always sent."""
+    finished = 0
+    try:
+        inp = session.get_inputs()[0]
+        fixed_batch = inp.shape[0] if isinstance(inp.shape[0], int) else None
+        if fixed_batch is not None and batch_size != fixed_batch:
+            print(f"⚠ Model has a fixed batch of {fixed_batch}; use a *_dynamic.onnx export for larger batches")
+            batch_size = fixed_batch
+
+        # Models exported with FOLD_NORMALIZATION take the decoded uint8 frames as they are
+        raw_input = inp.type == 'tensor(uint8)'
+        if raw_input:
+            buffer = np.empty((batch_size, imgsz, imgsz, 3), dtype=np.uint8)
+        else:
+            buffer = np.empty((batch_size, 3, imgsz, imgsz), dtype=np.float32)
+        while finished < producers:
+            items = []
+            deadline = None
+            while len(items) < batch_size and finished < producers:
+                try:
+                    timeout = None if not items else max(0.0, deadline - time.monotonic())
+                    item = in_queue.get(timeout=timeout)
+                except queue.Empty:
+                    break  # Partial batch: don't hold results back
+                if item is _DONE:
+                    finished += 1
+                    continue
+                items.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + max_wait
+            if not items:
+                continue
+
+            n = len(items)
+            batch = buffer[:n] if fixed_batch is None else buffer
+            if raw_input:
+                np.stack([it[1] for it in items], out=batch[:n])
+            else:
+                # HWC uint8 -> CHW float32 in [0, 1], written straight into the reused buffer
+                np.multiply(np.stack([it[1] for it in items]).transpose(0, 3, 1, 2), 1.0 / 255.0,
+                            out=batch[:n], casting='unsafe')
+            output = session.run(None, {inp.name: batch})[0]
+            out_queue.put((items, output[:n]))
+    except Exception as e:
+        failures.append(e)
+        while finished < producers:
+            if in_queue.get() is _DONE:
+                finished += 1
+    finally:
+        out_queue.put(_DONE)
+
+
+# ----------------------------------------------------------------------
+# Stage 3: post-process + write
+# ----------------------------------------------------------------------
+class ResultWriter:
+    """JSON Lines (one record per image/frame) or CSV (one row per detection)"""
+
+    CSV_FIELDS = ['source', 'frame', 'label', 'class_id', 'confidence', 'x1', 'y1', 'x2', 'y2']
+
+    def __init__(self, path, names):
+        self.names = names
+        self.csv = path.lower().endswith('.csv')
+        self.file = open(path, 'w', newline='')
+        if self.csv:
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.CSV_FIELDS)
+
+    def write(self, source, frame, boxes, scores, class_ids):
+        labels = [self.names[c] if c < len(self.names) else str(c) for c in class_ids.tolist()]
+        if self.csv:
+            for (x1, y1, x2, y2), conf, cid, label in zip(boxes.tolist(), scores.tolist(), class_ids.tolist(), labels):
+                self.writer.writerow([source, '' if frame is None else frame, label, cid, f"{conf:.4f}",
+                                      f"{x1:.1f}", f"{y1:.1f}", f"{x2:.1f}", f"{y2:.1f}"])
+            return
+        record = {'source': source, 'detections': [
+            {'label': label, 'class_id': cid, 'confidence': round(conf, 4), 'box': [round(v, 1) for v in box]}
+            for box, conf, cid, label in zip(boxes.tolist(), scores.tolist(), class_ids.tolist(), labels)
+        ]}
+        if frame is not None:
+            record['frame'] = frame
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+def _write_worker(in_queue, writer, conf, iou, stats, failures):
+    """Post-process and write until _DONE. After an error (e.g. a full disk)
+    the rest is drained unwritten so the inference stage never blocks."""
+    failed = False
+    while True:
+        item = in_queue.get()
+        if item is _DONE:
+            return
+        if failed:
+            continue
+        items, output = item
+        try:
+            for (key, _, scale, pad, (h, w)), pred in zip(items, output):
+                boxes, scores, class_ids = postprocess(pred, scale, pad, conf, iou)
+                np.clip(boxes, 0, [w, h, w, h], out=boxes)
+                writer.write(key[0], key[1], boxes, scores, class_ids)
+                stats['frames'] += 1
+                stats['detections'] += len(scores)
+        except Exception as e:
+            failures.append(e)
+            failed = True
+
+
+def run(inputs, model_path, output_path, batch_size=8, workers=None, imgsz=640, conf=0.25, iou=0.45,
+        stride=1, names=('ear',), threads=None, queue_size=None):
+    """Run the pipeline; returns stats {'frames', 'detections', 'seconds', 'errors'}"""
+    files = collect_inputs(inputs)
+    if not files:
+        raise FileNotFoundError("No images or videos found")
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    queue_size = queue_size or batch_size * 2
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads or os.cpu_count() or 1
+    session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+
+    tasks = queue.Queue()
+    for path in files:
+        tasks.put(path)
+    for _ in range(workers):
+        tasks.put(None)
+
+    decoded = queue.Queue(maxsize=queue_size)
+    inferred = queue.Queue(maxsize=2)
+    errors = []
+    failures = []  # Exceptions from the inference and write stages
+    stats = {'frames': 0, 'detections': 0}
+    writer = ResultWriter(output_path, list(names))
+
+    start = time.perf_counter()
+    stages = [threading.Thread(target=_decode_worker, args=(tasks, decoded, imgsz, stride, errors), daemon=True)
+                for _ in range(workers)]
+    stages.append(threading.Thread(target=_inference_worker,
+                                     args=(session, decoded, inferred, workers, batch_size, imgsz, failures), daemon=True))
+    stages.append(threading.Thread(target=_write_worker, args=(inferred, writer, conf, iou, stats, failures), daemon=True))
+    for t in stages:
+        t.start()
+    for t in stages:
+        t.join()
+    writer.close()
+    if failures:
+        raise failures[0]
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['errors'] = errors
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the ear model over folders and videos')
+    parser.add_argument('inputs', nargs='+', help='Image/video files or folders')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='ONNX model (default: %(default)s)')
+    parser.add_argument('--output', default='detections.jsonl', help='.jsonl or .csv')
+    parser.add_argument('--batch', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None, help='Decode threads (default: half the cores)')
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime threads (default: all cores)')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--iou', type=float, default=0.45)
+    parser.add_argument('--stride', type=int, default=1, help='Only process every Nth video frame')
+    parser.add_argument('--data', default='data.yaml', help='Dataset yaml for class names')
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Bulk Inference")
+    print("="*60)
+
+    if not os.path.exists(args.model):
+        print(f"\n❌ Model not found: {args.model}")
+        print("Run step2_file_pt_to_file_onnx.py to export the dynamic-batch model")
+        return
+
+    names = ['ear']
+    if os.path.exists(args.data):
+        with open(args.data) as f:
+            names = yaml.safe_load(f).get('names', names)
+
+    print(f"  Model: {args.model}")
+    print(f"  Output: {args.output}")
+    print(f"  Batch: {args.batch}, decode workers: {args.workers or max(1, (os.cpu_count() or 1) // 2)}")
+
+    try:
+        stats = run(args.inputs, args.model, args.output, batch_size=args.batch, workers=args.workers,
+                    imgsz=args.imgsz, conf=args.conf, iou=args.iou, stride=args.stride, names=names,
+                    threads=args.threads)
+    except Exception as e:
+        print(f"\n❌ Inference failed: {e}")
+        print(f"Partial results are in: {args.output}")
+        return
+
+    fps = stats['frames'] / stats['seconds'] if stats['seconds'] else 0.0
+    print(f"\n✓ {stats['frames']:,} frames, {stats['detections']:,} detections "
+          f"in {stats['seconds']:.1f} s ({fps:.1f} frames/s)")
+    if stats['errors']:
+        print(f"⚠ {len(stats['errors'])} inputs failed to decode")
+    print(f"✓ Results saved to: {args.output}")
+
+if __name__ == '__main__':
+    main()
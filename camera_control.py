@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Camera control manager
+Applies sensor controls with a single v4l2-ctl call as soon as the
+GStreamer pipeline reaches PLAYING (and again on every restart), and can
+optionally run a slow closed-loop exposure/gain adjustment driven by the
+mean luma of a subsampled frame.
+"""
+
+import queue
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+class CameraController:
+    """Owns the sensor controls of one V4L2 (sub)device.
+
+    All v4l2-ctl invocations happen on a private thread, so neither the
+    GStreamer bus handler nor the streaming callback ever waits on a
+    subprocess. Point v4l2_ctl at a fake script to test without a camera.
+    """
+
+    def __init__(self, device='/dev/v4l-subdev0', controls=None, v4l2_ctl='v4l2-ctl',
+                 auto_exposure=False, target_luma=110.0, deadband=0.1,
+                 exposure_range=(100, 10000), gain_range=(100, 800),
+                 update_interval=1.0, max_step=0.25):
+        self.device = device
+        self.v4l2_ctl = v4l2_ctl
+        # Manual exposure mode first, then the values it should hold
+        self.controls = dict(controls or {'auto_exposure': 1, 'exposure': 2000, 'analogue_gain': 150})
+
+        self.auto_exposure = auto_exposure
+        self.target_luma = target_luma
+        self.deadband = deadband
+        self.exposure_range = exposure_range
+        self.gain_range = gain_range
+        self.update_interval = update_interval
+        self.max_step = max_step
+
+        self._last_sample = 0.0
+        self._last_update = 0.0
+        self._playing = False
+        self.last_luma = None
+        self.applied = {}
+        self.apply_count = 0
+
+        self._jobs = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # v4l2-ctl
+    # ------------------------------------------------------------------
+    def _run(self):
+        while True:
+            controls = self._jobs.get()
+            if controls is None:
+                break
+            self._set_controls(controls)
+
+    def _set_controls(self, controls):
+        spec = ','.join(f'{k}={int(v)}' for k, v in controls.items())
+        try:
+            result = subprocess.run(
+                [self.v4l2_ctl, '-d', self.device, '--set-ctrl', spec],
+                capture_output=True, text=True, timeout=5, check=False,
+            )
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"❌ Camera control error: {e}")
+            return False
+        if result.returncode != 0:
+            print(f"❌ v4l2-ctl failed ({spec}): {result.stderr.strip()}")
+            return False
+        self.applied.update(controls)
+        self.apply_count += 1
+        print(f"📷 Camera controls set: {spec}")
+        return True
+
+    def apply(self, controls=None):
+        """Queue one batched v4l2-ctl call (defaults to the full control set)"""
+        self._jobs.put(dict(controls or self.controls))
+
+    # ------------------------------------------------------------------
+    # Pipeline integration
+    # ------------------------------------------------------------------
+    def attach(self, pipeline):
+        """Apply controls whenever the pipeline enters PLAYING"""
+        from gi.repository import Gst
+
+        def on_state_changed(bus, message):
+            if message.src is not pipeline:
+                return
+            _, new, _ = message.parse_state_changed()
+            playing = new == Gst.State.PLAYING
+            if playing and not self._playing:
+                self.apply()
+            self._playing = playing
+
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect('message::state-changed', on_state_changed)
+
+    # ------------------------------------------------------------------
+    # Closed-loop exposure
+    # ------------------------------------------------------------------
+    def wants_sample(self, now=None):
+        """Cheap rate check so the callback only maps a frame when needed"""
+        if not self.auto_exposure:
+            return False
+        now = time.monotonic() if now is None else now
+        return now - self._last_sample >= self.update_interval / 4
+
+    def observe(self, frame, now=None):
+        """Feed an RGB frame; may queue an exposure/gain update"""
+        now = time.monotonic() if now is None else now
+        self._last_sample = now
+        sub = frame[::16, ::16, :3].astype(np.float32)
+        luma = float((sub @ LUMA_WEIGHTS).mean())
+        # Smooth so a single bright/dark frame doesn't swing the loop
+        self.last_luma = luma if self.last_luma is None else 0.7 * self.last_luma + 0.3 * luma
+
+        if not self._playing or now - self._last_update < self.update_interval:
+            return None
+        update = self.compute_update(self.last_luma)
+        if update:
+            self._last_update = now
+            self.controls.update(update)
+            self.apply(update)
+        return update
+
+    def compute_update(self, luma):
+        """Bounded proportional step towards the target luma.
+        Brightening raises exposure before gain; darkening lowers gain first
+        (less noise, and exposure time limits motion blur)."""
+        if luma <= 0:
+            luma = 1.0
+        error = self.target_luma / luma
+        if abs(error - 1.0) <= self.deadband:
+            return {}
+
+        ratio = float(np.clip(error, 1.0 - self.max_step, 1.0 + self.max_step))
+        exposure = self.controls.get('exposure', self.exposure_range[0])
+        gain = self.controls.get('analogue_gain', self.gain_range[0])
+
+        if ratio > 1.0:
+            new_exposure = float(np.clip(exposure * ratio, *self.exposure_range))
+            remaining = ratio * exposure / new_exposure  # What exposure could not cover
+            new_gain = float(np.clip(gain * remaining, *self.gain_range))
+        else:
+            new_gain = float(np.clip(gain * ratio, *self.gain_range))
+            remaining = ratio * gain / new_gain
+            new_exposure = float(np.clip(exposure * remaining, *self.exposure_range))
+
+        update = {}
+        if int(new_exposure) != int(exposure):
+            update['exposure'] = int(new_exposure)
+        if int(new_gain) != int(gain):
+            update['analogue_gain'] = int(new_gain)
+        return update
+
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join(timeout=2)
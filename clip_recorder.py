@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Pre-roll evidence clip recorder
+Keeps the last few seconds of frames as JPEGs in a byte-capped ring buffer
+and writes pre-roll + post-roll clips on alert, entirely off the
+GStreamer streaming thread.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class ClipRecorder:
+    """Bounded, compressed ring buffer of recent frames.
+
+    push() is the only call made from the streaming thread: it rate-limits,
+    downsizes and enqueues without blocking. A background encoder thread
+    JPEG-encodes frames into the ring, and a writer thread turns flushed
+    segments into clip files.
+    """
+
+    def __init__(self, output_dir='clips', pre_seconds=5.0, post_seconds=5.0,
+                 fps=10, width=640, jpeg_quality=75, max_bytes=48 * 1024 * 1024,
+                 max_pending_clips=4):
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.fps = fps
+        self.width = width
+        self.jpeg_quality = jpeg_quality
+        self.max_bytes = max_bytes
+
+        self._min_interval = 1.0 / fps
+        self._last_push = 0.0
+        self._incoming = queue.Queue(maxsize=4)  # raw frames awaiting encode
+        self._clips = queue.Queue(maxsize=max_pending_clips)
+
+        self._ring = deque()  # (timestamp, jpeg_bytes)
+        self._ring_bytes = 0
+        self._events = []  # [name, trigger_time]
+        self._events_lock = threading.Lock()
+
+        self.dropped_frames = 0
+        self.dropped_clips = 0
+        self.clips_written = 0
+
+        self._stop = threading.Event()
+        self._encoder = threading.Thread(target=self._encode_loop, daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._encoder.start()
+        self._writer.start()
+
+    # ------------------------------------------------------------------
+    # Streaming-thread API
+    # ------------------------------------------------------------------
+    def wants_frame(self, now=None):
+        """Cheap check so the caller can skip mapping the buffer entirely"""
+        now = time.monotonic() if now is None else now
+        return now - self._last_push >= self._min_interval
+
+    def push(self, frame, now=None):
+        """Offer an RGB frame. Never blocks; drops when the encoder lags."""
+        now = time.monotonic() if now is None else now
+        if not self.wants_frame(now):
+            return False
+        self._last_push = now
+
+        h, w = frame.shape[:2]
+        if w > self.width:
+            # Resizing also gives us our own copy of the mapped buffer
+            small = cv2.resize(frame, (self.width, int(h * self.width / w)),
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+
+        try:
+            self._incoming.put_nowait((now, small))
+            return True
+        except queue.Full:
+            self.dropped_frames += 1
+            return False
+
+    def trigger(self, name):
+        """Request a clip around the current moment"""
+        with self._events_lock:
+            self._events.append([name, time.monotonic()])
+
+    # ------------------------------------------------------------------
+    # Background threads
+    # ------------------------------------------------------------------
+    def _encode_loop(self):
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality]
+        while not self._stop.is_set():
+            try:
+                ts, frame = self._incoming.get(timeout=0.2)
+            except queue.Empty:
+                self._flush_due_events(time.monotonic())
+                continue
+
+            bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            ok, jpeg = cv2.imencode('.jpg', bgr, params)
+            if ok:
+                data = jpeg.tobytes()
+                self._ring.append((ts, data))
+                self._ring_bytes += len(data)
+                self._evict(ts)
+            self._flush_due_events(ts)
+
+    def _evict(self, now):
+        # Keep enough history for the longest pending clip, bounded by bytes
+        with self._events_lock:
+            oldest_needed = min([t for _, t in self._events], default=now)
+        horizon = min(now, oldest_needed) - self.pre_seconds
+        while self._ring and (self._ring[0][0] < horizon or self._ring_bytes > self.max_bytes):
+            _, data = self._ring.popleft()
+            self._ring_bytes -= len(data)
+
+    def _flush_due_events(self, now, block=False):
+        with self._events_lock:
+            due = [e for e in self._events if now - e[1] >= self.post_seconds]
+            if not due:
+                return
+            self._events = [e for e in self._events if e not in due]
+
+        for name, t in due:
+            frames = [data for ts, data in self._ring
+                      if t - self.pre_seconds <= ts <= t + self.post_seconds]
+            try:
+                self._clips.put((name, frames), block=block)
+            except queue.Full:
+                self.dropped_clips += 1
+
+    def _write_loop(self):
+        # Runs until close() sends None, so queued clips are always written
+        while True:
+            item = self._clips.get()
+            if item is None:
+                break
+            name, frames = item
+            try:
+                self._write_clip(name, frames)
+            except Exception as e:
+                print(f"Clip Error: {e}")
+
+    def _write_clip(self, name, frames):
+        if not frames:
+            return None
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        path = os.path.join(self.output_dir, f"{name}_{stamp}.avi")
+
+        first = cv2.imdecode(np.frombuffer(frames[0], np.uint8), cv2.IMREAD_COLOR)
+        h, w = first.shape[:2]
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), self.fps, (w, h))
+        try:
+            writer.write(first)
+            for data in frames[1:]:
+                writer.write(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR))
+        finally:
+            writer.release()
+
+        self.clips_written += 1
+        print(f"🎞 Clip saved: {path} ({len(frames)} frames)")
+        return path
+
+    def stats(self):
+        """Snapshot of buffer usage for logging"""
+        return {
+            'ring_frames': len(self._ring),
+            'ring_bytes': self._ring_bytes,
+            'dropped_frames': self.dropped_frames,
+            'dropped_clips': self.dropped_clips,
+            'clips_written': self.clips_written,
+        }
+
+    def close(self, timeout=10.0):
+        """Stop encoding, write every pending clip, then stop the writer"""
+        self._stop.set()
+        self._encoder.join(timeout=1)
+        # Events still inside their post-roll get whatever has been buffered
+        self._flush_due_events(float('inf'), block=True)
+        self._clips.put(None)
+        self._writer.join(timeout=timeout)
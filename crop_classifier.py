@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Second-stage ear crop classifier
+A tiny CNN that verifies detector crops (ear vs. headphones, hands,
+earmuffs...). Trained on crops cut from the YOLO labels plus hard
+negatives, exported to ONNX and run batched on CPU in the verification
+worker.
+
+Usage:
+    python crop_classifier.py train       # extract crops, train, export ONNX
+    python crop_classifier.py benchmark   # crops/sec on this CPU
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+CROP_SIZE = 64
+CONTEXT = 0.15  # Extra margin around each box, as a fraction of its size
+DEFAULT_MODEL_PATH = 'models/onnx/crop_classifier.onnx'
+EAR_THRESHOLD = 0.5
+
+
+def context_box(box, width, height, context=CONTEXT):
+    """Pixel (x1, y1, x2, y2) grown by `context` of the box size and clipped
+    to the image. Training crops and live crops both go through this."""
+    x1, y1, x2, y2 = box
+    mx, my = (x2 - x1) * context, (y2 - y1) * context
+    return (int(max(0, x1 - mx)), int(max(0, y1 - my)),
+            int(min(width, x2 + mx)), int(min(height, y2 + my)))
+
+
+def preprocess(crops):
+    """RGB/gray uint8 crops -> (N, 1, 64, 64) float32.
+    The Roboflow export is grayscale, so live crops are converted to match."""
+    batch = np.empty((len(crops), 1, CROP_SIZE, CROP_SIZE), dtype=np.float32)
+    for i, crop in enumerate(crops):
+        gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        batch[i, 0] = cv2.resize(gray, (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA)
+    batch *= 1.0 / 255.0
+    return batch
+
+
+# ----------------------------------------------------------------------
+# Runtime (worker process)
+# ----------------------------------------------------------------------
+_session = None
+_fallback_reason = None
+
+
+def _get_session(model_path=None, threads=1):
+    global _session
+    if _session is None:
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        path = model_path or os.environ.get('CROP_CLASSIFIER_PATH', DEFAULT_MODEL_PATH)
+        _session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+    return _session
+
+
+def ear_probabilities(crops, model_path=None):
+    """Probability that each crop is a real ear"""
+    if not crops:
+        return np.empty(0, dtype=np.float32)
+    session = _get_session(model_path)
+    logits = session.run(None, {session.get_inputs()[0].name: preprocess(crops)})[0]
+    return 1.0 / (1.0 + np.exp(-logits.reshape(-1)))
+
+
+def classify_crops(crops):
+    """Batched check for VerificationWorker: one bool per crop.
+    If the classifier cannot run (onnxruntime missing, bad model file) the
+    HSV skin check decides instead, so a broken model never blocks alerts."""
+    try:
+        return [bool(p >= EAR_THRESHOLD) for p in ear_probabilities(crops)]
+    except Exception as e:
+        global _fallback_reason
+        if _fallback_reason is None:
+            _fallback_reason = str(e)
+            print(f"⚠ Crop classifier unavailable ({e}), using the skin check")
+        from verify_worker import is_skin_color
+        return [is_skin_color(crop) for crop in crops]
+
+
+# ----------------------------------------------------------------------
+# Dataset
+# ----------------------------------------------------------------------
+def _read_yolo_boxes(label_path, width, height):
+    """YOLO label file -> (N, 4) pixel xyxy boxes. Polygon rows (most of
+    this dataset) become their bounding box; malformed rows are skipped."""
+    if not label_path.exists():
+        return np.zeros((0, 4), dtype=np.float32)
+    from dataset_check import parse_label  # Training side only, keeps yaml off the Pi
+    data, _ = parse_label(label_path)
+    if not len(data):
+        return np.zeros((0, 4), dtype=np.float32)
+    cx, cy, w, h = data[:, 1] * width, data[:, 2] * height, data[:, 3] * width, data[:, 4] * height
+    return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+
+def _cut(image, box):
+    h, w = image.shape[:2]
+    x1, y1, x2, y2 = context_box(box, w, h)
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+    return cv2.resize(image[y1:y2, x1:x2], (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA)
+
+
+def _box_iou(box, boxes):
+    if len(boxes) == 0:
+        return np.zeros(0)
+    ix = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    iy = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = ix * iy
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def extract_crops(split_dir, negatives_per_image=2, negatives_dir=None, seed=0):
+    """Positive crops from the label boxes, negatives from background regions
+    of the same images (same box sizes, IoU < 0.1) plus any extra hard
+    negative images. Returns (crops uint8 (N, 64, 64), labels (N,))."""
+    rng = np.random.default_rng(seed)
+    crops, labels = [], []
+    image_dir = Path(split_dir) / 'images'
+    label_dir = Path(split_dir) / 'labels'
+
+    for image_path in sorted(image_dir.glob('*.jpg')):
+        image = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            continue
+        h, w = image.shape
+        boxes = _read_yolo_boxes(label_dir / f'{image_path.stem}.txt', w, h)
+
+        for box in boxes:
+            crop = _cut(image, box)
+            if crop is not None:
+                crops.append(crop)
+                labels.append(1)
+
+        sizes = boxes[:, 2:] - boxes[:, :2] if len(boxes) else np.array([[w * 0.1, h * 0.15]])
+        for _ in range(negatives_per_image):
+            bw, bh = sizes[rng.integers(len(sizes))]
+            for _attempt in range(10):
+                x1, y1 = rng.uniform(0, max(1, w - bw)), rng.uniform(0, max(1, h - bh))
+                box = np.array([x1, y1, x1 + bw, y1 + bh])
+                if len(boxes) == 0 or _box_iou(box, boxes).max() < 0.1:
+                    crop = _cut(image, box)
+                    if crop is not None:
+                        crops.append(crop)
+                        labels.append(0)
+                    break
+
+    if negatives_dir and Path(negatives_dir).exists():
+        for path in sorted(Path(negatives_dir).iterdir()):
+            image = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+            if image is not None:
+                crops.append(cv2.resize(image, (CROP_SIZE, CROP_SIZE), interpolation=cv2.INTER_AREA))
+                labels.append(0)
+
+    return np.array(crops, dtype=np.uint8), np.array(labels, dtype=np.float32)
+
+
+# ----------------------------------------------------------------------
+# Training / export
+# ----------------------------------------------------------------------
+def build_model():
+    """~25k parameter CNN, 64x64 grayscale in, one logit out"""
+    import torch.nn as nn
+
+    def block(cin, cout):
+        return nn.Sequential(
+            nn.Conv2d(cin, cout, 3, padding=1, bias=False),
+            nn.BatchNorm2d(cout),
+            nn.ReLU(inplace=True),
+            nn.MaxPool2d(2),
+        )
+
+    return nn.Sequential(
+        block(1, 16), block(16, 32), block(32, 48), block(48, 64),
+        nn.AdaptiveAvgPool2d(1),
+        nn.Flatten(),
+        nn.Linear(64, 1),
+    )
+
+
+def train(args):
+    import torch
+
+    print("="*60)
+    print("Training Crop Classifier")
+    print("="*60)
+
+    x_train, y_train = extract_crops('train', args.negatives_per_image, args.negatives_dir)
+    x_val, y_val = extract_crops('valid', args.negatives_per_image, seed=1)
+    print(f"✓ Train crops: {len(x_train)} ({int(y_train.sum())} ears)")
+    print(f"✓ Valid crops: {len(x_val)} ({int(y_val.sum())} ears)")
+
+    torch.set_num_threads(os.cpu_count() or 1)
+    model = build_model()
+    optimizer = torch.optim.AdamW(model.parameters(), lr=args.lr, weight_decay=1e-4)
+    pos_weight = torch.tensor([(len(y_train) - y_train.sum()) / max(1, y_train.sum())])
+    loss_fn = torch.nn.BCEWithLogitsLoss(pos_weight=pos_weight)
+
+    xt = torch.from_numpy(x_train).unsqueeze(1).float() / 255
+    yt = torch.from_numpy(y_train)
+    xv = torch.from_numpy(x_val).unsqueeze(1).float() / 255
+    yv = torch.from_numpy(y_val)
+
+    for epoch in range(args.epochs):
+        model.train()
+        perm = torch.randperm(len(xt))
+        total = 0.0
+        for i in range(0, len(perm), args.batch):
+            idx = perm[i:i + args.batch]
+            xb = xt[idx]
+            # Horizontal flip: left and right ears
+            flip = torch.rand(len(xb)) < 0.5
+            xb[flip] = xb[flip].flip(-1)
+            loss = loss_fn(model(xb).squeeze(1), yt[idx])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(idx)
+
+        model.eval()
+        with torch.no_grad():
+            pred = (model(xv).squeeze(1) > 0).float()
+        acc = (pred == yv).float().mean().item()
+        tpr = ((pred == 1) & (yv == 1)).sum().item() / max(1, (yv == 1).sum().item())
+        tnr = ((pred == 0) & (yv == 0)).sum().item() / max(1, (yv == 0).sum().item())
+        print(f"  Epoch {epoch + 1:3d}/{args.epochs}: loss {total / len(xt):.4f}, "
+              f"val acc {acc:.3f} (ears {tpr:.3f}, negatives {tnr:.3f})")
+
+    export(model, args.output)
+
+
+def export(model, output_path):
+    import torch
+
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    model.eval()
+    dummy = torch.zeros(1, 1, CROP_SIZE, CROP_SIZE)
+    torch.onnx.export(
+        model, dummy, output_path,
+        input_names=['crops'], output_names=['logits'],
+        dynamic_axes={'crops': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=11,
+    )
+    print(f"\n✓ Crop classifier exported to: {output_path}")
+
+
+def benchmark(args):
+    print("="*60)
+    print("Crop Classifier Benchmark")
+    print("="*60)
+    print(f"  Model: {args.output}")
+    print(f"  Threads: {args.threads}")
+
+    _get_session(args.output, threads=args.threads)
+    rng = np.random.default_rng(0)
+    crops = [rng.integers(0, 255, (rng.integers(40, 160), rng.integers(30, 120), 3), dtype=np.uint8)
+             for _ in range(64)]
+
+    for batch in (1, 4, 8, 16, 32):
+        ear_probabilities(crops[:batch])  # Warm-up
+        runs = max(5, 256 // batch)
+        start = time.perf_counter()
+        for _ in range(runs):
+            ear_probabilities(crops[:batch])
+        elapsed = time.perf_counter() - start
+        print(f"  batch {batch:2d}: {runs * batch / elapsed:8.1f} crops/s, "
+              f"{elapsed / runs * 1000:6.2f} ms/batch")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train, export and benchmark the ear crop classifier')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_train = sub.add_parser('train', help='Extract crops, train and export to ONNX')
+    p_train.add_argument('--epochs', type=int, default=30)
+    p_train.add_argument('--batch', type=int, default=128)
+    p_train.add_argument('--lr', type=float, default=2e-3)
+    p_train.add_argument('--negatives-per-image', type=int, default=2)
+    p_train.add_argument('--negatives-dir', default='hard_negatives',
+                         help='Extra negative crops (headphones, hands, earmuffs)')
+    p_train.add_argument('--output', default=DEFAULT_MODEL_PATH)
+
+    p_bench = sub.add_parser('benchmark', help='Measure crops/sec on this CPU')
+    p_bench.add_argument('--output', default=DEFAULT_MODEL_PATH)
+    p_bench.add_argument('--threads', type=int, default=4, help='Pi5 has 4 cores')
+
+    args = parser.parse_args()
+    if args.command == 'train':
+        train(args)
+    else:
+        benchmark(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Dataset integrity scan and statistics
+Reads every image header through mmap (size, EXIF orientation, truncation)
+without decoding pixels, pairs each image with its YOLO label file the way
+ultralytics does, validates the labels and builds box-size, aspect-ratio
+and objects-per-image histograms. Files are scanned in parallel and the
+per-file results are cached keyed by image and label mtimes, so a re-run
+only touches what changed.
+
+Used as a pre-flight gate by step 1, info.py and test_setup.py.
+
+Usage:
+    python dataset_check.py                  # scan data.yaml splits
+    python dataset_check.py --strict         # warnings fail the gate too
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+SPLIT_KEYS = ('train', 'val', 'test')
+MIN_IMAGE_SIZE = 10  # ultralytics rejects smaller images
+MIN_BOX_PIXELS = 2  # Narrower boxes are almost always annotation slips
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Histogram bins: box size (sqrt of area, px at the training input size), aspect ratio (w/h), objects per image
+SIZE_BINS = [0, 8, 16, 32, 64, 128, 256, np.inf]
+ASPECT_BINS = [0, 0.25, 0.5, 1.0, 2.0, 4.0, np.inf]
+COUNT_BINS = [0, 1, 2, 3, 4, 5, 10, np.inf]
+
+
+# ----------------------------------------------------------------------
+# Image headers
+# ----------------------------------------------------------------------
+def _exif_orientation(m, start, end):
+    """EXIF orientation tag from an APP1 segment (1 if absent)"""
+    if m[start:start + 6] != b'Exif\x00\x00':
+        return 1
+    tiff = start + 6
+    endian = '<' if m[tiff:tiff + 2] == b'II' else '>'
+    try:
+        ifd = tiff + struct.unpack_from(endian + 'I', m, tiff + 4)[0]
+        for k in range(struct.unpack_from(endian + 'H', m, ifd)[0]):
+            entry = ifd + 2 + 12 * k
+            if entry + 12 > end:
+                break
+            if struct.unpack_from(endian + 'H', m, entry)[0] == 0x0112:
+                return struct.unpack_from(endian + 'H', m, entry + 8)[0]
+    except struct.error:
+        pass
+    return 1
+
+
+def _jpeg_header(m):
+    size, i, orientation = len(m), 2, 1
+    while i + 4 <= size:
+        if m[i] != 0xFF:
+            return 0, 0, 'corrupt JPEG marker stream'
+        marker = m[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # Markers without a length
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # End of image / start of scan before any frame header
+            break
+        length = struct.unpack_from('>H', m, i + 2)[0]
+        if marker == 0xE1:
+            orientation = _exif_orientation(m, i + 4, min(size, i + 2 + length))
+        elif marker in JPEG_SOF and i + 9 <= size:
+            height, width = struct.unpack_from('>HH', m, i + 5)
+            if orientation in (5, 6, 7, 8):  # Rotated 90 degrees: ultralytics swaps to the EXIF size
+                width, height = height, width
+            truncated = m.rfind(b'\xff\xd9', max(0, size - 4096)) == -1
+            return width, height, 'truncated JPEG (no end marker)' if truncated else None
+        i += 2 + length
+    return 0, 0, 'no JPEG frame header'
+
+
+def image_header(path):
+    """(width, height, problem) from the file header; width 0 = unreadable"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < 16:
+            return 0, 0, 'empty or tiny file'
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if m[:2] == b'\xff\xd8':
+                return _jpeg_header(m)
+            if m[:8] == b'\x89PNG\r\n\x1a\n':
+                width, height = struct.unpack_from('>II', m, 16)
+                return width, height, None if m.rfind(b'IEND', max(0, len(m) - 64)) != -1 else 'truncated PNG'
+            if m[:2] == b'BM':
+                width, height = struct.unpack_from('<ii', m, 18)
+                return width, abs(height), None
+    return 0, 0, 'unknown image format'
+
+
+# ----------------------------------------------------------------------
+# Labels
+# ----------------------------------------------------------------------
+def parse_label(path, nc=None):
+    """(boxes as (n, 5) class/cx/cy/w/h, problems). Polygon rows become their
+    bounding box; malformed rows are dropped and reported. nc=None skips the
+    class id check."""
+    rows, problems = [], []
+    with open(path) as f:
+        for line_no, line in enumerate(f, 1):
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                values = [float(v) for v in parts]
+            except ValueError:
+                problems.append(f"E:line {line_no}: not numeric")
+                continue
+            if len(values) == 5:
+                rows.append(values)
+            elif len(values) >= 7 and len(values) % 2 == 1:
+                xy = np.array(values[1:]).reshape(-1, 2)
+                (x1, y1), (x2, y2) = xy.min(axis=0), xy.max(axis=0)
+                rows.append([values[0], (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+            else:
+                problems.append(f"E:line {line_no}: {len(values)} values (expected 5, or a polygon)")
+
+    boxes = np.array(rows, dtype=np.float32).reshape(-1, 5)
+    if len(boxes):
+        cls = boxes[:, 0]
+        if nc is not None and ((cls != np.floor(cls)).any() or (cls < 0).any() or (cls >= nc).any()):
+            problems.append(f"E:class id outside 0..{nc - 1}")
+        if (boxes[:, 1:] < 0).any() or (boxes[:, 1:] > 1.001).any():
+            problems.append("E:coordinates not normalized to 0..1")
+        if (boxes[:, 3:] <= 0).any():
+            problems.append("W:zero-size box")
+        if len(np.unique(boxes, axis=0)) < len(boxes):
+            problems.append("W:duplicate boxes")
+    return boxes, problems
+
+
+def label_path_for(image_path):
+    """ultralytics convention: .../images/x.jpg -> .../labels/x.txt"""
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    return os.path.splitext(sb.join(str(image_path).rsplit(sa, 1)))[0] + '.txt'
+
+
+def scan_file(image_path, label_path, nc):
+    """(width, height, labelled, boxes, problems) for one image/label pair"""
+    problems = []
+    try:
+        width, height, problem = image_header(image_path)
+    except (OSError, ValueError) as e:
+        width, height, problem = 0, 0, str(e)
+    if problem:
+        problems.append(('E:' if width == 0 else 'W:') + problem)
+    elif min(width, height) < MIN_IMAGE_SIZE:
+        problems.append(f"E:image is {width}x{height} px")
+
+    labelled = os.path.exists(label_path)
+    boxes = np.zeros((0, 5), dtype=np.float32)
+    if labelled:
+        try:
+            boxes, label_problems = parse_label(label_path, nc)
+            problems += label_problems
+            tiny = int(((boxes[:, 3] * width < MIN_BOX_PIXELS) | (boxes[:, 4] * height < MIN_BOX_PIXELS)).sum())
+            if width and tiny:
+                problems.append(f"W:{tiny} box{'es' if tiny > 1 else ''} under {MIN_BOX_PIXELS} px")
+        except (OSError, UnicodeDecodeError) as e:
+            problems.append(f"E:label unreadable: {e}")
+    return width, height, labelled, boxes, problems
+
+
+# ----------------------------------------------------------------------
+# Dataset
+# ----------------------------------------------------------------------
+def _resolve(base, entry):
+    """Path of a data.yaml split entry, with ultralytics' '../' fallback"""
+    path = Path(entry) if os.path.isabs(entry) else base / entry
+    if not path.exists() and str(entry).startswith('../'):
+        path = base / entry[3:]
+    return path
+
+
+def split_images(data_yaml):
+    """{split: (image paths, source dir or None)} from a data.yaml.
+    A split may be an image directory or a .txt list of images."""
+    with open(data_yaml) as f:
+        config = yaml.safe_load(f)
+    base = Path(config.get('path') or Path(data_yaml).parent)
+    splits = {}
+    for key in SPLIT_KEYS:
+        entry = config.get(key)
+        if not entry:
+            continue
+        source = _resolve(base, entry)
+        if source.is_dir():
+            images = sorted(str(p) for p in source.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+            splits[key] = (images, source)
+        elif source.is_file():
+            with open(source) as f:
+                lines = [line.strip() for line in f if line.strip()]
+            images = [str(source.parent / line[2:]) if line.startswith('./') else line for line in lines]
+            splits[key] = (images, None)
+        else:
+            splits[key] = ([], source)
+    return splits, len(config.get('names', [])) or int(config.get('nc', 0))
+
+
+def _load_cache(path):
+    """{image: ((image mtime, label mtime), result)} from a previous scan"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        data = np.load(path, allow_pickle=False)
+        columns = [data[k].tolist() for k in ('paths', 'image_mtimes', 'label_mtimes', 'widths', 'heights',
+                                              'labelled', 'problems')]
+        boxes = np.split(data['boxes'], np.cumsum(data['n_boxes'])[:-1])
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {
+        image: ((image_mtime, label_mtime), (width, height, labelled, b, problems.split('|') if problems else []))
+        for image, image_mtime, label_mtime, width, height, labelled, problems, b in zip(*columns, boxes)
+    }
+
+
+def _save_cache(path, images, keys, results):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    boxes = [r[3] for r in results]
+    np.savez(
+        path,
+        paths=np.array(images, dtype=str),
+        image_mtimes=np.array([k[0] for k in keys], dtype=np.int64),
+        label_mtimes=np.array([k[1] for k in keys], dtype=np.int64),
+        widths=np.array([r[0] for r in results], dtype=np.int32),
+        heights=np.array([r[1] for r in results], dtype=np.int32),
+        labelled=np.array([r[2] for r in results], dtype=bool),
+        n_boxes=np.array([len(b) for b in boxes], dtype=np.int32),
+        boxes=np.concatenate(boxes) if boxes else np.zeros((0, 5), dtype=np.float32),
+        problems=np.array(['|'.join(r[4]) for r in results], dtype=str),
+    )
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return -1
+
+
+def scan_split(images, nc, cache_path=None, workers=None):
+    """Results per image (cached where mtimes match) and the number rescanned"""
+    labels = [label_path_for(p) for p in images]
+    keys = [(_mtime(i), _mtime(l)) for i, l in zip(images, labels)]
+    cached = _load_cache(cache_path)
+    results = [None] * len(images)
+    todo = []
+    for k, (image, key) in enumerate(zip(images, keys)):
+        hit = cached.get(image)
+        if hit is not None and hit[0] == key:
+            results[k] = hit[1]
+        else:
+            todo.append(k)
+
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for k, result in zip(todo, pool.map(lambda k: scan_file(images[k], labels[k], nc), todo, chunksize=64)):
+                results[k] = result
+        if cache_path:
+            _save_cache(cache_path, images, keys, results)
+    return results, len(todo)
+
+
+def _orphan_labels(images, source):
+    """Label files in the split's labels directory without a matching image"""
+    if source is None:
+        return []
+    label_dir = Path(label_path_for(source / 'x.jpg')).parent
+    if label_dir == source or not label_dir.is_dir():
+        return []
+    expected = {os.path.normpath(label_path_for(p)) for p in images}
+    return sorted(str(p) for p in label_dir.rglob('*.txt') if os.path.normpath(str(p)) not in expected)
+
+
+def histograms(results, imgsz=640):
+    """Box size at the training input size, aspect ratio and objects per image"""
+    sizes, aspects = [], []
+    for width, height, _, boxes, _ in results:
+        if len(boxes) and width:
+            w, h = boxes[:, 3] * width, boxes[:, 4] * height
+            sizes.append(np.sqrt(w * h) * imgsz / max(width, height))
+            aspects.append(w / np.maximum(h, 1e-6))
+    sizes = np.concatenate(sizes) if sizes else np.zeros(0)
+    aspects = np.concatenate(aspects) if aspects else np.zeros(0)
+    counts = np.array([len(r[3]) for r in results])
+    return {
+        'box_size_px': np.histogram(sizes, SIZE_BINS)[0].tolist(),
+        'aspect_ratio': np.histogram(aspects, ASPECT_BINS)[0].tolist(),
+        'objects_per_image': np.histogram(counts, COUNT_BINS)[0].tolist(),
+    }
+
+
+def scan_dataset(data_yaml='data.yaml', imgsz=640, cache_dir='.dataset_cache', workers=None, strict=False):
+    """Scan every split of a data.yaml. report['ok'] is False when any
+    error was found (or any warning, with strict)."""
+    start = time.perf_counter()
+    splits, nc = split_images(data_yaml)
+    digest = hashlib.sha1(os.path.abspath(data_yaml).encode()).hexdigest()[:8]
+    report = {'data': data_yaml, 'splits': {}, 'errors': [], 'warnings': [], 'scanned': 0, 'cached': 0}
+    all_results = []
+
+    for split, (images, source) in splits.items():
+        if not images:
+            # Training needs train and val; a missing test split only matters for final evaluation
+            (report['errors'] if split != 'test' else report['warnings']).append((str(source), f"{split}: no images found"))
+            report['splits'][split] = {'images': 0}
+            continue
+        cache_path = os.path.join(cache_dir, f"{split}_{digest}.npz") if cache_dir else None
+        results, scanned = scan_split(images, nc, cache_path, workers)
+        report['scanned'] += scanned
+        report['cached'] += len(images) - scanned
+        all_results += results
+
+        for image, (_, _, _, _, problems) in zip(images, results):
+            for p in problems:
+                (report['errors'] if p.startswith('E:') else report['warnings']).append((image, p[2:]))
+        orphans = _orphan_labels(images, source)
+        report['warnings'] += [(p, 'label file without an image') for p in orphans]
+        unlabelled = sum(1 for r in results if not r[2])
+        if unlabelled == len(images) and split == 'train':
+            report['errors'].append((str(source), 'train: no label files found (check the images/labels layout)'))
+
+        report['splits'][split] = {
+            'images': len(images),
+            'labelled': len(images) - unlabelled,
+            'backgrounds': sum(1 for r in results if r[2] and len(r[3]) == 0) + unlabelled,
+            'boxes': int(sum(len(r[3]) for r in results)),
+            'orphan_labels': len(orphans),
+        }
+
+    report['histograms'] = histograms(all_results, imgsz)
+    report['ok'] = not report['errors'] and not (strict and report['warnings'])
+    report['seconds'] = round(time.perf_counter() - start, 2)
+    return report
+
+
+def _print_histogram(title, edges, counts, integer=False):
+    print(f"\n  {title}:")
+    peak = max(counts) or 1
+    for lo, hi, n in zip(edges[:-1], edges[1:], counts):
+        if np.isinf(hi):
+            label = f"{lo:g}+"
+        elif integer:
+            label = f"{lo:g}" if hi - lo == 1 else f"{lo:g}-{hi - 1:g}"
+        else:
+            label = f"{lo:g}-{hi:g}"
+        print(f"    {label:>10} {'█' * int(round(30 * n / peak)):<30} {n}")
+
+
+def print_report(report, details=10, show_histograms=True):
+    for split, s in report['splits'].items():
+        if s['images']:
+            print(f"  {split}: {s['images']} images, {s['boxes']} boxes, "
+                  f"{s['backgrounds']} background, {s['orphan_labels']} orphan labels")
+        else:
+            print(f"  {split}: no images")
+    print(f"  Scanned {report['scanned']} files ({report['cached']} cached) in {report['seconds']:.2f} s")
+
+    if show_histograms:
+        h = report['histograms']
+        _print_histogram("Box size (px at training size)", SIZE_BINS, h['box_size_px'])
+        _print_histogram("Box aspect ratio (w/h)", ASPECT_BINS, h['aspect_ratio'])
+        _print_histogram("Objects per image", COUNT_BINS, h['objects_per_image'], integer=True)
+
+    for level, icon in (('errors', '❌'), ('warnings', '⚠')):
+        items = report[level]
+        if items:
+            print(f"\n  {icon} {len(items)} {level}:")
+            for path, message in items[:details]:
+                print(f"    {path}: {message}")
+            if len(items) > details:
+                print(f"    ... and {len(items) - details} more")
+
+
+def preflight(data_yaml='data.yaml', imgsz=640, strict=False, verbose=True):
+    """Fast integrity gate before training. Returns True if the dataset is usable."""
+    report = scan_dataset(data_yaml, imgsz, strict=strict)
+    if verbose:
+        print_report(report, show_histograms=False)
+    if report['ok']:
+        print(f"✓ Dataset pre-flight passed ({sum(s['images'] for s in report['splits'].values())} images)")
+    else:
+        print(f"❌ Dataset pre-flight failed: {len(report['errors'])} errors"
+              + (f", {len(report['warnings'])} warnings (strict)" if strict else ""))
+    return report['ok']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check dataset integrity and print label statistics')
+    parser.add_argument('--data', default='data.yaml')
+    parser.add_argument('--imgsz', type=int, default=640, help='Training input size for box-size statistics')
+    parser.add_argument('--strict', action='store_true', help='Fail on warnings as well as errors')
+    parser.add_argument('--workers', type=int, default=None, help='Scan threads (default: all cores)')
+    parser.add_argument('--no-cache', action='store_true', help='Rescan every file')
+    parser.add_argument('--report', default=None, help='Also write the report as JSON')
+    parser.add_argument('--details', type=int, default=20, help='Problems listed per level')
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Dataset Integrity Check")
+    print("="*60)
+
+    if not os.path.exists(args.data):
+        print(f"\n❌ {args.data} not found")
+        raise SystemExit(1)
+    report = scan_dataset(args.data, args.imgsz, cache_dir=None if args.no_cache else '.dataset_cache',
+                          workers=args.workers, strict=args.strict)
+    print_report(report, args.details)
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n✓ Report saved to: {args.report}")
+
+    print(f"\n{'✓ Dataset OK' if report['ok'] else '❌ Dataset has problems'}")
+    raise SystemExit(0 if report['ok'] else 1)
+
+if __name__ == '__main__':
+    main()
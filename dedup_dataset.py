@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection across train/valid/test
+Hashes every image (64-bit dHash), finds near-duplicates with a
+multi-index Hamming search and writes a deduplicated, leakage-free split
+manifest that can be used in place of data.yaml.
+"""
+
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+SPLITS = ['train', 'valid', 'test']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+# When a cluster spans splits it is kept whole in the most held-out one
+SPLIT_PRIORITY = {'test': 2, 'valid': 1, 'train': 0}
+
+
+# ----------------------------------------------------------------------
+# Hashing
+# ----------------------------------------------------------------------
+def dhash(path):
+    """64-bit difference hash of an image, or None if unreadable"""
+    # Reduced decode lets libjpeg skip most of the IDCT work
+    img = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+    small = cv2.resize(img, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return np.packbits(bits).view('>u8')[0].astype(np.uint64)
+
+
+def hash_images(paths, cache_path=None, workers=None):
+    """Hash all images in parallel, reusing cached hashes for unchanged files.
+    Returns (hashes, valid_mask)."""
+    mtimes = np.array([os.stat(p).st_mtime_ns for p in paths], dtype=np.int64)
+    keys = [str(p) for p in paths]
+    hashes = np.zeros(len(paths), dtype=np.uint64)
+    valid = np.zeros(len(paths), dtype=bool)
+
+    cached = {}
+    if cache_path and os.path.exists(cache_path):
+        data = np.load(cache_path, allow_pickle=False)
+        for k, m, h in zip(data['paths'], data['mtimes'], data['hashes']):
+            cached[str(k)] = (int(m), np.uint64(h))
+
+    todo = []
+    for i, (k, m) in enumerate(zip(keys, mtimes)):
+        hit = cached.get(k)
+        if hit is not None and hit[0] == m:
+            hashes[i] = hit[1]
+            valid[i] = True
+        else:
+            todo.append(i)
+
+    print(f"  Hashing {len(todo)} images ({len(paths) - len(todo)} cached)...")
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for i, h in zip(todo, pool.map(dhash, [paths[i] for i in todo], chunksize=64)):
+            if h is not None:
+                hashes[i] = h
+                valid[i] = True
+
+    if cache_path:
+        np.savez(cache_path, paths=np.array(keys)[valid], mtimes=mtimes[valid], hashes=hashes[valid])
+    return hashes, valid
+
+
+# ----------------------------------------------------------------------
+# Hamming search
+# ----------------------------------------------------------------------
+def popcount64(x):
+    """Vectorized popcount for a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(x)
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    return table[x.view(np.uint8).reshape(-1, 8)].sum(axis=1)
+
+
+def _expand_ranges(lo, hi):
+    """For query q with matches order[lo[q]:hi[q]], return (query_idx, position) pairs"""
+    counts = hi - lo
+    total = int(counts.sum())
+    if total == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    q = np.repeat(np.arange(len(lo)), counts)
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    return q, starts + np.arange(total)
+
+
+def find_near_duplicates(hashes, max_distance=4, chunks=4, block=65536):
+    """Return (i, j) index pairs (i < j) with Hamming distance <= max_distance.
+
+    Multi-index hashing: the 64 bits are split into `chunks` substrings. By
+    pigeonhole, any pair within max_distance has at least one substring
+    within max_distance // chunks, so only keys in those neighbourhoods
+    are compared instead of all N^2 pairs.
+    """
+    n = len(hashes)
+    width = 64 // chunks
+    radius = max_distance // chunks
+    chunk_mask = np.uint64((1 << width) - 1)
+    flips = [0] + [sum(1 << b for b in combo)
+                   for r in range(1, radius + 1)
+                   for combo in itertools.combinations(range(width), r)]
+
+    found = []
+    for c in range(chunks):
+        keys = (hashes >> np.uint64(c * width)) & chunk_mask
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+
+        for start in range(0, n, block):
+            q_idx = np.arange(start, min(start + block, n))
+            q_keys = keys[q_idx]
+            for flip in flips:
+                probe = q_keys ^ np.uint64(flip)
+                lo = np.searchsorted(sorted_keys, probe, side='left')
+                hi = np.searchsorted(sorted_keys, probe, side='right')
+                q, pos = _expand_ranges(lo, hi)
+                i = q_idx[q]
+                j = order[pos]
+                keep = i < j
+                i, j = i[keep], j[keep]
+                dist = popcount64(hashes[i] ^ hashes[j])
+                near = dist <= max_distance
+                if near.any():
+                    found.append(i[near].astype(np.int64) * n + j[near])
+
+    if not found:
+        return np.empty((0, 2), dtype=np.int64)
+    pairs = np.unique(np.concatenate(found))
+    return np.stack([pairs // n, pairs % n], axis=1)
+
+
+def cluster_pairs(n, pairs):
+    """Connected components over duplicate pairs, returns a label per item"""
+    parent = np.arange(n)
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for i, j in pairs:
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(n)])
+
+
+# ----------------------------------------------------------------------
+# Manifest
+# ----------------------------------------------------------------------
+def list_images(root):
+    """Collect (path, split) for every image under <root>/<split>/images"""
+    items = []
+    for split in SPLITS:
+        image_dir = Path(root) / split / 'images'
+        if not image_dir.exists():
+            continue
+        for p in sorted(image_dir.iterdir()):
+            if p.suffix.lower() in IMAGE_EXTENSIONS:
+                items.append((p.resolve(), split))
+    return items
+
+
+def build_manifest(items, labels, max_per_cluster=1):
+    """Assign each cluster to one split and keep up to max_per_cluster images,
+    taken from that split first so held-out images stay held out"""
+    splits = np.array([SPLIT_PRIORITY[s] for _, s in items])
+    sizes = np.array([p.stat().st_size for p, _ in items])
+    names = {v: k for k, v in SPLIT_PRIORITY.items()}
+
+    manifest = {s: [] for s in SPLITS}
+    clusters = []
+    order = np.lexsort((-sizes, labels))  # by cluster, largest file first
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    for members in np.split(order, boundaries):
+        priority = splits[members].max()
+        members = members[np.argsort(splits[members] != priority, kind='stable')]  # Target split first, then by size
+        target = names[int(priority)]
+        keep = members[:max_per_cluster]
+        manifest[target].extend(str(items[k][0]) for k in keep)
+        if len(members) > 1:
+            clusters.append({
+                'split': target,
+                'kept': [str(items[k][0]) for k in keep],
+                'dropped': [str(items[k][0]) for k in members[max_per_cluster:]],
+                'source_splits': sorted({items[k][1] for k in members}),
+            })
+    return manifest, clusters
+
+
+def write_manifest(manifest, clusters, data_yaml, output_dir):
+    """Write per-split image lists, a data.yaml pointing at them and a report"""
+    os.makedirs(output_dir, exist_ok=True)
+    out_dir = Path(output_dir).resolve()
+
+    for split, paths in manifest.items():
+        with open(out_dir / f'{split}.txt', 'w') as f:
+            f.write('\n'.join(sorted(paths)) + '\n')
+
+    with open(data_yaml) as f:
+        config = yaml.safe_load(f)
+    config['train'] = str(out_dir / 'train.txt')
+    config['val'] = str(out_dir / 'valid.txt')
+    config['test'] = str(out_dir / 'test.txt')
+    yaml_path = out_dir / 'data.yaml'
+    with open(yaml_path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+    with open(out_dir / 'duplicates.json', 'w') as f:
+        json.dump(clusters, f, indent=2)
+    return yaml_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images and write a leakage-free split manifest')
+    parser.add_argument('--root', default='.', help='Dataset root containing train/valid/test')
+    parser.add_argument('--data', default='data.yaml', help='Source data.yaml (class names are copied)')
+    parser.add_argument('--output', default='dedup', help='Output directory for the manifest')
+    parser.add_argument('--max-distance', type=int, default=4, help='Max Hamming distance between 64-bit hashes')
+    parser.add_argument('--keep', type=int, default=1, help='Images to keep per duplicate cluster')
+    parser.add_argument('--workers', type=int, default=None, help='Hashing threads (default: all cores)')
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Dataset Near-Duplicate Detection")
+    print("="*60)
+
+    items = list_images(args.root)
+    if not items:
+        print(f"\n❌ No images found under {args.root}/{{train,valid,test}}/images")
+        return
+    print(f"\n✓ Found {len(items)} images")
+
+    os.makedirs(args.output, exist_ok=True)
+    hashes, valid = hash_images([p for p, _ in items], os.path.join(args.output, 'hash_cache.npz'), args.workers)
+    if not valid.all():
+        for k in np.flatnonzero(~valid):
+            print(f"  ⚠ Unreadable image skipped: {items[k][0]}")
+        items = [it for it, ok in zip(items, valid) if ok]
+        hashes = hashes[valid]
+
+    pairs = find_near_duplicates(hashes, args.max_distance)
+    labels = cluster_pairs(len(items), pairs)
+    manifest, clusters = build_manifest(items, labels, args.keep)
+
+    leaking = sum(1 for c in clusters if len(c['source_splits']) > 1)
+    dropped = sum(len(c['dropped']) for c in clusters)
+    print(f"\n✓ {len(pairs)} near-duplicate pairs in {len(clusters)} clusters")
+    print(f"  Clusters spanning splits (leakage): {leaking}")
+    print(f"  Images dropped: {dropped}")
+    for split in SPLITS:
+        before = sum(1 for _, s in items if s == split)
+        print(f"  {split}: {before} -> {len(manifest[split])}")
+
+    yaml_path = write_manifest(manifest, clusters, args.data, args.output)
+    print(f"\n✓ Deduplicated data config: {yaml_path}")
+    print(f"  Train with: DATA_YAML = '{yaml_path}' in step1_train_model_to_pt.py")
+
+if __name__ == '__main__':
+    main()
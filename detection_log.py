@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Columnar detection log
+The streaming callback appends one tuple per detection to an in-memory
+batch; a background thread turns batches into compressed NumPy column
+chunks (.npz) with size-based rotation and a retention cap. Chunks are
+written every few minutes so little is held in memory (or lost on a
+crash), then merged into one chunk per hour once the hour is over.
+
+Usage:
+    python detection_log.py --days 30     # summary of the last 30 days
+    python detection_log.py --compact     # merge finished hours now
+"""
+
+import argparse
+import glob
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+import numpy as np
+
+# Verdict codes stored in the 'verdict' column
+VERDICT_SEEN = 0       # Detected, no decision taken on this frame
+VERDICT_SUBMITTED = 1  # Sent to the verification worker
+VERDICT_ALERTED = 2    # Alert sent
+VERDICT_REJECTED = 3   # Verification said no
+
+DTYPE = np.dtype([
+    ('timestamp', 'f8'),
+    ('track_id', 'i8'),
+    ('x1', 'f4'), ('y1', 'f4'), ('x2', 'f4'), ('y2', 'f4'),
+    ('confidence', 'f4'),
+    ('verdict', 'i1'),
+])
+
+
+class DetectionLog:
+    """Append-only detection log with a background flusher.
+
+    append() is a single list.append of a tuple. The flusher swaps the
+    list out in one reference assignment, which is atomic under the GIL,
+    so the hot path never takes a lock.
+    """
+
+    def __init__(self, directory='detections', flush_interval=5.0, chunk_rows=200_000,
+                 chunk_seconds=300, compact_seconds=3600, retention_bytes=2 * 1024 ** 3, retention_days=90):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.chunk_rows = chunk_rows
+        self.chunk_seconds = chunk_seconds
+        self.compact_seconds = compact_seconds
+        self.retention_bytes = retention_bytes
+        self.retention_days = retention_days
+        os.makedirs(directory, exist_ok=True)
+
+        self._batch = []
+        self._pending = []  # Structured arrays waiting to form a chunk
+        self._pending_rows = 0
+        self._chunk_started = time.time()
+        self.rows_written = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def append(self, timestamp, track_id, x1, y1, x2, y2, confidence, verdict=VERDICT_SEEN):
+        self._batch.append((timestamp, track_id, x1, y1, x2, y2, confidence, verdict))
+
+    def extend(self, timestamp, track_ids, boxes, confidences, verdict=VERDICT_SEEN):
+        """Append one row per detection from arrays (boxes: N x 4, normalized xyxy)"""
+        n = len(track_ids)
+        self._batch.extend(zip([timestamp] * n, track_ids.tolist(), *boxes.T.tolist(),
+                               confidences.tolist(), [verdict] * n))
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        self.flush(force=True)
+
+    def flush(self, force=False):
+        """Move the in-memory batch into the pending chunk, writing it when full"""
+        batch, self._batch = self._batch, []
+        if batch:
+            self._pending.append(np.array(batch, dtype=DTYPE))
+            self._pending_rows += len(batch)
+
+        too_big = self._pending_rows >= self.chunk_rows
+        too_old = time.time() - self._chunk_started >= self.chunk_seconds
+        if self._pending_rows and (force or too_big or too_old):
+            self._write_chunk(np.concatenate(self._pending))
+            self._pending, self._pending_rows = [], 0
+            self._chunk_started = time.time()
+            # Only the hours that just finished; older ones were settled on earlier writes
+            compact(self.directory, self.compact_seconds, self.chunk_rows, lookback=2)
+            self._enforce_retention()
+
+    def _write_chunk(self, rows):
+        start, end = rows['timestamp'].min(), rows['timestamp'].max()
+        name = f"det_{int(start)}_{int(np.ceil(end))}.npz"
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **{col: rows[col] for col in DTYPE.names})
+        os.replace(tmp, path)  # Readers never see a half-written chunk
+        self.rows_written += len(rows)
+
+    def _enforce_retention(self):
+        files = sorted(chunk_files(self.directory), key=lambda f: f[1])
+        cutoff = time.time() - self.retention_days * 86400
+        total = sum(os.path.getsize(p) for p, _, _ in files)
+        for path, start, end in files:
+            if end >= cutoff and total <= self.retention_bytes:
+                break
+            total -= os.path.getsize(path)
+            os.remove(path)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=10)
+
+
+def chunk_files(directory):
+    """[(path, start_ts, end_ts)] parsed from chunk file names"""
+    out = []
+    for path in glob.glob(os.path.join(directory, 'det_*_*.npz')):
+        try:
+            _, start, end = os.path.basename(path)[:-4].split('_')
+            out.append((path, int(start), int(end)))
+        except ValueError:
+            continue
+    return out
+
+
+def chunk_rows(path):
+    """Row count of a chunk from its .npy header, without decompressing the data"""
+    with zipfile.ZipFile(path) as z, z.open('timestamp.npy') as f:
+        version = np.lib.format.read_magic(f)
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        return read_header(f)[0][0]
+
+
+def compact(directory='detections', period=3600, max_rows=200_000, lookback=None):
+    """Merge the chunks of each finished `period` (by start time) into one,
+    looking at most `lookback` periods back (None: all). Busy periods over
+    max_rows are left as they are, decided from the chunk headers alone.
+    The merged file is in place before the parts are removed, so a crash
+    leaves duplicates at worst, never a gap."""
+    current = int(time.time()) // period
+    oldest = -1 if lookback is None else current - lookback
+    groups = {}
+    for path, start, end in chunk_files(directory):
+        if oldest <= start // period < current:
+            groups.setdefault(start // period, []).append((path, start, end))
+
+    merged = 0
+    for parts in groups.values():
+        if len(parts) < 2 or sum(chunk_rows(path) for path, _, _ in parts) > max_rows:
+            continue  # Already one chunk, or a busy period whose chunks are full size anyway
+        parts.sort(key=lambda f: f[1])
+        arrays = []
+        for path, _, _ in parts:
+            with np.load(path) as data:
+                arrays.append({c: data[c] for c in DTYPE.names})
+        rows = {c: np.concatenate([a[c] for a in arrays]) for c in DTYPE.names}
+        name = f"det_{parts[0][1]}_{max(end for _, _, end in parts)}.npz"
+        path = os.path.join(directory, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez_compressed(f, **rows)
+        os.replace(tmp, path)
+        for part, _, _ in parts:
+            if part != path:
+                os.remove(part)
+        merged += len(parts)
+    return merged
+
+
+def load(directory='detections', start=None, end=None, columns=None):
+    """Load rows in [start, end) as a dict of column arrays.
+    Chunks outside the range are skipped by file name alone."""
+    columns = list(columns or DTYPE.names)
+    if 'timestamp' not in columns:
+        columns.append('timestamp')
+    parts = {c: [] for c in columns}
+
+    for path, c_start, c_end in sorted(chunk_files(directory), key=lambda f: f[1]):
+        if (start is not None and c_end < start) or (end is not None and c_start >= end):
+            continue
+        with np.load(path) as data:
+            ts = data['timestamp']
+            mask = np.ones(len(ts), dtype=bool)
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts < end
+            for c in columns:
+                parts[c].append(data[c][mask])
+
+    return {c: np.concatenate(v) if v else np.empty(0, DTYPE[c]) for c, v in parts.items()}
+
+
+def summarize(rows):
+    """Print traffic and alert/reject statistics"""
+    n = len(rows['timestamp'])
+    if n == 0:
+        print("  No detections in range")
+        return
+
+    first = datetime.fromtimestamp(rows['timestamp'].min())
+    last = datetime.fromtimestamp(rows['timestamp'].max())
+    tracks = np.unique(rows['track_id'][rows['track_id'] >= 0])
+    verdicts = np.bincount(rows['verdict'].astype(np.int64), minlength=4)
+    decided = verdicts[VERDICT_ALERTED] + verdicts[VERDICT_REJECTED]
+
+    print(f"  Range: {first:%Y-%m-%d %H:%M} -> {last:%Y-%m-%d %H:%M}")
+    print(f"  Detections: {n:,}")
+    print(f"  Tracks: {len(tracks):,}")
+    print(f"  Alerts: {verdicts[VERDICT_ALERTED]:,}")
+    print(f"  Rejected by verification: {verdicts[VERDICT_REJECTED]:,}"
+          + (f" ({verdicts[VERDICT_REJECTED] / decided * 100:.1f}% of decisions)" if decided else ''))
+    if verdicts[VERDICT_SEEN]:
+        print(f"  Mean confidence: {rows['confidence'][rows['verdict'] == VERDICT_SEEN].mean():.3f}")
+
+    hours = ((rows['timestamp'] - time.timezone) // 3600 % 24).astype(np.int64)
+    per_hour = np.bincount(hours, minlength=24)
+    peak = per_hour.max()
+    print(f"\n  Detections by hour of day:")
+    for h in range(24):
+        bar = '#' * int(40 * per_hour[h] / peak) if peak else ''
+        print(f"    {h:02d}:00 {per_hour[h]:9,d} {bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize the detection log')
+    parser.add_argument('--dir', default='detections')
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--compact', action='store_true', help='Merge the chunks of finished hours first')
+    args = parser.parse_args()
+
+    print("="*60)
+    print("Detection Log Summary")
+    print("="*60)
+    if args.compact:
+        print(f"  Compacted {compact(args.dir)} chunks")
+    start = time.perf_counter()
+    rows = load(args.dir, start=time.time() - args.days * 86400)
+    print(f"  Loaded in {time.perf_counter() - start:.2f} s\n")
+    summarize(rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Hard-example mining from the live stream
+Frames with uncertain detections (confidence between a floor and the alert
+threshold) are sampled into a per-hour reservoir, deduplicated by track and
+perceptual hash, and saved with the model's boxes as YOLO pre-labels so
+they can be corrected and added to the next training round.
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+def frame_dhash(frame):
+    """64-bit difference hash of an RGB frame"""
+    small = cv2.resize(frame[::4, ::4], (9, 8), interpolation=cv2.INTER_AREA)
+    gray = small.mean(axis=2) if small.ndim == 3 else small
+    bits = gray[:, 1:] > gray[:, :-1]
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+class HardExampleMiner:
+    """Bounded sampler of uncertain frames.
+
+    offer() does only cheap checks on the streaming thread (confidence
+    band, track already sampled, token-bucket rate limit) before copying
+    the frame into a 2-slot queue. Hashing, reservoir sampling and JPEG
+    encoding happen on a background thread; the reservoir is written to
+    disk once per hour, until the total disk budget is used up.
+    """
+
+    def __init__(self, output_dir='hard_examples', conf_range=(0.4, 0.70), per_hour=60,
+                 max_rate=0.5, hash_distance=6, max_total_bytes=2 * 1024 ** 3,
+                 width=960, jpeg_quality=90, class_id=0):
+        self.output_dir = output_dir
+        self.conf_low, self.conf_high = conf_range
+        self.per_hour = per_hour
+        self.max_rate = max_rate  # Candidates per second handed to the worker
+        self.hash_distance = hash_distance
+        self.max_total_bytes = max_total_bytes
+        self.width = width
+        self.jpeg_quality = jpeg_quality
+        self.class_id = class_id
+
+        os.makedirs(os.path.join(output_dir, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(output_dir, 'labels'), exist_ok=True)
+        self.disk_bytes = sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(output_dir) for f in files
+        )
+
+        self._session = int(time.time())  # Part of every file name so a restart never overwrites
+        self._tokens = 1.0
+        self._last_refill = time.monotonic()
+        self._seen_tracks = set()
+        self._queue = queue.Queue(maxsize=2)
+
+        self._hour = None
+        self._reservoir = []  # (hash, track_id, jpeg_bytes, label_text)
+        self._candidates = 0  # Offers accepted into sampling this hour
+        self._recent_hashes = deque(maxlen=1024)
+        self.saved = 0
+        self.dropped = 0
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # Streaming-thread API
+    # ------------------------------------------------------------------
+    def is_candidate(self, confidence, track_id):
+        """Cheap pre-check before the caller maps the frame"""
+        if not (self.conf_low <= confidence < self.conf_high):
+            return False
+        if track_id in self._seen_tracks or self.disk_bytes >= self.max_total_bytes:
+            return False
+        now = time.monotonic()
+        self._tokens = min(1.0, self._tokens + (now - self._last_refill) * self.max_rate)
+        self._last_refill = now
+        return self._tokens >= 1.0
+
+    def offer(self, frame, track_id, boxes):
+        """Queue a frame with its predicted boxes (normalized xyxy) as pre-labels"""
+        self._tokens -= 1.0
+        self._seen_tracks.add(track_id)
+        h, w = frame.shape[:2]
+        if w > self.width:
+            small = cv2.resize(frame, (self.width, int(h * self.width / w)), interpolation=cv2.INTER_AREA)
+        else:
+            small = frame.copy()
+        try:
+            self._queue.put_nowait((track_id, small, np.asarray(boxes, dtype=np.float32).reshape(-1, 4)))
+        except queue.Full:
+            self.dropped += 1
+
+    # ------------------------------------------------------------------
+    # Background thread
+    # ------------------------------------------------------------------
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                track_id, frame, boxes = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                self._roll_hour()
+                continue
+            self._roll_hour()
+            self._sample(track_id, frame, boxes)
+        self._flush()
+
+    def _roll_hour(self):
+        hour = time.strftime('%Y%m%d_%H')
+        if hour != self._hour:
+            self._flush()
+            self._hour = hour
+            self._candidates = 0
+            self._seen_tracks = set()
+
+    def _is_duplicate(self, h):
+        for other in self._recent_hashes:
+            if bin(h ^ other).count('1') <= self.hash_distance:
+                return True
+        return False
+
+    def _sample(self, track_id, frame, boxes):
+        h = frame_dhash(frame)
+        if self._is_duplicate(h):
+            return
+        self._recent_hashes.append(h)
+
+        # Reservoir sampling (Algorithm R) over this hour's candidates
+        self._candidates += 1
+        if len(self._reservoir) < self.per_hour:
+            slot = len(self._reservoir)
+            self._reservoir.append(None)
+        else:
+            slot = random.randrange(self._candidates)
+            if slot >= self.per_hour:
+                return
+
+        ok, jpeg = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR),
+                                [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if ok:
+            self._reservoir[slot] = (h, track_id, jpeg.tobytes(), self._yolo_labels(boxes))
+
+    def _yolo_labels(self, boxes):
+        boxes = np.clip(boxes, 0.0, 1.0)
+        lines = []
+        for x1, y1, x2, y2 in boxes:
+            w, h = x2 - x1, y2 - y1
+            if w > 0 and h > 0:
+                lines.append(f"{self.class_id} {(x1 + x2) / 2:.6f} {(y1 + y2) / 2:.6f} {w:.6f} {h:.6f}")
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _flush(self):
+        items = [r for r in self._reservoir if r is not None]
+        self._reservoir = []
+        written = 0
+        for i, (_, track_id, jpeg, labels) in enumerate(items):
+            if self.disk_bytes + len(jpeg) > self.max_total_bytes:
+                print(f"⚠ Hard-example disk budget reached, skipping {len(items) - i} frames")
+                break
+            stem = f"hx_{self._hour}_{self._session}_{track_id}_{i}"
+            image_path = os.path.join(self.output_dir, 'images', f'{stem}.jpg')
+            if os.path.exists(image_path):
+                continue
+            with open(image_path, 'wb') as f:
+                f.write(jpeg)
+            with open(os.path.join(self.output_dir, 'labels', f'{stem}.txt'), 'w') as f:
+                f.write(labels)
+            self.disk_bytes += len(jpeg) + len(labels)
+            self.saved += 1
+            written += 1
+        if written:
+            print(f"🗂 Saved {written} hard examples for {self._hour}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Host-side YOLOv8 pre/post-processing helpers
+Shared by the benchmark suite and the bulk inference tools so every host
+backend prepares frames and decodes outputs the same way.
+"""
+
+import cv2
+import numpy as np
+
+
+def letterbox(image, size=640, color=114):
+    """Resize keeping aspect ratio and pad to size x size.
+    Returns (padded image, scale, (pad_x, pad_y))."""
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = int(round(h * scale)), int(round(w * scale))
+    resized = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nh, nw) != (h, w) else image
+
+    pad_x, pad_y = (size - nw) // 2, (size - nh) // 2
+    out = np.full((size, size, 3), color, dtype=np.uint8)
+    out[pad_y:pad_y + nh, pad_x:pad_x + nw] = resized
+    return out, scale, (pad_x, pad_y)
+
+
+def preprocess(image_bgr, size=640):
+    """BGR uint8 image -> (1, 3, size, size) float32 RGB in [0, 1]"""
+    padded, scale, pad = letterbox(image_bgr, size)
+    rgb = cv2.cvtColor(padded, cv2.COLOR_BGR2RGB)
+    blob = np.ascontiguousarray(rgb.transpose(2, 0, 1), dtype=np.float32)[None]
+    blob *= 1.0 / 255.0
+    return blob, scale, pad
+
+
+def postprocess(output, scale=1.0, pad=(0, 0), conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+    """Decode one YOLOv8 output (4 + nc, anchors) into detections.
+    Returns (boxes xyxy in original pixels, scores, class ids)."""
+    preds = output[0] if output.ndim == 3 else output
+    preds = preds.T  # (anchors, 4 + nc)
+
+    class_scores = preds[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_ids)), class_ids]
+    keep = scores >= conf_threshold
+    if not keep.any():
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64)
+
+    xywh = preds[keep, :4]
+    scores = scores[keep]
+    class_ids = class_ids[keep]
+
+    boxes = np.empty_like(xywh)
+    boxes[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+    boxes[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+    # Class-aware NMS: offset boxes per class so they never overlap
+    nms_boxes = boxes + class_ids[:, None].astype(np.float32) * 4096
+    wh_boxes = np.concatenate([nms_boxes[:, :2], nms_boxes[:, 2:] - nms_boxes[:, :2]], axis=1)
+    idx = cv2.dnn.NMSBoxes(wh_boxes.tolist(), scores.tolist(), conf_threshold, iou_threshold, top_k=max_det)
+    idx = np.asarray(idx, dtype=np.int64).reshape(-1)
+
+    boxes = boxes[idx]
+    boxes[:, [0, 2]] -= pad[0]
+    boxes[:, [1, 3]] -= pad[1]
+    boxes /= scale
+    return boxes.astype(np.float32), scores[idx].astype(np.float32), class_ids[idx]
@@ -97,12 +97,26 @@ def check_status():
     else:
         print("   ❌ Virtual environment not found - run: ./setup_macos.sh")
     
-    # Check dataset
-    train_images = len(list(Path('train/images').glob('*.jpg'))) if Path('train/images').exists() else 0
-    valid_images = len(list(Path('valid/images').glob('*.jpg'))) if Path('valid/images').exists() else 0
-    test_images = len(list(Path('test/images').glob('*.jpg'))) if Path('test/images').exists() else 0
-    
-    print(f"   📁 Dataset: {train_images} train, {valid_images} valid, {test_images} test")
+    # Check dataset (header/label scan, cached between runs)
+    try:
+        from dataset_check import scan_dataset
+        report = scan_dataset('data.yaml') if Path('data.yaml').exists() else None
+    except ImportError:
+        report = None  # numpy / PyYAML not installed yet
+    if report is not None:
+        counts = {k: s['images'] for k, s in report['splits'].items()}
+        boxes = sum(s.get('boxes', 0) for s in report['splits'].values())
+        print(f"   📁 Dataset: {counts.get('train', 0)} train, {counts.get('val', 0)} valid, "
+              f"{counts.get('test', 0)} test, {boxes} boxes")
+        if report['errors']:
+            print(f"   ❌ Dataset: {len(report['errors'])} errors - run: python dataset_check.py")
+        elif report['warnings']:
+            print(f"   ⚠ Dataset: {len(report['warnings'])} warnings - run: python dataset_check.py")
+    else:
+        train_images = len(list(Path('train/images').glob('*.jpg'))) if Path('train/images').exists() else 0
+        valid_images = len(list(Path('valid/images').glob('*.jpg'))) if Path('valid/images').exists() else 0
+        test_images = len(list(Path('test/images').glob('*.jpg'))) if Path('test/images').exists() else 0
+        print(f"   📁 Dataset: {train_images} train, {valid_images} valid, {test_images} test")
     
     # Check models
     if Path('runs/train').exists():
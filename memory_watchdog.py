@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Memory and leak watchdog
+Samples RSS, thread count and open file descriptors (optionally the top
+tracemalloc allocators) at a low rate on a background thread, prints a
+status line with the app's own runtime stats, appends periodic JSON
+snapshots, and switches the app into load-shedding mode when a threshold
+is crossed, so the service degrades instead of being OOM-killed.
+
+Usage:
+    python memory_watchdog.py watchdog/snapshots.jsonl   # summarize a run
+"""
+
+import ctypes
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+LEVEL_OK = 0
+LEVEL_SOFT = 1  # Shed optional work
+LEVEL_HARD = 2  # Also collect garbage and return freed memory to the OS
+
+
+def _proc_status():
+    """RSS (MB) and OS thread count from /proc/self/status"""
+    rss_mb, threads = None, None
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_mb = int(line.split()[1]) / 1024
+                elif line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+    except OSError:
+        pass
+    return rss_mb, threads
+
+
+def _open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def _malloc_trim():
+    """Give freed heap pages back to the OS (glibc only)"""
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class MemoryWatchdog:
+    """Low-rate resource sampler with load shedding.
+
+    The streaming thread only ever reads the `shedding` attribute. on_shed
+    and on_recover run on the watchdog thread when the level changes.
+    """
+
+    def __init__(self, interval=10.0, snapshot_dir='watchdog', snapshot_every=30,
+                 rss_soft_mb=1024, rss_hard_mb=1536, max_threads=150, max_fds=800,
+                 trace_allocations=False, top=10, on_shed=None, on_recover=None,
+                 extra_stats=None, print_every=6):
+        self.interval = interval
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_every = snapshot_every  # Samples between snapshots
+        self.rss_soft_mb = rss_soft_mb
+        self.rss_hard_mb = rss_hard_mb
+        self.max_threads = max_threads
+        self.max_fds = max_fds
+        self.trace_allocations = trace_allocations
+        self.top = top
+        self.on_shed = on_shed
+        self.on_recover = on_recover
+        self.extra_stats = extra_stats  # Callable returning a dict of app stats
+        self.print_every = print_every
+
+        self.level = LEVEL_OK
+        self.shedding = False
+        self.shed_count = 0
+        self.last = {}
+        self.peak_rss_mb = 0.0
+        self._samples = 0
+        self._previous_trace = None
+
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def sample(self):
+        rss_mb, os_threads = _proc_status()
+        stats = {
+            'time': time.time(),
+            'rss_mb': round(rss_mb, 1) if rss_mb is not None else None,
+            'threads': os_threads,
+            'py_threads': threading.active_count(),
+            'fds': _open_fds(),
+            'gc_objects': len(gc.get_objects()) if self.trace_allocations else None,
+        }
+        if self.extra_stats is not None:
+            try:
+                stats.update(self.extra_stats())
+            except Exception as e:
+                stats['extra_error'] = str(e)
+        return stats
+
+    def check(self, stats):
+        """Level for a sample. A level already reached is only left once the
+        value drops 10% below its limit, so the app doesn't flap."""
+        def over(value, limit, level):
+            if not limit or value is None:
+                return False
+            return value >= (limit * 0.9 if self.level >= level else limit)
+
+        if over(stats['rss_mb'], self.rss_hard_mb, LEVEL_HARD):
+            return LEVEL_HARD
+        if (over(stats['rss_mb'], self.rss_soft_mb, LEVEL_SOFT)
+                or over(stats['threads'], self.max_threads, LEVEL_SOFT)
+                or over(stats['fds'], self.max_fds, LEVEL_SOFT)):
+            return LEVEL_SOFT
+        return LEVEL_OK
+
+    def _top_allocations(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ])
+        top = [{'where': str(s.traceback[0]), 'size_kb': round(s.size / 1024, 1), 'count': s.count}
+               for s in snapshot.statistics('lineno')[:self.top]]
+        growth = []
+        if self._previous_trace is not None:
+            growth = [{'where': str(s.traceback[0]), 'size_diff_kb': round(s.size_diff / 1024, 1)}
+                      for s in snapshot.compare_to(self._previous_trace, 'lineno')[:self.top]
+                      if s.size_diff > 0]
+        self._previous_trace = snapshot
+        return top, growth
+
+    def snapshot(self, stats, reason='periodic'):
+        """Append one JSON line with the sample (and allocators when tracing)"""
+        if not self.snapshot_dir:
+            return
+        record = dict(stats, reason=reason, level=self.level, peak_rss_mb=self.peak_rss_mb)
+        if self.trace_allocations:
+            record['top_allocations'], record['growth'] = self._top_allocations()
+        with open(os.path.join(self.snapshot_dir, 'snapshots.jsonl'), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _set_level(self, level, stats):
+        previous, self.level = self.level, level
+        self.shedding = level > LEVEL_OK
+        if level > previous:
+            self.shed_count += 1
+            print(f"⚠ Watchdog: {'hard' if level == LEVEL_HARD else 'soft'} limit "
+                  f"(RSS {stats['rss_mb']} MB, {stats['threads']} threads, {stats['fds']} fds), shedding load")
+            if self.on_shed is not None:
+                self.on_shed(level)
+            if level == LEVEL_HARD:
+                gc.collect()
+                _malloc_trim()
+        elif level == LEVEL_OK:
+            print(f"✓ Watchdog: back under limits (RSS {stats['rss_mb']} MB), resuming")
+            if self.on_recover is not None:
+                self.on_recover()
+        self.snapshot(stats, reason=f'level {previous} -> {level}')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            stats = self.sample()
+            self.last = stats
+            self.peak_rss_mb = max(self.peak_rss_mb, stats['rss_mb'] or 0.0)
+            self._samples += 1
+
+            level = self.check(stats)
+            if level != self.level:
+                self._set_level(level, stats)
+            elif self._samples % self.snapshot_every == 0:
+                self.snapshot(stats)
+
+            if self.print_every and self._samples % self.print_every == 0:
+                print("📊 " + self.format_stats(stats))
+
+    def format_stats(self, stats=None):
+        stats = stats or self.last
+        parts = [f"RSS {stats.get('rss_mb')} MB", f"threads {stats.get('threads')}", f"fds {stats.get('fds')}"]
+        skip = {'time', 'rss_mb', 'threads', 'py_threads', 'fds', 'gc_objects'}
+        parts += [f"{k} {v}" for k, v in stats.items() if k not in skip and v is not None]
+        if self.shedding:
+            parts.append('SHEDDING')
+        return ' | '.join(parts)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+        if self.last:
+            self.snapshot(self.last, reason='shutdown')
+
+
+def summarize(path):
+    """Print RSS/thread/fd trends from a snapshots file"""
+    with open(path) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    if not rows:
+        print("  No snapshots")
+        return
+    first, last = rows[0], rows[-1]
+    hours = (last['time'] - first['time']) / 3600 or 1e-9
+    print(f"  Snapshots: {len(rows)} over {hours:.1f} h")
+    for key in ('rss_mb', 'threads', 'fds'):
+        values = [r[key] for r in rows if r.get(key) is not None]
+        if values:
+            print(f"  {key:<8} first {values[0]:>8} last {values[-1]:>8} max {max(values):>8} "
+                  f"({(values[-1] - values[0]) / hours:+.1f}/h)")
+    events = [r for r in rows if r.get('reason', '').startswith('level')]
+    print(f"  Level changes: {len(events)}")
+    for r in events[-5:]:
+        print(f"    {time.strftime('%Y-%m-%d %H:%M', time.localtime(r['time']))} {r['reason']} (RSS {r['rss_mb']} MB)")
+    growth = last.get('growth') or []
+    if growth:
+        print(f"  Largest growth in the last snapshot:")
+        for g in growth[:5]:
+            print(f"    {g['size_diff_kb']:+10.1f} KB  {g['where']}")
+
+
+if __name__ == '__main__':
+    summarize(sys.argv[1] if len(sys.argv) > 1 else 'watchdog/snapshots.jsonl')
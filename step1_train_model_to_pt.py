@@ -7,8 +7,162 @@ This script trains a YOLOv8 model for ear detection using the Ultralytics framew
 from ultralytics import YOLO
 import torch
 import os
+import json
+import time
 from pathlib import Path
 
+from dataset_check import preflight
+
+def _read_meminfo_mb(key):
+    """Read a value from /proc/meminfo in MB (Linux only)"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def _process_tree_rss_mb():
+    """RSS of this process plus its dataloader worker children in MB"""
+    pids = [os.getpid()]
+    try:
+        for tid in os.listdir('/proc/self/task'):
+            with open(f'/proc/self/task/{tid}/children') as f:
+                pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total / 1024
+
+def probe_throughput(model_size, data_yaml, imgsz, batch, workers, threads, steps=4, warmup=1):
+    """Time a few real training steps on CPU, returning (images/sec, peak RSS MB)"""
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_dataloader, build_yolo_dataset
+    from ultralytics.data.utils import check_det_dataset
+
+    torch.set_num_threads(threads)
+    cfg = get_cfg(overrides={'imgsz': imgsz, 'batch': batch, 'workers': workers})
+    data = check_det_dataset(data_yaml)
+    dataset = build_yolo_dataset(cfg, data['train'], batch, data, mode='train')
+    loader = build_dataloader(dataset, batch, workers, shuffle=True)
+
+    net = YOLO(model_size).model
+    net.args = cfg
+    net.train()
+    for p in net.parameters():
+        p.requires_grad = True
+    optimizer = torch.optim.SGD(net.parameters(), lr=1e-3, momentum=0.9)
+
+    peak_rss = 0.0
+    images = 0
+    start = None
+    for i, batch_data in enumerate(loader):
+        if i == warmup:
+            start = time.perf_counter()
+        batch_data['img'] = batch_data['img'].float() / 255
+        loss, _ = net.loss(batch_data)
+        optimizer.zero_grad()
+        loss.sum().backward()
+        optimizer.step()
+        peak_rss = max(peak_rss, _process_tree_rss_mb())
+        if i >= warmup:
+            images += batch_data['img'].shape[0]
+        if i + 1 >= warmup + steps:
+            break
+
+    elapsed = time.perf_counter() - start if start else 0
+    del loader, net, optimizer
+    return (images / elapsed if elapsed > 0 else 0.0), peak_rss
+
+def estimate_ram_cache_mb(data_yaml, imgsz):
+    """Memory ultralytics' cache=True takes: every train image resized to
+    imgsz on its long side, stored as uint8 RGB. Sizes come from the headers."""
+    from dataset_check import image_header, split_images
+    splits, _ = split_images(data_yaml)
+    total = 0
+    for path in splits.get('train', ([], None))[0]:
+        try:
+            width, height, _ = image_header(path)
+        except (OSError, ValueError):
+            continue
+        if width and height:
+            scale = imgsz / max(width, height)
+            total += round(width * scale) * round(height * scale) * 3
+    return total / (1024 * 1024)
+
+def autotune_cpu_training(model_size, data_yaml, imgsz, memory_ceiling_mb,
+                          batch_sizes=(8, 16, 32), output_path=None, cache_mb=0.0):
+    """Pick the fastest batch size and torch threads under a memory ceiling.
+    Searches one dimension at a time to keep the probe short.
+
+    Workers are not tuned: on CPU the ultralytics trainer forces workers=0,
+    so the probe loads data in the main process as the real run will.
+    cache_mb (the RAM image cache) is added to every probe's peak RSS."""
+    print(f"\n{'='*60}")
+    print("Auto-tuning CPU training configuration...")
+    print(f"{'='*60}")
+
+    cpus = os.cpu_count() or 1
+    workers = 0  # What BaseTrainer uses on CPU
+    thread_options = sorted({max(1, cpus // 2), cpus})
+    print(f"  CPUs: {cpus}, memory ceiling: {memory_ceiling_mb:.0f} MB, image cache: {cache_mb:.0f} MB")
+
+    results = []
+
+    def trial(batch, workers, threads):
+        try:
+            ips, rss = probe_throughput(model_size, data_yaml, imgsz, batch, workers, threads)
+            rss += cache_mb
+        except RuntimeError as e:  # Typically out of memory
+            print(f"  batch={batch:3d} workers={workers:2d} threads={threads:2d}: failed ({e})")
+            return None
+        safe = rss <= memory_ceiling_mb
+        results.append({'batch': batch, 'workers': workers, 'threads': threads,
+                        'images_per_sec': round(ips, 2), 'peak_rss_mb': round(rss), 'safe': safe})
+        flag = '' if safe else '  ⚠ over memory ceiling'
+        print(f"  batch={batch:3d} workers={workers:2d} threads={threads:2d}: {ips:6.2f} img/s, {rss:6.0f} MB{flag}")
+        return ips if safe else None
+
+    def best_of(candidates, make):
+        best, best_ips = None, -1.0
+        for c in candidates:
+            ips = trial(*make(c))
+            if ips is None:
+                break  # Larger values will only use more memory
+            if ips > best_ips:
+                best, best_ips = c, ips
+        return best, best_ips
+
+    batch, _ = best_of(batch_sizes, lambda b: (b, workers, cpus))
+    if batch is None:
+        print("⚠ No batch size fits under the memory ceiling, keeping defaults")
+        return None
+    threads, ips = best_of(thread_options, lambda t: (batch, workers, t))
+    if threads is None:
+        threads = cpus
+
+    best = {'batch': batch, 'workers': workers, 'threads': threads, 'images_per_sec': round(ips, 2)}
+    print(f"\n✓ Selected batch={batch}, threads={threads} ({ips:.2f} img/s)")
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(output_path, 'w') as f:
+            json.dump({'selected': best, 'trials': results}, f, indent=2)
+        print(f"  Probe results saved to: {output_path}")
+    return best
+
 def main():
     print("="*60)
     print("STEP 1: Training YOLO Model for Ear Detection")
@@ -20,8 +174,12 @@ def main():
     EPOCHS = 100
     IMGSZ = 640
     BATCH = 16
+    WORKERS = 8
     PROJECT = 'runs/train'
     NAME = 'ear_detection'
+    AUTOTUNE_CPU = True  # Probe batch/workers/threads before training on CPU
+    PREFLIGHT_DATASET = True  # Check image headers and labels before training (see dataset_check.py)
+    MEMORY_CEILING_FRACTION = 0.7  # Fraction of system RAM the probe may use
     
     # Check if MPS (Apple Silicon GPU) is available
     if torch.backends.mps.is_available():
@@ -35,12 +193,33 @@ def main():
     if not os.path.exists(DATA_YAML):
         raise FileNotFoundError(f"Data configuration file '{DATA_YAML}' not found!")
     
+    if PREFLIGHT_DATASET and not preflight(DATA_YAML, IMGSZ):
+        print("Fix the problems above, or see: python dataset_check.py")
+        return
+    
+    if device == 'cpu' and AUTOTUNE_CPU:
+        total_mb = _read_meminfo_mb('MemTotal')
+        if total_mb:
+            tuned = autotune_cpu_training(
+                MODEL_SIZE, DATA_YAML, IMGSZ,
+                memory_ceiling_mb=total_mb * MEMORY_CEILING_FRACTION,
+                output_path=os.path.join(PROJECT, f"{NAME}_autotune.json"),
+                cache_mb=estimate_ram_cache_mb(DATA_YAML, IMGSZ),  # cache=True below
+            )
+            if tuned:
+                BATCH = tuned['batch']
+                WORKERS = tuned['workers']
+                torch.set_num_threads(tuned['threads'])
+        else:
+            print("⚠ Cannot read system memory, skipping auto-tuning")
+    
     print(f"\nTraining Configuration:")
     print(f"  Model: {MODEL_SIZE}")
     print(f"  Device: {device}")
     print(f"  Epochs: {EPOCHS}")
     print(f"  Image Size: {IMGSZ}")
     print(f"  Batch Size: {BATCH}")
+    print(f"  Workers: {WORKERS}")
     print(f"  Data Config: {DATA_YAML}")
     
     # Load YOLO model
@@ -58,6 +237,7 @@ def main():
         epochs=EPOCHS,
         imgsz=IMGSZ,
         batch=BATCH,
+        workers=WORKERS,
         device=device,
         project=PROJECT,
         name=NAME,
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Step 1b: Structured channel pruning (optional, after step 1)
+Removes the least important conv channels of the trained model, fine-tunes
+each pruned model on the dataset and exports it through the step 2 ONNX
+path, then reports accuracy, FLOPs and latency for every pruning ratio.
+Runs entirely on CPU.
+
+Only channels that stay inside a block are pruned (Bottleneck hidden
+channels, the SPPF bottleneck and the Detect head branches), so residual
+adds, C2f splits and concatenations keep their widths and the pruned model
+is still a standard YOLOv8 graph for the Hailo compiler.
+"""
+
+from ultralytics import YOLO
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.nn.modules import Bottleneck, SPPF, Detect
+import torch
+import torch.nn as nn
+import os
+import json
+from pathlib import Path
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+
+from benchmark import measure
+from step2_file_pt_to_file_onnx import export_pt_to_onnx, static_cost_report
+
+
+class PrunedDetectionTrainer(DetectionTrainer):
+    """Trainer that fine-tunes the model it is given.
+    The default trainer rebuilds the network from its yaml and copies
+    matching weights, which would silently restore the original widths."""
+
+    def get_model(self, cfg=None, weights=None, verbose=True):
+        if weights is None:
+            raise ValueError("PrunedDetectionTrainer needs the pruned model as weights")
+        return weights
+
+
+def _is_conv(m):
+    """ultralytics Conv block (conv + bn + act)"""
+    return hasattr(m, 'conv') and hasattr(m, 'bn') and isinstance(m.conv, nn.Conv2d)
+
+
+def _conv2d(m):
+    return m.conv if _is_conv(m) else m
+
+
+def prunable_groups(model):
+    """(producer Conv block, consumer Conv2d, repeats) for every channel set
+    that is produced and consumed inside one block. repeats > 1 means the
+    consumer sees the producer's channels several times (SPPF concat)."""
+    groups = []
+    for m in model.modules():
+        if isinstance(m, Bottleneck):
+            groups.append((m.cv1, m.cv2, 1))
+        elif isinstance(m, SPPF):
+            groups.append((m.cv1, m.cv2, 4))
+        elif isinstance(m, Detect):
+            for branch in list(m.cv2) + list(m.cv3):
+                if len(branch) == 3 and _is_conv(branch[0]) and _is_conv(branch[1]):
+                    groups.append((branch[0], branch[1], 1))
+                    groups.append((branch[1], branch[2], 1))
+    return [(p, c, r) for p, c, r in groups
+            if _is_conv(p) and p.conv.groups == 1 and _conv2d(c).groups == 1]
+
+
+def channel_importance(block, method='bn'):
+    """Per output channel score: |BN gamma| (network slimming) or filter L1 norm"""
+    if method == 'bn':
+        return block.bn.weight.detach().abs()
+    return block.conv.weight.detach().abs().sum(dim=(1, 2, 3))
+
+
+def _keep_count(channels, ratio, multiple=8):
+    """Channels to keep, rounded to a multiple of 8 for the accelerator's lanes"""
+    keep = int(round(channels * (1.0 - ratio) / multiple)) * multiple
+    return min(channels, max(multiple, keep))
+
+
+def _prune_out(block, idx):
+    conv, bn = block.conv, block.bn
+    conv.weight = nn.Parameter(conv.weight.data[idx].clone())
+    if conv.bias is not None:
+        conv.bias = nn.Parameter(conv.bias.data[idx].clone())
+    conv.out_channels = len(idx)
+    bn.weight = nn.Parameter(bn.weight.data[idx].clone())
+    bn.bias = nn.Parameter(bn.bias.data[idx].clone())
+    bn.running_mean = bn.running_mean[idx].clone()
+    bn.running_var = bn.running_var[idx].clone()
+    bn.num_features = len(idx)
+
+
+def _prune_in(consumer, idx):
+    conv = _conv2d(consumer)
+    conv.weight = nn.Parameter(conv.weight.data[:, idx].clone())
+    conv.in_channels = len(idx)
+
+
+def prune_model(model, ratio, method='bn'):
+    """Remove `ratio` of the channels of every prunable group in place.
+    Returns (channels before, channels after)."""
+    before = after = 0
+    for producer, consumer, repeats in prunable_groups(model):
+        channels = producer.conv.out_channels
+        keep = _keep_count(channels, ratio)
+        before += channels
+        after += keep
+        if keep == channels:
+            continue
+        idx = torch.argsort(channel_importance(producer, method), descending=True)[:keep]
+        idx = torch.sort(idx).values
+        _prune_out(producer, idx)
+        _prune_in(consumer, torch.cat([idx + k * channels for k in range(repeats)]))
+    return before, after
+
+
+def onnx_latency_ms(onnx_path, threads=None):
+    """Single-image CPU latency of an exported model (ONNX Runtime)"""
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads or os.cpu_count() or 1
+    session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+    inp = session.get_inputs()[0]
+    data = np.random.default_rng(0).random([d if isinstance(d, int) else 1 for d in inp.shape]).astype(np.float32)
+    seconds, _ = measure(lambda: session.run(None, {inp.name: data}), min_time=2.0)
+    return seconds * 1000
+
+
+def evaluate_variant(pt_path, onnx_path, data_yaml, imgsz, batch, project, name):
+    """mAP on the validation split plus FLOPs and CPU latency of the ONNX export"""
+    metrics = YOLO(pt_path).val(data=data_yaml, imgsz=imgsz, batch=batch, device='cpu',
+                                plots=False, project=project, name=f"{name}_val", exist_ok=True)
+    _, totals = static_cost_report(onnx.load(onnx_path))
+    return {
+        'weights': str(pt_path),
+        'onnx': onnx_path,
+        'map50': round(float(metrics.box.map50), 4),
+        'map50_95': round(float(metrics.box.map), 4),
+        'gflops': round(totals['flops'] / 1e9, 2),
+        'params_mb': round(totals['param_bytes'] / (1024 * 1024), 2),
+        'cpu_latency_ms': round(onnx_latency_ms(onnx_path), 2),
+    }
+
+
+def main():
+    print("="*60)
+    print("STEP 1b: Structured Channel Pruning")
+    print("="*60)
+
+    # Configuration
+    PT_MODEL_PATH = 'runs/train/ear_detection/weights/best.pt'
+    DATA_YAML = 'data.yaml'
+    PRUNE_RATIOS = [0.2, 0.3, 0.5]  # Fraction of prunable channels removed
+    IMPORTANCE = 'bn'  # 'bn' (|BN gamma|) or 'l1' (filter L1 norm)
+    FINETUNE_EPOCHS = 30
+    IMGSZ = 640
+    BATCH = 16
+    WORKERS = 8
+    PROJECT = 'runs/prune'
+    ONNX_DIR = 'models/onnx'
+    AUTOTUNE_RESULT = 'runs/train/ear_detection_autotune.json'  # Written by step 1
+
+    if not os.path.exists(PT_MODEL_PATH):
+        print(f"\n❌ Error: Model file not found: {PT_MODEL_PATH}")
+        print("Train a model first: python step1_train_model_to_pt.py")
+        return
+
+    if os.path.exists(AUTOTUNE_RESULT):
+        with open(AUTOTUNE_RESULT) as f:
+            tuned = json.load(f)['selected']
+        BATCH, WORKERS = tuned['batch'], tuned['workers']
+        torch.set_num_threads(tuned['threads'])
+        print(f"✓ Using step 1 auto-tuned batch={BATCH}, workers={WORKERS}, threads={tuned['threads']}")
+
+    print(f"\nPruning Configuration:")
+    print(f"  Model: {PT_MODEL_PATH}")
+    print(f"  Ratios: {PRUNE_RATIOS}")
+    print(f"  Importance: {IMPORTANCE}")
+    print(f"  Fine-tune epochs: {FINETUNE_EPOCHS}")
+    print(f"  Device: cpu")
+
+    report = []
+
+    # Unpruned reference through the same export and evaluation path
+    print(f"\n{'='*60}")
+    print("Evaluating unpruned model...")
+    print(f"{'='*60}")
+    base_onnx = export_pt_to_onnx(PT_MODEL_PATH, ONNX_DIR, imgsz=IMGSZ,
+                                  output_name='ear_detection_pruned00.onnx', profile=False)
+    base = evaluate_variant(PT_MODEL_PATH, base_onnx, DATA_YAML, IMGSZ, BATCH, PROJECT, 'ratio_00')
+    report.append(dict(ratio=0.0, channels_kept=1.0, **base))
+
+    for ratio in PRUNE_RATIOS:
+        tag = f"ratio_{int(round(ratio * 100)):02d}"
+        print(f"\n{'='*60}")
+        print(f"Pruning {ratio * 100:.0f}% of channels ({tag})...")
+        print(f"{'='*60}")
+
+        model = YOLO(PT_MODEL_PATH)
+        before, after = prune_model(model.model, ratio, IMPORTANCE)
+        print(f"✓ Prunable channels: {before} -> {after}")
+
+        model.train(
+            data=DATA_YAML,
+            trainer=PrunedDetectionTrainer,
+            epochs=FINETUNE_EPOCHS,
+            imgsz=IMGSZ,
+            batch=BATCH,
+            workers=WORKERS,
+            device='cpu',
+            project=PROJECT,
+            name=tag,
+            exist_ok=True,
+            lr0=0.002,  # Fine-tuning: start well below the from-scratch rate
+            warmup_epochs=1,
+            plots=False,
+            verbose=False,
+        )
+
+        pt_path = Path(PROJECT) / tag / 'weights' / 'best.pt'
+        onnx_path = export_pt_to_onnx(str(pt_path), ONNX_DIR, imgsz=IMGSZ,
+                                      output_name=f"ear_detection_pruned{tag[-2:]}.onnx", profile=False)
+        result = evaluate_variant(pt_path, onnx_path, DATA_YAML, IMGSZ, BATCH, PROJECT, tag)
+        report.append(dict(ratio=ratio, channels_kept=round(after / before, 3), **result))
+
+    report_path = os.path.join(PROJECT, 'prune_report.json')
+    os.makedirs(PROJECT, exist_ok=True)
+    with open(report_path, 'w') as f:
+        json.dump({'importance': IMPORTANCE, 'finetune_epochs': FINETUNE_EPOCHS, 'variants': report}, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print("Pruning Trade-off:")
+    print(f"{'='*60}")
+    print(f"  {'ratio':>5} {'mAP50':>7} {'mAP50-95':>9} {'GFLOPs':>7} {'CPU ms':>7}  ONNX")
+    for r in report:
+        print(f"  {r['ratio']:5.2f} {r['map50']:7.4f} {r['map50_95']:9.4f} {r['gflops']:7.2f} "
+              f"{r['cpu_latency_ms']:7.2f}  {r['onnx']}")
+    print(f"\n✓ Report saved to: {report_path}")
+
+    print(f"\n{'='*60}")
+    print("Next Steps:")
+    print(f"{'='*60}")
+    print("1. Pick the largest ratio whose mAP drop is acceptable")
+    print("2. Add its ONNX file to ONNX_VARIANTS in step3_file_onnx_to_file_hef.py")
+    print("   (several variants compile side by side) and compare FPS on the Pi")
+    print(f"{'='*60}\n")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Step 1c: Quantization-aware fine-tuning (optional, after step 1 / 1b)
+The Hailo compiler quantizes the model to INT8, which costs accuracy that a
+model trained only in FP32 never learned to tolerate. This stage folds
+BatchNorm into the convolutions (as the compiler does), inserts fake
+quantization (per-channel symmetric weights, per-tensor activations) and
+fine-tunes for a few epochs on CPU, so the weights settle where rounding
+hurts least.
+
+The fake-quant wrappers are stripped again before export, so step 2 gets a
+normal fused YOLOv8 checkpoint and the Hailo compiler does the real
+quantization. The report puts FP32 and simulated INT8 mAP side by side for
+the original model (post-training quantization) and the QAT model.
+"""
+
+from ultralytics import YOLO
+from ultralytics.cfg import get_cfg
+from ultralytics.data import build_dataloader, build_yolo_dataset
+from ultralytics.data.utils import check_det_dataset
+from ultralytics.models.yolo.detect import DetectionValidator
+from ultralytics.nn.modules import Conv, DFL
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import os
+import json
+from copy import deepcopy
+from pathlib import Path
+
+from step1b_prune_model import PrunedDetectionTrainer
+from step2_file_pt_to_file_onnx import export_pt_to_onnx
+
+LAYER_ATTRS = ('i', 'f', 'type', 'np')  # Set by ultralytics on top-level layers
+
+
+def fake_quant_weight(weight, bits=8):
+    """Symmetric per-output-channel fake quantization (straight-through gradient)"""
+    qmax = 2 ** (bits - 1) - 1
+    scale = weight.detach().abs().amax(dim=(1, 2, 3)).clamp(min=1e-8) / qmax
+    zero_point = torch.zeros_like(scale, dtype=torch.int32)
+    return torch.fake_quantize_per_channel_affine(weight, scale, zero_point, 0, -qmax, qmax)
+
+
+class ActivationFakeQuant(nn.Module):
+    """Per-tensor asymmetric 8-bit fake quantization.
+    The range is an EMA of the batch min/max, updated in training mode only.
+    All state is in float buffers so the trainer's weight EMA carries it."""
+
+    def __init__(self, bits=8, momentum=0.01):
+        super().__init__()
+        self.qmax = 2 ** bits - 1
+        self.momentum = momentum
+        self.register_buffer('min_val', torch.zeros(1))
+        self.register_buffer('max_val', torch.zeros(1))
+        self.register_buffer('initialized', torch.zeros(1))
+
+    def forward(self, x):
+        if self.training:
+            with torch.no_grad():
+                lo, hi = x.detach().min().reshape(1), x.detach().max().reshape(1)
+                if self.initialized.item() == 0:
+                    self.min_val.copy_(lo)
+                    self.max_val.copy_(hi)
+                    self.initialized.fill_(1)
+                else:
+                    self.min_val.lerp_(lo, self.momentum)
+                    self.max_val.lerp_(hi, self.momentum)
+        if self.initialized.item() == 0:
+            return x
+        lo, hi = self.min_val.clamp(max=0.0), self.max_val.clamp(min=0.0)
+        scale = ((hi - lo) / self.qmax).clamp(min=1e-8).float()
+        zero_point = torch.round(-lo / scale).clamp(0, self.qmax).to(torch.int32)
+        return torch.fake_quantize_per_tensor_affine(x, scale, zero_point, 0, self.qmax)
+
+
+class QuantConv(nn.Module):
+    """Fused conv (+ activation) with fake-quantized weights and output.
+    Keeps the `conv` / `act` attribute names of the ultralytics Conv block so
+    stripping restores the original module paths."""
+
+    def __init__(self, conv, act=None, block=True):
+        super().__init__()
+        self.conv = conv
+        self.act = act if act is not None else nn.Identity()
+        self.act_quant = ActivationFakeQuant()
+        self.block = block  # False: a bare nn.Conv2d (Detect head output)
+
+    def forward(self, x):
+        c = self.conv
+        y = F.conv2d(x, fake_quant_weight(c.weight), c.bias, c.stride, c.padding, c.dilation, c.groups)
+        return self.act_quant(self.act(y))
+
+
+def _copy_layer_attrs(src, dst):
+    for attr in LAYER_ATTRS:
+        if hasattr(src, attr):
+            setattr(dst, attr, getattr(src, attr))
+
+
+def _replace(model, predicate, build):
+    """Swap every submodule matching predicate for build(module); returns the count"""
+    targets = [(parent, name, child)
+               for parent in model.modules() if not isinstance(parent, (QuantConv, DFL))
+               for name, child in parent.named_children() if predicate(parent, child)]
+    for parent, name, child in targets:
+        new = build(child)
+        _copy_layer_attrs(child, new)
+        setattr(parent, name, new)
+    return len(targets)
+
+
+def prepare_qat(model):
+    """Fold BN and wrap every conv in fake quantization, in place.
+    Returns the number of wrapped layers."""
+    model.fuse(verbose=False)  # Conv + BN -> Conv with bias, as the Hailo compiler does
+    return _replace(
+        model,
+        lambda parent, m: (isinstance(m, Conv) and not hasattr(m, 'bn')) or
+                          (type(m) is nn.Conv2d and not isinstance(parent, Conv)),
+        lambda m: QuantConv(m.conv, m.act) if isinstance(m, Conv) else QuantConv(m, block=False),
+    )
+
+
+def _strip(q):
+    if not q.block:
+        return q.conv
+    # Conv.__init__ can't take the conv's tuple kernel/padding/dilation back,
+    # and would only build layers to throw away: assemble the fused block directly
+    block = Conv.__new__(Conv)
+    nn.Module.__init__(block)
+    block.conv = q.conv
+    block.act = q.act
+    block.forward = block.forward_fuse  # Same state ultralytics' own fuse() leaves
+    return block
+
+
+def strip_fake_quant(model):
+    """Replace the wrappers with plain fused ultralytics modules, in place"""
+    return _replace(model, lambda parent, m: isinstance(m, QuantConv), _strip)
+
+
+@torch.no_grad()
+def check_round_trip(model, imgsz):
+    """Max output difference between the fused model and prepare_qat ->
+    strip_fake_quant of a copy; anything above float noise means a layer
+    was lost or rebuilt wrongly on the way to the export checkpoint"""
+    fused = deepcopy(model).float().eval()
+    fused.fuse(verbose=False)
+    stripped = deepcopy(model).float().eval()
+    prepare_qat(stripped)
+    strip_fake_quant(stripped)
+    x = torch.rand(1, 3, imgsz, imgsz)
+    return float((stripped(x)[0] - fused(x)[0]).abs().max())
+
+
+@torch.no_grad()
+def calibrate(model, data_yaml, imgsz, batch, workers, batches=32):
+    """Initialise the activation ranges from training images"""
+    cfg = get_cfg(overrides={'imgsz': imgsz, 'batch': batch, 'workers': workers})
+    data = check_det_dataset(data_yaml)
+    dataset = build_yolo_dataset(cfg, data['train'], batch, data, mode='val')
+    loader = build_dataloader(dataset, batch, workers, shuffle=True)
+
+    model.train()  # BN is folded, so train mode only switches the range observers on
+    for i, batch_data in enumerate(loader):
+        if i >= batches:
+            break
+        model(batch_data['img'].float() / 255)
+    model.eval()
+
+
+def validate(model, data_yaml, imgsz, batch, project, name):
+    """(mAP50, mAP50-95) of an in-memory model on the validation split"""
+    validator = DetectionValidator(args=dict(
+        data=data_yaml, imgsz=imgsz, batch=batch, device='cpu', half=False,
+        plots=False, project=project, name=f"{name}_val", exist_ok=True,
+    ))
+    validator(model=deepcopy(model))
+    return round(float(validator.metrics.box.map50), 4), round(float(validator.metrics.box.map), 4)
+
+
+def save_checkpoint(model, path, train_args):
+    """Checkpoint loadable by YOLO() (and therefore by step 2)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.save({'model': deepcopy(model).half(), 'train_args': train_args}, path)
+
+
+def main():
+    print("="*60)
+    print("STEP 1c: Quantization-Aware Fine-Tuning")
+    print("="*60)
+
+    # Configuration
+    PT_MODEL_PATH = 'runs/train/ear_detection/weights/best.pt'  # Or a pruned model from step 1b
+    DATA_YAML = 'data.yaml'
+    QAT_EPOCHS = 5
+    CALIBRATION_BATCHES = 32
+    IMGSZ = 640
+    BATCH = 16
+    WORKERS = 8
+    PROJECT = 'runs/qat'
+    NAME = 'ear_detection_qat'
+    ONNX_DIR = 'models/onnx'
+    AUTOTUNE_RESULT = 'runs/train/ear_detection_autotune.json'  # Written by step 1
+
+    if not os.path.exists(PT_MODEL_PATH):
+        print(f"\n❌ Error: Model file not found: {PT_MODEL_PATH}")
+        print("Train a model first: python step1_train_model_to_pt.py")
+        return
+
+    if os.path.exists(AUTOTUNE_RESULT):
+        with open(AUTOTUNE_RESULT) as f:
+            tuned = json.load(f)['selected']
+        BATCH, WORKERS = tuned['batch'], tuned['workers']
+        torch.set_num_threads(tuned['threads'])
+        print(f"✓ Using step 1 auto-tuned batch={BATCH}, workers={WORKERS}, threads={tuned['threads']}")
+
+    print(f"\nQAT Configuration:")
+    print(f"  Model: {PT_MODEL_PATH}")
+    print(f"  Weights: INT8 per-channel symmetric")
+    print(f"  Activations: UINT8 per-tensor")
+    print(f"  Epochs: {QAT_EPOCHS}")
+    print(f"  Device: cpu")
+
+    # FP32 reference and post-training quantization of the same weights
+    print(f"\n{'='*60}")
+    print("Evaluating FP32 model and simulated INT8 (post-training)...")
+    print(f"{'='*60}")
+    model = YOLO(PT_MODEL_PATH)
+    train_args = model.ckpt.get('train_args', {})
+    diff = check_round_trip(model.model, IMGSZ)
+    if diff > 1e-3:
+        print(f"\n❌ Error: wrapping and stripping changes the model output (max diff {diff:.2e})")
+        return
+    print(f"✓ Wrap/strip round trip matches the fused model (max diff {diff:.1e})")
+    fp32 = validate(model.model, DATA_YAML, IMGSZ, BATCH, PROJECT, 'fp32')
+
+    wrapped = prepare_qat(model.model)
+    print(f"✓ Fake quantization on {wrapped} conv layers")
+    calibrate(model.model, DATA_YAML, IMGSZ, BATCH, WORKERS, CALIBRATION_BATCHES)
+    ptq_int8 = validate(model.model, DATA_YAML, IMGSZ, BATCH, PROJECT, 'ptq_int8')
+
+    # Fine-tune with fake quantization in the loop
+    print(f"\n{'='*60}")
+    print(f"Fine-tuning with fake quantization ({QAT_EPOCHS} epochs)...")
+    print(f"{'='*60}")
+    model.train(
+        data=DATA_YAML,
+        trainer=PrunedDetectionTrainer,  # Fine-tunes the given model instead of rebuilding it
+        epochs=QAT_EPOCHS,
+        imgsz=IMGSZ,
+        batch=BATCH,
+        workers=WORKERS,
+        device='cpu',
+        project=PROJECT,
+        name=NAME,
+        exist_ok=True,
+        optimizer='SGD',
+        lr0=0.001,  # Small steps: the weights only need to move to quantization-friendly values
+        warmup_epochs=0,
+        close_mosaic=0,
+        amp=False,
+        plots=False,
+        verbose=False,
+    )
+
+    qat_dir = Path(model.trainer.save_dir) / 'weights'  # Newer ultralytics nest relative projects under runs/<task>
+    # best.pt still holds the wrappers pickled as __main__.QuantConv, so only this
+    # script can load it; qat_fp32.pt below is the plain checkpoint for step 2
+    qat = YOLO(str(qat_dir / 'best.pt'))
+    qat_int8 = validate(qat.model, DATA_YAML, IMGSZ, BATCH, PROJECT, 'qat_int8')
+    strip_fake_quant(qat.model)
+    qat_fp32 = validate(qat.model, DATA_YAML, IMGSZ, BATCH, PROJECT, 'qat_fp32')
+
+    # Plain fused checkpoint through the normal step 2 export
+    export_pt = str(qat_dir / 'qat_fp32.pt')
+    save_checkpoint(qat.model, export_pt, train_args)
+    onnx_path = export_pt_to_onnx(export_pt, ONNX_DIR, imgsz=IMGSZ,
+                                  output_name='ear_detection_qat.onnx', profile=False)
+
+    report = {
+        'model': PT_MODEL_PATH,
+        'epochs': QAT_EPOCHS,
+        'weights': export_pt,
+        'onnx': onnx_path,
+        'variants': [
+            {'name': 'original', 'fp32_map50': fp32[0], 'fp32_map50_95': fp32[1],
+             'int8_map50': ptq_int8[0], 'int8_map50_95': ptq_int8[1]},
+            {'name': 'qat', 'fp32_map50': qat_fp32[0], 'fp32_map50_95': qat_fp32[1],
+             'int8_map50': qat_int8[0], 'int8_map50_95': qat_int8[1]},
+        ],
+    }
+    os.makedirs(PROJECT, exist_ok=True)
+    report_path = os.path.join(PROJECT, 'qat_report.json')
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'='*60}")
+    print("FP32 vs Simulated INT8:")
+    print(f"{'='*60}")
+    print(f"  {'model':<9} {'FP32 mAP50':>10} {'INT8 mAP50':>10} {'drop':>7} {'FP32 50-95':>10} {'INT8 50-95':>10}")
+    for v in report['variants']:
+        print(f"  {v['name']:<9} {v['fp32_map50']:10.4f} {v['int8_map50']:10.4f} "
+              f"{v['int8_map50'] - v['fp32_map50']:+7.4f} {v['fp32_map50_95']:10.4f} {v['int8_map50_95']:10.4f}")
+    print(f"\n✓ Report saved to: {report_path}")
+    print(f"✓ ONNX model: {onnx_path}")
+
+    print(f"\n{'='*60}")
+    print("Next Steps:")
+    print(f"{'='*60}")
+    print("1. Compare the INT8 columns: QAT should close most of the quantization gap")
+    print("2. Add the ONNX file to ONNX_VARIANTS in step3_file_onnx_to_file_hef.py")
+    print("   and compare its accuracy on the Pi against the post-training variant")
+    print(f"{'='*60}\n")
+
+if __name__ == '__main__':
+    main()
@@ -6,11 +6,226 @@ This script exports a trained YOLOv8 model to ONNX format for deployment.
 
 from ultralytics import YOLO
 import os
+import json
+import shutil
 from pathlib import Path
+import numpy as np
 import onnx
 import onnxsim
+from onnx import helper, numpy_helper, shape_inference, TensorProto
 
-def verify_onnx_model(onnx_path):
+# Ops whose cost is roughly one FLOP per output element
+ELEMENTWISE_OPS = {
+    'Add', 'Sub', 'Mul', 'Div', 'Sigmoid', 'Relu', 'LeakyRelu', 'HardSigmoid',
+    'HardSwish', 'Clip', 'Pow', 'Sqrt', 'Exp', 'Softmax', 'Tanh', 'Max', 'Min',
+}
+
+def _format_shape(tensor_type):
+    """Shape list keeping symbolic dims (dim_value is 0 for those)"""
+    return [d.dim_value if d.HasField('dim_value') else (d.dim_param or '?')
+            for d in tensor_type.shape.dim]
+
+def _tensor_info(model):
+    """Map tensor name -> (shape, itemsize) from inferred value info and initializers"""
+    info = {}
+    values = list(model.graph.input) + list(model.graph.value_info) + list(model.graph.output)
+    for v in values:
+        t = v.type.tensor_type
+        if not t.HasField('shape'):
+            continue
+        # Symbolic dims (batch) are costed as 1
+        shape = [d.dim_value if d.HasField('dim_value') else 1 for d in t.shape.dim]
+        itemsize = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(t.elem_type)).itemsize
+        info[v.name] = (shape, itemsize)
+    for init in model.graph.initializer:
+        itemsize = np.dtype(onnx.helper.tensor_dtype_to_np_dtype(init.data_type)).itemsize
+        info[init.name] = (list(init.dims), itemsize)
+    return info
+
+def _node_macs(node, info, out_elems):
+    """Multiply-accumulate count for the compute-heavy ops"""
+    if node.op_type == 'Conv' and node.input[1] in info:
+        w_shape = info[node.input[1]][0]  # [Cout, Cin/group, kh, kw]
+        return out_elems * int(np.prod(w_shape[1:]))
+    if node.op_type in ('MatMul', 'Gemm') and node.input[0] in info:
+        a_shape = info[node.input[0]][0]
+        k = a_shape[-1]
+        if node.op_type == 'Gemm':
+            trans_a = next((a.i for a in node.attribute if a.name == 'transA'), 0)
+            k = a_shape[0] if trans_a else a_shape[-1]
+        return out_elems * k
+    return 0
+
+def static_cost_report(model):
+    """Per-node MACs/FLOPs, parameter bytes, activation bytes and peak live memory.
+    Graph nodes are topologically sorted, so a single pass tracks tensor lifetimes."""
+    model = shape_inference.infer_shapes(model)
+    info = _tensor_info(model)
+    initializers = {init.name for init in model.graph.initializer}
+    graph_outputs = {o.name for o in model.graph.output}
+
+    def nbytes(name):
+        shape, itemsize = info.get(name, ([], 0))
+        return int(np.prod(shape)) * itemsize if shape else 0
+
+    last_use = {}
+    for i, node in enumerate(model.graph.node):
+        for name in node.input:
+            last_use[name] = i
+
+    live = {i.name: nbytes(i.name) for i in model.graph.input if i.name not in initializers}
+    live_bytes = sum(live.values())
+    peak = live_bytes
+
+    nodes = []
+    for i, node in enumerate(model.graph.node):
+        out_bytes = sum(nbytes(o) for o in node.output)
+        out_elems = sum(int(np.prod(info[o][0])) for o in node.output if o in info)
+        macs = _node_macs(node, info, out_elems)
+        flops = 2 * macs if macs else (out_elems if node.op_type in ELEMENTWISE_OPS else 0)
+        param_bytes = sum(nbytes(n) for n in node.input if n in initializers)
+
+        for o in node.output:
+            live[o] = nbytes(o)
+        live_bytes += out_bytes
+        peak = max(peak, live_bytes)
+
+        # Free inputs whose last consumer was this node
+        for name in set(node.input):
+            if last_use.get(name) == i and name in live and name not in graph_outputs:
+                live_bytes -= live.pop(name)
+
+        nodes.append({
+            'name': node.name or f'{node.op_type}_{i}',
+            'op_type': node.op_type,
+            'macs': macs,
+            'flops': flops,
+            'param_bytes': param_bytes,
+            'activation_bytes': out_bytes,
+            'output_shapes': [info[o][0] for o in node.output if o in info],
+        })
+
+    totals = {
+        'macs': sum(n['macs'] for n in nodes),
+        'flops': sum(n['flops'] for n in nodes),
+        'param_bytes': sum(nbytes(n) for n in initializers),
+        'activation_bytes': sum(n['activation_bytes'] for n in nodes),
+        'peak_memory_bytes': peak,
+        'num_nodes': len(nodes),
+    }
+    return nodes, totals
+
+def runtime_node_times(onnx_path, runs=10):
+    """Average per-node kernel time in microseconds from onnxruntime profiling"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.enable_profiling = True
+    # Keep graph nodes unfused so timings line up with the static report
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+    options.profile_file_prefix = os.path.join(os.path.dirname(onnx_path) or '.', 'ort_profile')
+    session = ort.InferenceSession(onnx_path, options, providers=['CPUExecutionProvider'])
+
+    feeds = {}
+    for inp in session.get_inputs():
+        shape = [d if isinstance(d, int) else 1 for d in inp.shape]
+        dtype = np.uint8 if 'uint8' in inp.type else np.float32
+        feeds[inp.name] = np.random.rand(*shape).astype(dtype)
+
+    session.run(None, feeds)  # Warm-up (excluded below)
+    for _ in range(runs):
+        session.run(None, feeds)
+    profile_path = session.end_profiling()
+
+    with open(profile_path) as f:
+        events = json.load(f)
+    os.remove(profile_path)
+
+    totals, counts = {}, {}
+    for e in events:
+        if e.get('cat') != 'Node' or not e.get('name', '').endswith('_kernel_time'):
+            continue
+        name = e['args'].get('node_name') or e['name'][:-len('_kernel_time')]
+        if name not in counts:
+            counts[name] = 0  # First event per node is the warm-up run
+            totals[name] = 0
+            continue
+        totals[name] += e['dur']
+        counts[name] += 1
+    return {name: totals[name] / counts[name] for name in totals if counts[name]}
+
+def diff_cost_reports(previous, current, top=10):
+    """Print which layers and op types grew between two saved reports"""
+    print(f"\nChanges vs previous export:")
+    for key in ('macs', 'param_bytes', 'peak_memory_bytes', 'num_nodes'):
+        old, new = previous['totals'].get(key, 0), current['totals'].get(key, 0)
+        change = f"{(new - old) / old * 100:+.1f}%" if old else 'new'
+        print(f"  {key}: {old:,} -> {new:,} ({change})")
+
+    old_nodes = {n['name']: n for n in previous['nodes']}
+    growth = []
+    for n in current['nodes']:
+        old = old_nodes.get(n['name'])
+        if old is None:
+            continue
+        old_time = old.get('time_us') or 0
+        delta_us = (n.get('time_us') or 0) - old_time
+        # Ignore timing jitter: only count >10% and >20 us slowdowns
+        if delta_us < max(0.1 * old_time, 20):
+            delta_us = 0.0
+        growth.append((n['macs'] - old['macs'], delta_us, n['name'], n['op_type']))
+    growth = [g for g in sorted(growth, reverse=True) if g[0] > 0 or g[1] > 0][:top]
+    if growth:
+        print(f"\n  Layers that grew (MACs, time):")
+        for d_macs, d_time, name, op in growth:
+            print(f"    {name} ({op}): {d_macs:+,} MACs, {d_time:+.1f} us")
+
+    added = {n['name'] for n in current['nodes']} - set(old_nodes)
+    removed = set(old_nodes) - {n['name'] for n in current['nodes']}
+    if added or removed:
+        print(f"\n  Nodes added: {len(added)}, removed: {len(removed)}")
+
+def profile_onnx_model(onnx_path, report_path=None, runtime_profile=True):
+    """Save a per-node cost report as JSON and diff it against the previous one"""
+    print(f"\n{'='*60}")
+    print("Profiling ONNX model...")
+    print(f"{'='*60}")
+
+    nodes, totals = static_cost_report(onnx.load(onnx_path))
+    if runtime_profile:
+        try:
+            times = runtime_node_times(onnx_path)
+            for n in nodes:
+                n['time_us'] = times.get(n['name'])
+            totals['time_us'] = sum(times.values())
+        except Exception as e:
+            print(f"⚠ Runtime profiling skipped: {e}")
+
+    print(f"  GMACs: {totals['macs'] / 1e9:.2f}")
+    print(f"  Parameters: {totals['param_bytes'] / (1024 * 1024):.2f} MB")
+    print(f"  Peak intermediate memory: {totals['peak_memory_bytes'] / (1024 * 1024):.2f} MB")
+    if 'time_us' in totals:
+        print(f"  Measured CPU time: {totals['time_us'] / 1000:.2f} ms")
+
+    print(f"\n  Top layers by MACs:")
+    for n in sorted(nodes, key=lambda n: n['macs'], reverse=True)[:5]:
+        timing = f", {n['time_us']:.0f} us" if n.get('time_us') is not None else ''
+        print(f"    {n['name']} ({n['op_type']}): {n['macs'] / 1e6:.1f} MMACs{timing}")
+
+    report = {'model': onnx_path, 'totals': totals, 'nodes': nodes}
+    report_path = report_path or onnx_path.replace('.onnx', '_profile.json')
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            previous = json.load(f)
+        diff_cost_reports(previous, report)
+        shutil.copy2(report_path, report_path.replace('.json', '.prev.json'))
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Cost report saved to: {report_path}")
+    return report
+
+def verify_onnx_model(onnx_path, profile=True):
     """Verify and simplify ONNX model"""
     print(f"\n{'='*60}")
     print("Verifying ONNX model...")
@@ -30,12 +245,12 @@ def verify_onnx_model(onnx_path):
     # Print input/output info
     print(f"\nInput Tensors:")
     for input_tensor in model.graph.input:
-        shape = [dim.dim_value for dim in input_tensor.type.tensor_type.shape.dim]
+        shape = _format_shape(input_tensor.type.tensor_type)
         print(f"  Name: {input_tensor.name}, Shape: {shape}")
     
     print(f"\nOutput Tensors:")
     for output_tensor in model.graph.output:
-        shape = [dim.dim_value for dim in output_tensor.type.tensor_type.shape.dim]
+        shape = _format_shape(output_tensor.type.tensor_type)
         print(f"  Name: {output_tensor.name}, Shape: {shape}")
     
     # Simplify ONNX model
@@ -43,6 +258,7 @@ def verify_onnx_model(onnx_path):
     print("Simplifying ONNX model...")
     print(f"{'='*60}")
     
+    final_path = onnx_path
     try:
         model_simp, check = onnxsim.simplify(model)
         if check:
@@ -57,14 +273,141 @@ def verify_onnx_model(onnx_path):
             print(f"  Simplified size: {simplified_size:.2f} MB")
             print(f"  Size reduction: {((original_size - simplified_size) / original_size * 100):.1f}%")
             
-            return simplified_path
+            final_path = simplified_path
         else:
             print("⚠ Simplification check failed, using original model")
-            return onnx_path
     except Exception as e:
         print(f"⚠ Error during simplification: {e}")
         print("  Using original ONNX model")
-        return onnx_path
+    
+    if profile:
+        profile_onnx_model(final_path)
+    return final_path
+
+def export_pt_to_onnx(pt_path, output_dir='models/onnx', imgsz=640, opset=11, simplify=True,
+                      output_name=None, profile=True):
+    """Export a .pt model to ONNX in output_dir, verify (and simplify) it.
+    Returns the path of the final ONNX model."""
+    # Load YOLO model
+    print(f"\n{'='*60}")
+    print("Loading YOLO model...")
+    model = YOLO(pt_path)
+    
+    # Export to ONNX
+    print(f"\n{'='*60}")
+    print("Exporting to ONNX format...")
+    print(f"{'='*60}\n")
+    
+    # Export with specific settings for Hailo compatibility
+    export_path = model.export(
+        format='onnx',
+        imgsz=imgsz,
+        opset=opset,
+        simplify=False,  # We'll simplify manually for better control
+        dynamic=False,  # Static batch size for Hailo
+        half=False,  # Full precision (FP32)
+    )
+    
+    print(f"\n✓ ONNX model exported successfully!")
+    print(f"  Path: {export_path}")
+    
+    # Get file size
+    file_size = os.path.getsize(export_path) / (1024 * 1024)
+    print(f"  Size: {file_size:.2f} MB")
+    
+    # Move to output directory
+    output_path = os.path.join(output_dir, output_name or Path(export_path).name)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Copy file
+    shutil.copy2(export_path, output_path)
+    print(f"\n✓ Model copied to: {output_path}")
+    
+    # Verify and simplify ONNX model
+    if simplify:
+        return verify_onnx_model(output_path, profile=profile)
+    verify_onnx_model(output_path, profile=profile)
+    return output_path
+
+def fold_input_normalization(onnx_path, output_path=None):
+    """Prepend uint8 NHWC -> float32 NCHW / 255 to the graph.
+    The new model takes RGB camera/decoder buffers as they are. The original
+    float input and its first nodes are recorded in the model metadata so
+    step 3 can parse from there and normalize on the Hailo chip instead.
+    Saved as <name>_uint8.onnx."""
+    print(f"\n{'='*60}")
+    print("Folding input normalization into the graph...")
+    print(f"{'='*60}")
+    
+    model = onnx.load(onnx_path)
+    graph = model.graph
+    old_input = graph.input[0]
+    name = old_input.name
+    dims = [d.dim_value or d.dim_param for d in old_input.type.tensor_type.shape.dim]
+    if len(dims) != 4 or dims[1] != 3:
+        raise ValueError(f"Expected a float NCHW input with 3 channels, got {dims}")
+    batch, channels, height, width = dims
+    
+    normalized = f"{name}_normalized"
+    start_nodes = [node.name for node in graph.node if name in node.input]
+    for node in graph.node:
+        for i, inp in enumerate(node.input):
+            if inp == name:
+                node.input[i] = normalized
+    
+    # Transpose the uint8 tensor first: 4x less data to move than after the cast
+    scale = numpy_helper.from_array(np.array(1.0 / 255.0, dtype=np.float32), f"{name}_scale")
+    prologue = [
+        helper.make_node('Transpose', [name], [f"{name}_nchw"], perm=[0, 3, 1, 2], name=f"{name}_to_nchw"),
+        helper.make_node('Cast', [f"{name}_nchw"], [f"{name}_float"], to=TensorProto.FLOAT, name=f"{name}_to_float"),
+        helper.make_node('Mul', [f"{name}_float", scale.name], [normalized], name=f"{name}_normalize"),
+    ]
+    nodes = prologue + list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+    graph.initializer.append(scale)
+    graph.input.remove(old_input)
+    graph.input.insert(0, helper.make_tensor_value_info(name, TensorProto.UINT8, [batch, height, width, channels]))
+    
+    for key, value in {
+        'input_format': 'uint8_nhwc_rgb',
+        'normalized_input': normalized,
+        'normalized_shape': json.dumps(dims),
+        'start_nodes': json.dumps(start_nodes),
+    }.items():
+        entry = model.metadata_props.add()
+        entry.key, entry.value = key, value
+    
+    onnx.checker.check_model(model)
+    output_path = output_path or onnx_path.replace('.onnx', '_uint8.onnx')
+    onnx.save(model, output_path)
+    print(f"✓ uint8 NHWC input model saved to: {output_path}")
+    print(f"  Input: {name} uint8 {[batch, height, width, channels]}")
+    return output_path
+
+def export_dynamic_onnx(pt_path, output_dir='models/onnx', imgsz=640, opset=11):
+    """Dynamic-batch ONNX export for host-side bulk inference (bulk_inference.py).
+    Not for Hailo, which needs the static export. Saved as <name>_dynamic.onnx."""
+    print(f"\n{'='*60}")
+    print("Exporting dynamic-batch ONNX model...")
+    print(f"{'='*60}\n")
+    
+    model = YOLO(pt_path)
+    export_path = model.export(
+        format='onnx',
+        imgsz=imgsz,
+        opset=opset,
+        simplify=False,
+        dynamic=True,  # Batch (and image size) become free dimensions
+        half=False,
+    )
+    
+    output_path = os.path.join(output_dir, Path(export_path).stem + '_dynamic.onnx')
+    os.makedirs(output_dir, exist_ok=True)
+    shutil.move(export_path, output_path)  # Export reuses the static file name
+    onnx.checker.check_model(onnx.load(output_path))
+    print(f"✓ Dynamic-batch model saved to: {output_path}")
+    return output_path
 
 def main():
     print("="*60)
@@ -76,6 +419,8 @@ def main():
     OUTPUT_DIR = 'models/onnx'
     IMGSZ = 640  # Must match training image size
     SIMPLIFY = True
+    EXPORT_DYNAMIC = True  # Also export a dynamic-batch model for bulk_inference.py
+    FOLD_NORMALIZATION = False  # Also save a *_uint8.onnx variant that takes uint8 NHWC frames directly
     OPSET = 11  # ONNX opset version (11 is compatible with Hailo)
     
     # Check if model exists
@@ -99,55 +444,21 @@ def main():
     print(f"  ONNX Opset: {OPSET}")
     print(f"  Simplify: {SIMPLIFY}")
     
-    # Load YOLO model
-    print(f"\n{'='*60}")
-    print("Loading YOLO model...")
-    model = YOLO(PT_MODEL_PATH)
-    
-    # Export to ONNX
-    print(f"\n{'='*60}")
-    print("Exporting to ONNX format...")
-    print(f"{'='*60}\n")
-    
     try:
-        # Export with specific settings for Hailo compatibility
-        export_path = model.export(
-            format='onnx',
-            imgsz=IMGSZ,
-            opset=OPSET,
-            simplify=False,  # We'll simplify manually for better control
-            dynamic=False,  # Static batch size for Hailo
-            half=False,  # Full precision (FP32)
-        )
-        
-        print(f"\n✓ ONNX model exported successfully!")
-        print(f"  Path: {export_path}")
-        
-        # Get file size
-        file_size = os.path.getsize(export_path) / (1024 * 1024)
-        print(f"  Size: {file_size:.2f} MB")
-        
-        # Move to output directory
-        output_path = os.path.join(OUTPUT_DIR, Path(export_path).name)
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        
-        # Copy file
-        import shutil
-        shutil.copy2(export_path, output_path)
-        print(f"\n✓ Model copied to: {output_path}")
-        
-        # Verify and simplify ONNX model
-        if SIMPLIFY:
-            simplified_path = verify_onnx_model(output_path)
-            final_model = simplified_path
-        else:
-            verify_onnx_model(output_path)
-            final_model = output_path
+        final_model = export_pt_to_onnx(PT_MODEL_PATH, OUTPUT_DIR, imgsz=IMGSZ, opset=OPSET, simplify=SIMPLIFY)
+        dynamic_model = export_dynamic_onnx(PT_MODEL_PATH, OUTPUT_DIR, imgsz=IMGSZ, opset=OPSET) if EXPORT_DYNAMIC else None
+        uint8_models = []
+        if FOLD_NORMALIZATION:
+            uint8_models = [fold_input_normalization(p) for p in (final_model, dynamic_model) if p]
         
         print(f"\n{'='*60}")
         print("Conversion completed successfully!")
         print(f"{'='*60}")
         print(f"\nFinal ONNX model: {final_model}")
+        if dynamic_model:
+            print(f"Dynamic-batch model (bulk inference): {dynamic_model}")
+        for path in uint8_models:
+            print(f"uint8 NHWC input model: {path}")
         
         print(f"\n{'='*60}")
         print("Next Steps:")
@@ -6,6 +6,10 @@ This script should be run inside the Hailo Docker container.
 
 import os
 import sys
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 def check_hailo_installation():
@@ -128,16 +132,212 @@ if __name__ == '__main__':
 """
     return script_content
 
+# Pipeline stages, in order. Each stage writes one checkpoint artifact.
+STAGES = ('parse', 'quantize', 'compile')
+DEFAULT_INPUT_SHAPE = [1, 3, 640, 640]
+# On-chip equivalent of the /255 that step 2 folds into *_uint8.onnx models
+HAILO_NORMALIZATION = 'normalization1 = normalization([0.0, 0.0, 0.0], [255.0, 255.0, 255.0])\n'
+
+def _file_digest(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _fingerprint(*parts):
+    """Stable hash of a stage's inputs"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+def onnx_input_shape(onnx_path):
+    """Static input shape of an ONNX model, falling back to the default"""
+    try:
+        import onnx
+        model = onnx.load(onnx_path, load_external_data=False)
+        dims = model.graph.input[0].type.tensor_type.shape.dim
+        shape = [d.dim_value or 1 for d in dims]
+        return shape if len(shape) == 4 else DEFAULT_INPUT_SHAPE
+    except Exception:
+        return DEFAULT_INPUT_SHAPE
+
+def onnx_input_format(onnx_path):
+    """Start nodes and float input shape of a model whose uint8 NHWC
+    normalization was folded in by step 2, or None for plain float models"""
+    try:
+        import onnx
+        model = onnx.load(onnx_path, load_external_data=False)
+        meta = {p.key: p.value for p in model.metadata_props}
+    except Exception:
+        return None
+    if meta.get('input_format') != 'uint8_nhwc_rgb':
+        return None
+    shape = [d if isinstance(d, int) else 1 for d in json.loads(meta['normalized_shape'])]
+    return {'start_nodes': json.loads(meta['start_nodes']), 'shape': shape}
+
+def prepare_calibration_set(calib_path, images_dir='test/images', count=50, imgsz=640, raw=False):
+    """Build the calibration dataset once and save it as .npy.
+    raw=True keeps uint8 NHWC pixels, for models that normalize on-chip."""
+    import numpy as np
+    
+    if os.path.exists(images_dir):
+        import cv2
+        
+        images = []
+        image_files = sorted(Path(images_dir).glob('*.jpg'))[:count]
+        
+        for img_path in image_files:
+            img = cv2.imread(str(img_path))
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            img = cv2.resize(img, (imgsz, imgsz))
+            if not raw:
+                img = img.astype(np.float32) / 255.0
+                img = np.transpose(img, (2, 0, 1))
+            images.append(img)
+        
+        calib_dataset = np.array(images)
+        print(f"✓ Prepared {len(images)} calibration images")
+    else:
+        print("⚠ Using synthetic calibration data")
+        calib_dataset = np.random.rand(10, 3, imgsz, imgsz).astype(np.float32)
+        if raw:
+            calib_dataset = (calib_dataset.transpose(0, 2, 3, 1) * 255).astype(np.uint8)
+    
+    os.makedirs(os.path.dirname(calib_path), exist_ok=True)
+    np.save(calib_path, calib_dataset)
+    return calib_path
+
+def hailo_runner_factory(hw_arch, har=None):
+    """Create a Hailo ClientRunner, optionally restored from a HAR checkpoint"""
+    from hailo_sdk_client import ClientRunner
+    if har:
+        return ClientRunner(hw_arch=hw_arch, har=har)
+    return ClientRunner(hw_arch=hw_arch)
+
+def compile_variant(onnx_path, output_dir, calib_path, model_name='ear_detection',
+                    hw_arch='hailo8l', model_script=None, runner_factory=hailo_runner_factory):
+    """Build one ONNX variant into a HEF, resuming from the last valid checkpoint.
+
+    Each stage records a fingerprint of its inputs in checkpoints.json; a
+    stage is re-run only if its fingerprint changed or its artifact is
+    missing, and every later stage is re-run after it.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, 'checkpoints.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    
+    input_shape = onnx_input_shape(onnx_path)
+    folded = onnx_input_format(onnx_path)
+    if folded:
+        # Parse from the float tensor after the folded prologue and let the
+        # chip's normalization layer do the same /255 on raw uint8 pixels
+        input_shape = folded['shape']
+        model_script = HAILO_NORMALIZATION + (model_script or '')
+    artifacts = {
+        'parse': os.path.join(output_dir, f'{model_name}_parsed.har'),
+        'quantize': os.path.join(output_dir, f'{model_name}_quantized.har'),
+        'compile': os.path.join(output_dir, f'{model_name}.hef'),
+    }
+    fingerprints = {}
+    fingerprints['parse'] = _fingerprint(_file_digest(onnx_path), input_shape, hw_arch, model_name)
+    fingerprints['quantize'] = _fingerprint(fingerprints['parse'], _file_digest(calib_path), model_script)
+    fingerprints['compile'] = _fingerprint(fingerprints['quantize'])
+    
+    # First stage whose inputs changed (or whose artifact is gone)
+    start = len(STAGES)
+    for i, stage in enumerate(STAGES):
+        if manifest.get(stage) != fingerprints[stage] or not os.path.exists(artifacts[stage]):
+            start = i
+            break
+    
+    result = {'onnx': onnx_path, 'output_dir': output_dir, 'hef': artifacts['compile'],
+              'skipped': list(STAGES[:start]), 'ran': []}
+    if start == len(STAGES):
+        return result
+    
+    def checkpoint(stage):
+        manifest[stage] = fingerprints[stage]
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        result['ran'].append(stage)
+    
+    # Invalidate later checkpoints before running anything
+    for stage in STAGES[start:]:
+        manifest.pop(stage, None)
+    
+    if start == 0:
+        runner = runner_factory(hw_arch)
+        runner.translate_onnx_model(
+            onnx_path,
+            net_name=model_name,
+            start_node_names=folded['start_nodes'] if folded else None,
+            end_node_names=None,
+            net_input_shapes={n: input_shape for n in folded['start_nodes']} if folded else {'images': input_shape}
+        )
+        runner.save_har(artifacts['parse'])
+        checkpoint('parse')
+    else:
+        runner = runner_factory(hw_arch, har=artifacts[STAGES[start - 1]])
+    
+    if start <= 1:
+        if model_script:
+            runner.load_model_script(model_script)
+        runner.optimize(calib_path)
+        runner.save_har(artifacts['quantize'])
+        checkpoint('quantize')
+    
+    runner.compile()
+    hef_data = runner.get_hef()
+    with open(artifacts['compile'], 'wb') as f:
+        f.write(hef_data)
+    checkpoint('compile')
+    return result
+
+def _compile_job(kwargs):
+    """Process-pool entry point: never raises, reports the error instead"""
+    try:
+        return compile_variant(**kwargs)
+    except Exception as e:
+        import traceback
+        return {'onnx': kwargs['onnx_path'], 'error': f'{e}\n{traceback.format_exc()}'}
+
+def run_matrix(onnx_paths, output_root, calib_path, max_workers=2, raw_calib_path=None, **kwargs):
+    """Compile several ONNX variants concurrently, each in its own output directory.
+    Variants with folded uint8 input use raw_calib_path when given."""
+    jobs = []
+    for onnx_path in onnx_paths:
+        variant = Path(onnx_path).stem
+        calib = raw_calib_path if raw_calib_path and onnx_input_format(onnx_path) else calib_path
+        jobs.append(dict(onnx_path=onnx_path, output_dir=os.path.join(output_root, variant),
+                         calib_path=calib, **kwargs))
+    
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as pool:
+        futures = {pool.submit(_compile_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if 'error' in result:
+                print(f"❌ {result['onnx']}: {result['error']}")
+            else:
+                skipped = ', '.join(result['skipped']) or 'none'
+                print(f"✓ {result['onnx']} -> {result['hef']} (reused: {skipped})")
+    return results
+
 def convert_onnx_to_hef_simple():
-    """Simple conversion using hailo_model_zoo tools"""
+    """Compile every configured ONNX variant to HEF"""
     print("="*60)
     print("STEP 3: Convert ONNX to HEF (Hailo Format)")
     print("="*60)
     
     # Configuration
-    ONNX_MODEL_PATH = 'models/onnx/best_simplified.onnx'  # Update this path
+    ONNX_VARIANTS = ['models/onnx/best_simplified.onnx']  # Add more exports to build them side by side
     OUTPUT_DIR = 'models/hef'
     MODEL_NAME = 'ear_detection'
+    MAX_PARALLEL_BUILDS = 2  # Each Hailo build is CPU and memory hungry
     
     # Alternative paths to check
     alternative_paths = [
@@ -146,32 +346,34 @@ def convert_onnx_to_hef_simple():
         'runs/train/ear_detection/weights/best.onnx',
     ]
     
-    # Check if ONNX model exists
-    if not os.path.exists(ONNX_MODEL_PATH):
-        print(f"\n⚠ Model not found: {ONNX_MODEL_PATH}")
+    # Check if ONNX models exist
+    onnx_paths = [p for p in ONNX_VARIANTS if os.path.exists(p)]
+    for missing in sorted(set(ONNX_VARIANTS) - set(onnx_paths)):
+        print(f"\n⚠ Model not found: {missing}")
+    
+    if not onnx_paths:
         print("\nSearching for ONNX models...")
         
-        found = False
         for alt_path in alternative_paths:
             if os.path.exists(alt_path):
-                ONNX_MODEL_PATH = alt_path
+                onnx_paths = [alt_path]
                 print(f"✓ Found model: {alt_path}")
-                found = True
                 break
         
-        if not found:
+        if not onnx_paths:
             print("\n❌ No ONNX model found!")
             print("\nPlease run step2_file_pt_to_file_onnx.py first to create an ONNX model.")
-            print("\nOr update ONNX_MODEL_PATH in this script to point to your ONNX model.")
+            print("\nOr update ONNX_VARIANTS in this script to point to your ONNX models.")
             return
     
     # Create output directory
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     print(f"\nConversion Configuration:")
-    print(f"  Input ONNX: {ONNX_MODEL_PATH}")
+    print(f"  Input ONNX: {', '.join(onnx_paths)}")
     print(f"  Output Directory: {OUTPUT_DIR}")
     print(f"  Model Name: {MODEL_NAME}")
+    print(f"  Parallel Builds: {MAX_PARALLEL_BUILDS}")
     print(f"  Target: Hailo-8L (Raspberry Pi AI Kit)")
     
     # Check Hailo installation
@@ -182,7 +384,7 @@ def convert_onnx_to_hef_simple():
         
         # Create the alls script
         script_path = os.path.join(OUTPUT_DIR, f'{MODEL_NAME}_compile.py')
-        script_content = create_alls_script(MODEL_NAME, ONNX_MODEL_PATH, OUTPUT_DIR)
+        script_content = create_alls_script(MODEL_NAME, onnx_paths[0], OUTPUT_DIR)
         
         with open(script_path, 'w') as f:
             f.write(script_content)
@@ -203,91 +405,43 @@ def convert_onnx_to_hef_simple():
     print("Starting conversion process...")
     print(f"{'='*60}\n")
     
-    try:
-        from hailo_sdk_client import ClientRunner
-        import numpy as np
-        
-        # Initialize runner for Hailo-8L (Raspberry Pi AI Kit)
-        runner = ClientRunner(hw_arch='hailo8l')
-        
-        # Parse ONNX
-        print("Step 1/4: Parsing ONNX model...")
-        hn, npz = runner.translate_onnx_model(
-            ONNX_MODEL_PATH,
-            net_name=MODEL_NAME,
-            start_node_names=None,
-            end_node_names=None,
-            net_input_shapes={'images': [1, 3, 640, 640]}
-        )
-        runner.load_model_script(hn)
-        print("✓ Model parsed successfully")
-        
-        # Prepare calibration dataset
-        print("\nStep 2/4: Preparing calibration dataset...")
-        test_images_dir = 'test/images'
-        
-        if os.path.exists(test_images_dir):
-            import cv2
-            from pathlib import Path
-            
-            images = []
-            image_files = list(Path(test_images_dir).glob('*.jpg'))[:50]
-            
-            for img_path in image_files:
-                img = cv2.imread(str(img_path))
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                img = cv2.resize(img, (640, 640))
-                img = img.astype(np.float32) / 255.0
-                img = np.transpose(img, (2, 0, 1))
-                images.append(img)
-            
-            calib_dataset = np.array(images)
-            print(f"✓ Prepared {len(images)} calibration images")
-        else:
-            print("⚠ Using synthetic calibration data")
-            calib_dataset = np.random.rand(10, 3, 640, 640).astype(np.float32)
-        
-        # Save calibration dataset
-        calib_path = os.path.join(OUTPUT_DIR, 'calib_set.npy')
-        np.save(calib_path, calib_dataset)
-        
-        # Quantize
-        print("\nStep 3/4: Quantizing model...")
-        runner.optimize(calib_path)
-        quantized_har = os.path.join(OUTPUT_DIR, f'{MODEL_NAME}_quantized.har')
-        runner.save_har(quantized_har)
-        print(f"✓ Model quantized: {quantized_har}")
-        
-        # Compile to HEF
-        print("\nStep 4/4: Compiling to HEF...")
-        runner.compile()
+    # Calibration data is shared by all variants and part of their checkpoints
+    calib_path = prepare_calibration_set(os.path.join(OUTPUT_DIR, 'calib_set.npy'))
+    raw_calib_path = None
+    if any(onnx_input_format(p) for p in onnx_paths):
+        # Models exported with FOLD_NORMALIZATION calibrate on raw uint8 pixels
+        raw_calib_path = prepare_calibration_set(os.path.join(OUTPUT_DIR, 'calib_set_uint8.npy'), raw=True)
+    
+    results = run_matrix(onnx_paths, OUTPUT_DIR, calib_path, max_workers=MAX_PARALLEL_BUILDS,
+                         raw_calib_path=raw_calib_path, model_name=MODEL_NAME)
+    built = [r for r in results if 'error' not in r]
+    
+    if len(onnx_paths) == 1 and built:
+        # Keep the single-model layout the Pi5 instructions expect
         hef_path = os.path.join(OUTPUT_DIR, f'{MODEL_NAME}.hef')
-        
-        hef_data = runner.get_hef()
-        with open(hef_path, 'wb') as f:
-            f.write(hef_data)
-        
-        file_size = os.path.getsize(hef_path) / (1024 * 1024)
-        
-        print(f"\n{'='*60}")
-        print("Conversion completed successfully!")
-        print(f"{'='*60}")
-        print(f"\n✓ HEF model: {hef_path}")
+        shutil.copy2(built[0]['hef'], hef_path)
+    elif built:
+        hef_path = built[0]['hef']
+    else:
+        print(f"\n❌ All {len(results)} builds failed")
+        return
+    
+    print(f"\n{'='*60}")
+    print(f"Conversion completed: {len(built)}/{len(results)} variants built")
+    print(f"{'='*60}")
+    for r in built:
+        file_size = os.path.getsize(r['hef']) / (1024 * 1024)
+        print(f"\n✓ HEF model: {r['hef']}")
         print(f"✓ Size: {file_size:.2f} MB")
-        
-        print(f"\n{'='*60}")
-        print("Next Steps:")
-        print(f"{'='*60}")
-        print(f"1. Copy HEF file to Raspberry Pi 5:")
-        print(f"   scp {hef_path} pi@raspberrypi:~/")
-        print(f"\n2. Run inference on Raspberry Pi 5:")
-        print(f"   python3 step4_code_run_on_pi5.py")
-        print(f"{'='*60}\n")
-        
-    except Exception as e:
-        print(f"\n❌ Error during conversion: {e}")
-        import traceback
-        traceback.print_exc()
+    
+    print(f"\n{'='*60}")
+    print("Next Steps:")
+    print(f"{'='*60}")
+    print(f"1. Copy HEF file to Raspberry Pi 5:")
+    print(f"   scp {hef_path} pi@raspberrypi:~/")
+    print(f"\n2. Run inference on Raspberry Pi 5:")
+    print(f"   python3 step4_code_run_on_pi5.py")
+    print(f"{'='*60}\n")
 
 def main():
     convert_onnx_to_hef_simple()
@@ -4,98 +4,408 @@ gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
 import os
 import numpy as np
-import cv2
 import hailo
 import requests
 import threading
+import queue
+import socket
+from collections import OrderedDict
 from pathlib import Path
-import subprocess
 import time
 
 from hailo_apps.hailo_app_python.core.common.buffer_utils import get_caps_from_pad, get_numpy_from_buffer
 from hailo_apps.hailo_app_python.core.gstreamer.gstreamer_app import app_callback_class
 from hailo_apps.hailo_app_python.apps.detection.detection_pipeline import GStreamerDetectionApp
 
+from tracker import ByteTracker
+from clip_recorder import ClipRecorder
+from verify_worker import VerificationWorker, is_skin_color
+from crop_classifier import classify_crops, context_box, CONTEXT as CLASSIFIER_CONTEXT
+from camera_control import CameraController
+from detection_log import DetectionLog, VERDICT_SEEN, VERDICT_SUBMITTED, VERDICT_ALERTED, VERDICT_REJECTED
+from hard_example_miner import HardExampleMiner
+from alerts import build_alert_payload, encode_alert_image
+from zones import ZoneMap, load_zones
+from best_shot import BestShotSelector, decode_shot
+from detections import DetectionExtractor, LabelTable
+from memory_watchdog import MemoryWatchdog
+from aggregator import AggregatorClient
+
 DISCORD_WEBHOOK_URL = "https://discord.com/api/webhooks/1447260795359596598/z0AycOqXHn3Douayq5BRKbZj_p3GdvrWncBbJ6hZAzFRzzwK9LpyVkmH9wNFvO0dP2RU"
 TARGET_LABEL = "ear"
 CONFIDENCE_THRESHOLD = 0.70
+USE_HOST_TRACKER = False  # True when the pipeline has no hailotracker element (HAILO_UNIQUE_ID)
+DETECT_EVERY_N = 1  # With the host tracker, only associate detections every Nth frame
+RECORD_CLIPS = True  # Save a pre/post-roll clip alongside each alert
+CLIP_DIR = "clips"
+CLIP_PRE_SECONDS = 5
+CLIP_POST_SECONDS = 5
+CLIP_MAX_MB = 48  # Hard cap on compressed pre-roll memory
+VERIFY_IN_WORKER = True  # Skin check in a separate process before alerting
+VERIFY_WORKERS = 1
+MAX_VERIFY_ATTEMPTS = 3  # Re-check a rejected track on up to this many frames
+CROP_CLASSIFIER_PATH = "models/onnx/crop_classifier.onnx"  # Falls back to the HSV skin check if missing
+CLASSIFIER_MAX_BATCH = 8
+CLASSIFIER_MAX_WAIT = 0.02  # Seconds a crop may wait for others to fill a batch
+CAMERA_DEVICE = "/dev/v4l-subdev0"
+CAMERA_CONTROLS = {"auto_exposure": 1, "exposure": 2000, "analogue_gain": 150}  # auto_exposure=1: manual mode
+CAMERA_AUTO_EXPOSURE = False  # Closed-loop exposure/gain on mean luma instead of fixed values
+CAMERA_TARGET_LUMA = 110
+LOG_DETECTIONS = True  # Columnar detection log for long-term analytics
+LOG_DIR = "detections"
+LOG_RETENTION_DAYS = 90
+LOG_RETENTION_GB = 2
+MINE_HARD_EXAMPLES = True  # Save uncertain frames with pre-labels for the next training round
+HARD_EXAMPLE_DIR = "hard_examples"
+HARD_EXAMPLE_MIN_CONFIDENCE = 0.40
+HARD_EXAMPLES_PER_HOUR = 60
+HARD_EXAMPLE_MAX_GB = 2
+BEST_SHOT = True  # Alert with the sharpest/largest frame of a short window, not the first one
+BEST_SHOT_WINDOW = 1.5  # Seconds after a track first qualifies
+BEST_SHOT_TRACK_END = 0.5  # Seconds unseen before a track counts as ended
+ZONES_FILE = "zones.json"  # Polygon exclusion zones / per-zone thresholds (see zones.py)
+ALERT_BACKLOG = 20  # Alerts waiting to be sent (e.g. network outage) before new ones are dropped
+NOTIFIED_MEMORY = 1024  # Track ids remembered as alerted / verification attempts counted (bounded LRUs)
+WATCHDOG = True  # Sample RSS/threads/fds and shed load before the OOM killer steps in
+WATCHDOG_INTERVAL = 10  # Seconds between samples
+WATCHDOG_DIR = "watchdog"
+WATCHDOG_RSS_SOFT_MB = 1024  # Pause clips and hard-example mining, drop the alert backlog
+WATCHDOG_RSS_HARD_MB = 1536  # Additionally force garbage collection and trim the heap
+WATCHDOG_MAX_THREADS = 150
+WATCHDOG_MAX_FDS = 800
+WATCHDOG_TRACE_ALLOCATIONS = False  # tracemalloc top allocators in snapshots (slows Python code)
+AGGREGATOR_URL = None  # e.g. "http://192.168.1.10:8765": send alerts to aggregator.py instead of Discord
+AGGREGATOR_TOKEN = None  # Must match the aggregator's --token, if set
+AGGREGATOR_THUMBNAIL_WIDTH = 480  # Full-frame alerts are downscaled to this before being held for upload
+NODE_NAME = socket.gethostname()
+CAMERA_NAME = "cam0"  # Used by the aggregator for cross-camera dedup (cameras.json)
 
 class user_app_callback_class(app_callback_class):
     def __init__(self):
         super().__init__()
-        self.last_notified_id = -1 
+        self.notified = OrderedDict()  # Alerted track ids, oldest first (bounded LRU)
+        self.notified_ids = np.empty(0, dtype=np.int64)  # Same ids as an array for the vectorized filter
+        self.caps = None  # (format, width, height) once negotiated
+        self.tracker = ByteTracker() if USE_HOST_TRACKER else None
+        self.labels = LabelTable(TARGET_LABEL, [TARGET_LABEL])
+        self.extractor = DetectionExtractor(self.labels, hailo.HAILO_UNIQUE_ID, read_track_ids=not USE_HOST_TRACKER)
+        self.clip_recorder = ClipRecorder(
+            output_dir=CLIP_DIR,
+            pre_seconds=CLIP_PRE_SECONDS,
+            post_seconds=CLIP_POST_SECONDS,
+            max_bytes=CLIP_MAX_MB * 1024 * 1024,
+        ) if RECORD_CLIPS else None
+        self.verifier = None
+        self.crop_context = 0.0  # Margin around verifier crops; the classifier wants its training margin
+        if VERIFY_IN_WORKER and os.path.exists(CROP_CLASSIFIER_PATH):
+            self.crop_context = CLASSIFIER_CONTEXT
+            os.environ['CROP_CLASSIFIER_PATH'] = CROP_CLASSIFIER_PATH  # Inherited by the workers
+            self.verifier = VerificationWorker(classify_crops, num_workers=VERIFY_WORKERS,
+                                               max_batch=CLASSIFIER_MAX_BATCH, max_wait=CLASSIFIER_MAX_WAIT)
+        elif VERIFY_IN_WORKER:
+            self.verifier = VerificationWorker(is_skin_color, num_workers=VERIFY_WORKERS)
+        self.pending = {}  # obj_id -> (frame, confidence, bbox) awaiting a verdict
+        self.verify_attempts = OrderedDict()  # obj_id -> verifications submitted; bounded LRU
+        self.camera = CameraController(
+            device=CAMERA_DEVICE,
+            controls=CAMERA_CONTROLS,
+            auto_exposure=CAMERA_AUTO_EXPOSURE,
+            target_luma=CAMERA_TARGET_LUMA,
+        )
+        self.detection_log = DetectionLog(
+            LOG_DIR,
+            retention_days=LOG_RETENTION_DAYS,
+            retention_bytes=LOG_RETENTION_GB * 1024 ** 3,
+        ) if LOG_DETECTIONS else None
+        self.miner = HardExampleMiner(
+            HARD_EXAMPLE_DIR,
+            conf_range=(HARD_EXAMPLE_MIN_CONFIDENCE, CONFIDENCE_THRESHOLD),
+            per_hour=HARD_EXAMPLES_PER_HOUR,
+            max_total_bytes=HARD_EXAMPLE_MAX_GB * 1024 ** 3,
+        ) if MINE_HARD_EXAMPLES else None
+        self.best_shot = BestShotSelector(
+            window=BEST_SHOT_WINDOW,
+            end_after=BEST_SHOT_TRACK_END,
+        ) if BEST_SHOT else None
+        self.alert_queue = queue.Queue(maxsize=ALERT_BACKLOG)
+        self.alerts_sent = 0
+        self.alerts_dropped = 0
+        threading.Thread(target=self.alert_sender, daemon=True).start()
+        self.aggregator = AggregatorClient(
+            AGGREGATOR_URL, node=NODE_NAME, camera=CAMERA_NAME, token=AGGREGATOR_TOKEN,
+        ) if AGGREGATOR_URL else None
+        if self.aggregator is not None:
+            print(f"✓ Sending alerts to aggregator {AGGREGATOR_URL} as {NODE_NAME}/{CAMERA_NAME}")
+        self.watchdog = MemoryWatchdog(
+            interval=WATCHDOG_INTERVAL,
+            snapshot_dir=WATCHDOG_DIR,
+            rss_soft_mb=WATCHDOG_RSS_SOFT_MB,
+            rss_hard_mb=WATCHDOG_RSS_HARD_MB,
+            max_threads=WATCHDOG_MAX_THREADS,
+            max_fds=WATCHDOG_MAX_FDS,
+            trace_allocations=WATCHDOG_TRACE_ALLOCATIONS,
+            on_shed=self.shed_load,
+            extra_stats=self.runtime_stats,
+        ) if WATCHDOG else None
+        zones = load_zones(ZONES_FILE)
+        self.zone_map = ZoneMap(zones, CONFIDENCE_THRESHOLD) if zones else None
+        if zones:
+            print(f"🗺 Loaded {len(zones)} detection zones from {ZONES_FILE}")
 
-    def send_discord_thread(self, frame, obj_id, confidence):
+    def send_discord_thread(self, frame, obj_id, confidence, bbox=None):
+        if self.aggregator is not None:
+            # The aggregator dedups across cameras and notifies; it fetches the JPEG only if needed.
+            # Best shots are already small crops; full frames are downscaled, the box says where the ear is
+            jpeg = frame if isinstance(frame, bytes) else encode_alert_image(frame, width=AGGREGATOR_THUMBNAIL_WIDTH)
+            if self.aggregator.post(obj_id, confidence, box=bbox, thumbnail=jpeg) is not None:
+                self.alerts_sent += 1
+            return
         try:
-            h, w = frame.shape[:2]
-            scale = 1080 / w
-            small_frame = cv2.resize(frame, (1080, int(h * scale)))
-            small_frame_bgr = cv2.cvtColor(small_frame, cv2.COLOR_RGB2BGR)
-            
-            image_path = f"/tmp/ear_{obj_id}.jpg"
-            cv2.imwrite(image_path, small_frame_bgr)
-            
-            with open(image_path, "rb") as f:
-                payload = {"content": f" ^=^t^t **New Ear Detected**\nObject ID: {obj_id}\nConfidence: {confidence*100:.1f}%"}
-                files = {"file": ("ear.jpg", f, "image/jpeg")}
-                r = requests.post(DISCORD_WEBHOOK_URL, data=payload, files=files, timeout=8)
-                if r.status_code in [200, 204]:
-                    print(f"Discord ID {obj_id} Sent")
-            
-            if os.path.exists(image_path):
-                os.remove(image_path)
+            payload, files = build_alert_payload(frame, obj_id, confidence)
+            r = requests.post(DISCORD_WEBHOOK_URL, data=payload, files=files, timeout=8)
+            if r.status_code in [200, 204]:
+                self.alerts_sent += 1
+                print(f"Discord ID {obj_id} Sent")
         except Exception as e:
             print(f"Discord Error: {e}")
 
-    def send_discord_alert(self, frame, obj_id, confidence):
-        thread = threading.Thread(target=self.send_discord_thread, args=(frame.copy(), obj_id, confidence))
-        thread.daemon = True
-        thread.start()
+    def alert_sender(self):
+        # One sender thread: a network outage queues at most ALERT_BACKLOG alerts
+        while True:
+            self.send_discord_thread(*self.alert_queue.get())
+
+    def send_discord_alert(self, frame, obj_id, confidence, copy=True, bbox=None):
+        if isinstance(frame, np.ndarray) and self.watchdog is not None and self.watchdog.shedding:
+            frame = encode_alert_image(frame)  # Queue ~100 KB instead of a 2.7 MB raw 720p frame
+        elif copy and isinstance(frame, np.ndarray):
+            frame = frame.copy()
+        try:
+            self.alert_queue.put_nowait((frame, obj_id, confidence, bbox))
+        except queue.Full:
+            self.alerts_dropped += 1
+            print(f"⚠ Alert backlog full, dropping alert for ID {obj_id}")
+
+    def shed_load(self, level):
+        """Watchdog callback: free what can be freed. Clips and mining stay
+        paused and new alerts are queued as JPEGs while watchdog.shedding is set."""
+        dropped = 0
+        while True:
+            try:
+                self.alert_queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                break
+        self.alerts_dropped += dropped
+        if dropped:
+            print(f"⚠ Dropped {dropped} queued alerts")
+
+    def runtime_stats(self):
+        return {
+            'frames': self.get_count(),
+            'alert_backlog': self.alert_queue.qsize(),
+            'alerts_sent': self.alerts_sent,
+            'alerts_dropped': self.alerts_dropped,
+            'pending_verdicts': len(self.pending),
+            'best_shot_tracks': len(self.best_shot) if self.best_shot is not None else None,
+            **(self.aggregator.stats() if self.aggregator is not None else {}),
+        }
+
+    def log_event(self, obj_id, confidence, verdict, bbox=None):
+        if self.detection_log is None:
+            return
+        if bbox is None:
+            self.detection_log.append(time.time(), obj_id, np.nan, np.nan, np.nan, np.nan, confidence, verdict)
+        else:
+            self.detection_log.append(time.time(), obj_id, *bbox, confidence, verdict)
+
+    def alert(self, frame, obj_id, confidence, copy=True, bbox=None):
+        self.log_event(obj_id, confidence, VERDICT_ALERTED)
+        self.mark_notified(obj_id)
+        self.verify_attempts.pop(obj_id, None)
+        self.send_discord_alert(frame, obj_id, confidence, copy=copy, bbox=bbox)
+        if self.clip_recorder is not None and not (self.watchdog is not None and self.watchdog.shedding):
+            self.clip_recorder.trigger(f"ear_{obj_id}")
+
+    def mark_notified(self, obj_id):
+        self.notified[obj_id] = None
+        self.notified.move_to_end(obj_id)
+        while len(self.notified) > NOTIFIED_MEMORY:
+            self.notified.popitem(last=False)
+        self.notified_ids = np.fromiter(self.notified, dtype=np.int64, count=len(self.notified))
+
+    def count_attempt(self, obj_id):
+        # Tracks that are only ever rejected are never popped by alert(); drop the oldest instead
+        self.verify_attempts[obj_id] = self.verify_attempts.get(obj_id, 0) + 1
+        self.verify_attempts.move_to_end(obj_id)
+        while len(self.verify_attempts) > NOTIFIED_MEMORY:
+            self.verify_attempts.popitem(last=False)
+
+    def release_shots(self):
+        """Alert (or verify) the best shot of every finished track window"""
+        for shot in self.best_shot.collect():
+            if shot.track_id in self.notified or shot.track_id in self.pending:
+                continue
+            if self.verifier is None:
+                self.alert(shot.jpeg, shot.track_id, shot.confidence, bbox=shot.bbox)
+                continue
+            _, crop = decode_shot(shot, self.crop_context)
+            if self.verifier.submit(crop, shot.track_id):
+                self.pending[shot.track_id] = (shot.jpeg, shot.confidence, shot.bbox)
+                self.log_event(shot.track_id, shot.confidence, VERDICT_SUBMITTED)
+                self.count_attempt(shot.track_id)
+
+    def apply_verdicts(self):
+        for obj_id, verdict, meta in self.verifier.poll():
+            frame, confidence, bbox = self.pending.pop(obj_id, (None, None, None))
+            if frame is None or obj_id in self.notified:
+                continue
+            if verdict is None:
+                # The check itself failed; don't drop a possibly real alert over it
+                print(f"⚠ Verification failed for object {obj_id} ({meta.get('error') if meta else 'unknown error'}), alerting unverified")
+                self.alert(frame, obj_id, confidence, copy=False, bbox=bbox)
+            elif verdict:
+                self.alert(frame, obj_id, confidence, copy=False, bbox=bbox)
+            else:
+                self.log_event(obj_id, confidence, VERDICT_REJECTED)
+                reason = 'not a verified ear (Likely earmuff or headphones)'
+                print(f"🚫 Blocked: Object {obj_id} is {reason}.")
+
+def crop_detection(frame, bbox, width, height, context=0.0):
+    """Pixel crop for a normalized (x1, y1, x2, y2) box, grown by `context`"""
+    box = (bbox[0] * width, bbox[1] * height, bbox[2] * width, bbox[3] * height)
+    x1, y1, x2, y2 = context_box(box, width, height, context)
+    return frame[y1:y2, x1:x2]
 
 def app_callback(pad, info, user_data):
     buffer = info.get_buffer()
     if buffer is None: return Gst.PadProbeReturn.OK
     user_data.increment()
     
+    if user_data.verifier is not None:
+        user_data.apply_verdicts()
+    
+    if user_data.caps is None:
+        caps = get_caps_from_pad(pad)
+        user_data.caps = caps if caps[0] else None
+    format, width, height = user_data.caps or (None, None, None)
+    frame = None  # Mapped at most once per buffer, only when something needs it
+    
+    # Optional stages pause while the watchdog is shedding load
+    shedding = user_data.watchdog is not None and user_data.watchdog.shedding
+    recorder = user_data.clip_recorder
+    want_clip = recorder is not None and not shedding and recorder.wants_frame()
+    want_luma = user_data.camera.wants_sample()
+    if want_clip or want_luma:
+        frame = get_numpy_from_buffer(buffer, format, width, height) if format else None
+        if frame is not None:
+            if want_clip:
+                recorder.push(frame)
+            if want_luma:
+                user_data.camera.observe(frame)
+    
     roi = hailo.get_roi_from_buffer(buffer)
-    detections = roi.get_objects_typed(hailo.HAILO_DETECTION)
+    # All detections of this buffer as arrays; everything below is array work
+    dets = user_data.extractor.extract(roi.get_objects_typed(hailo.HAILO_DETECTION))
+    n = dets.count
     
-    for detection in detections:
-        label = detection.get_label()
-        confidence = detection.get_confidence()
-        
-        tracking_info = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
-        obj_id = tracking_info[0].get_id() if tracking_info else -1
+    if user_data.tracker is not None:
+        if user_data.get_count() % DETECT_EVERY_N != 0:
+            # Skipped frame: keep tracks moving, nothing new to alert on
+            user_data.tracker.propagate()
+            return Gst.PadProbeReturn.OK
+        dets.track_id[:n] = user_data.tracker.update(dets.bbox[:n], dets.confidence[:n])
+    
+    track_ids = dets.track_id[:n]
+    confidences = dets.confidence[:n]
+    boxes = dets.bbox[:n]
+    if user_data.detection_log is not None and n:
+        user_data.detection_log.extend(time.time(), track_ids, boxes, confidences, VERDICT_SEEN)
+    
+    # One lookup for all detection centres, before any frame is mapped
+    thresholds = CONFIDENCE_THRESHOLD
+    if user_data.zone_map is not None and n:
+        thresholds = user_data.zone_map.thresholds(dets.centers())
+    # Target label and not inside an exclusion zone
+    target = user_data.labels.is_target[dets.class_id[:n]] & (thresholds < np.inf)
+    
+    if user_data.best_shot is not None:
+        for obj_id in track_ids[target].tolist():
+            user_data.best_shot.seen(obj_id)
+    
+    miner = user_data.miner
+    mine_id = None
+    if miner is not None and not shedding:
+        minable = target & (confidences >= HARD_EXAMPLE_MIN_CONFIDENCE)
+        prelabels = boxes[minable]  # Copy: the batch arrays are reused next buffer
+        for obj_id, confidence in zip(track_ids[minable].tolist(), confidences[minable].tolist()):
+            if miner.is_candidate(confidence, obj_id):
+                mine_id = obj_id
+                break
+    
+    candidates = np.flatnonzero(target & (confidences >= thresholds) & ~np.isin(track_ids, user_data.notified_ids))
+    if len(candidates) > 1:
+        # One entry per track (its most confident box), most confident tracks first
+        order = candidates[np.argsort(-confidences[candidates], kind='stable')]
+        _, first = np.unique(track_ids[order], return_index=True)
+        candidates = order[np.sort(first)]
+    
+    for i in candidates.tolist():
+        obj_id = int(track_ids[i])
+        if obj_id in user_data.pending or user_data.verify_attempts.get(obj_id, 0) >= MAX_VERIFY_ATTEMPTS:
+            continue
+        if frame is None:
+            frame = get_numpy_from_buffer(buffer, format, width, height) if format else None
+            if frame is None:
+                break
+        confidence = float(confidences[i])
+        bbox = tuple(boxes[i].tolist())
         
-        if TARGET_LABEL in label.lower() and confidence >= CONFIDENCE_THRESHOLD:
-            if obj_id > user_data.last_notified_id:
-                format, width, height = get_caps_from_pad(pad)
-                frame = get_numpy_from_buffer(buffer, format, width, height) if format else None
-                
-                if frame is not None:
-                    user_data.last_notified_id = obj_id 
-                    user_data.send_discord_alert(frame, obj_id, confidence)
-                    break 
+        if user_data.best_shot is not None:
+            # Only keep the best frame of the window; released below
+            user_data.best_shot.offer(obj_id, frame, bbox, confidence)
+            continue
+        # At most one alert/verification per frame
+        if user_data.verifier is None:
+            user_data.alert(frame, obj_id, confidence, bbox=bbox)
+            break
+        # Hand the crop to the worker; the alert goes out when the verdict arrives
+        crop = crop_detection(frame, bbox, width, height, user_data.crop_context)
+        if user_data.verifier.submit(crop, obj_id):
+            user_data.pending[obj_id] = (frame.copy(), confidence, bbox)
+            user_data.log_event(obj_id, confidence, VERDICT_SUBMITTED)
+            user_data.count_attempt(obj_id)
+        break
+    
+    if user_data.best_shot is not None and len(user_data.best_shot):
+        user_data.release_shots()
+    
+    if mine_id is not None:
+        if frame is None:
+            frame = get_numpy_from_buffer(buffer, format, width, height) if format else None
+        if frame is not None:
+            miner.offer(frame, mine_id, prelabels)
             
     return Gst.PadProbeReturn.OK
 
-def force_shutter_v4l2():
-    time.sleep(8) 
-    print(" ^=^z^` NUCLEAR STRIKE: Forcing Hardware Controls...")
-    try:
-        subprocess.run(['v4l2-ctl', '-d', '/dev/v4l-subdev0', '--set-ctrl', 'exposure=2000'], check=False)
-        subprocess.run(['v4l2-ctl', '-d', '/dev/v4l-subdev0', '--set-ctrl', 'analogue_gain=150'], check=False)
-        #   ^{     ^t Auto Exposure
-        subprocess.run(['v4l2-ctl', '-d', '/dev/v4l-subdev0', '--set-ctrl', 'auto_exposure=1'], check=False) 
-        print(" ^|^e STRIKE COMPLETE: Hardware values should be locked.")
-    except Exception as e:
-        print(f" ^}^l Error during strike: {e}")
-
 if __name__ == "__main__":
     user_data = user_app_callback_class()
     app = GStreamerDetectionApp(app_callback, user_data)   
-    t = threading.Thread(target=force_shutter_v4l2)
-    t.daemon = True
-    t.start()
+    # Controls go in when the pipeline reaches PLAYING, not after a fixed delay
+    user_data.camera.attach(app.pipeline)
     
-    app.run()
+    try:
+        app.run()
+    finally:
+        if user_data.verifier is not None:
+            user_data.verifier.close()  # Unlinks the shared-memory segment
+        if user_data.detection_log is not None:
+            user_data.detection_log.close()  # Writes the last partial chunk
+        if user_data.miner is not None:
+            user_data.miner.close()  # Saves the current hour's reservoir
+        if user_data.watchdog is not None:
+            user_data.watchdog.close()  # Final snapshot
+        if user_data.aggregator is not None:
+            user_data.aggregator.close()  # Flush queued events
+        if user_data.clip_recorder is not None:
+            user_data.clip_recorder.close()  # Writes pending clips
+        user_data.camera.close()  # Stops the v4l2-ctl thread
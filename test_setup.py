@@ -111,7 +111,13 @@ def check_dataset():
             print(f"❌ {dir_path}: not found")
             all_exist = False
     
-    return all_exist
+    # Check image headers and labels
+    try:
+        from dataset_check import preflight
+    except ImportError:
+        print("⚠ numpy / PyYAML missing, skipping the image and label check")
+        return all_exist
+    return preflight('data.yaml') and all_exist
 
 def check_docker():
     """Check Docker installation"""
@@ -161,6 +167,122 @@ def check_hailo_wheel():
         print("  This is required for converting ONNX to HEF")
         return False
 
+class StubRunner:
+    """Stands in for the Hailo ClientRunner: records calls, writes fake artifacts"""
+    calls = []
+    fail_compile = False
+
+    def __init__(self, hw_arch, har=None):
+        StubRunner.calls.append(('open', os.path.basename(har) if har else None))
+
+    def translate_onnx_model(self, *args, **kwargs):
+        StubRunner.calls.append(('parse',))
+
+    def load_model_script(self, script):
+        StubRunner.calls.append(('script',))
+
+    def optimize(self, calib_path):
+        StubRunner.calls.append(('quantize',))
+
+    def save_har(self, path):
+        Path(path).write_bytes(b'har')
+
+    def compile(self):
+        StubRunner.calls.append(('compile',))
+        if StubRunner.fail_compile:
+            raise RuntimeError('simulated compiler failure')
+
+    def get_hef(self):
+        return b'hef'
+
+def check_step3_resume():
+    """Drive step 3's checkpoint/resume logic with a stub runner (no Hailo SDK needed)"""
+    print_header("Checking Step 3 Checkpoint Resume")
+
+    import tempfile
+    from step3_file_onnx_to_file_hef import compile_variant
+
+    with tempfile.TemporaryDirectory() as tmp:
+        onnx_path, calib_path = os.path.join(tmp, 'model.onnx'), os.path.join(tmp, 'calib.npy')
+        Path(onnx_path).write_bytes(b'onnx v1')
+        Path(calib_path).write_bytes(b'calib v1')
+        out = os.path.join(tmp, 'out')
+
+        def build():
+            StubRunner.calls = []
+            try:
+                result = compile_variant(onnx_path, out, calib_path, runner_factory=StubRunner)
+            except RuntimeError:
+                result = None
+            return result, [c[0] for c in StubRunner.calls]
+
+        cases = []
+        cases.append(('fresh build runs every stage', build()[1] == ['open', 'parse', 'quantize', 'compile']))
+        cases.append(('unchanged inputs reuse everything', build() == (
+            {'onnx': onnx_path, 'output_dir': out, 'hef': os.path.join(out, 'ear_detection.hef'),
+             'skipped': ['parse', 'quantize', 'compile'], 'ran': []}, [])))
+
+        Path(calib_path).write_bytes(b'calib v2')
+        result, calls = build()
+        cases.append(('new calibration set resumes from the parsed HAR',
+                      StubRunner.calls[0] == ('open', 'ear_detection_parsed.har') and calls[1:] == ['quantize', 'compile']
+                      and result['skipped'] == ['parse']))
+
+        os.remove(os.path.join(out, 'ear_detection.hef'))
+        StubRunner.fail_compile = True
+        failed, _ = build()
+        StubRunner.fail_compile = False
+        result, calls = build()
+        cases.append(('failed compile keeps the quantized HAR',
+                      failed is None and StubRunner.calls[0] == ('open', 'ear_detection_quantized.har')
+                      and calls[1:] == ['compile'] and result['skipped'] == ['parse', 'quantize']))
+
+        Path(onnx_path).write_bytes(b'onnx v2')
+        cases.append(('new ONNX invalidates every stage', build()[1] == ['open', 'parse', 'quantize', 'compile']))
+
+    for name, ok in cases:
+        print(f"{'✓' if ok else '❌'} {name}")
+    return all(ok for _, ok in cases)
+
+def check_camera_control():
+    """Drive CameraController against a fake v4l2-ctl script (no camera needed)"""
+    print_header("Checking Camera Control")
+
+    import tempfile
+    from camera_control import CameraController
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, 'calls.log')
+        fake_ok, fake_fail = os.path.join(tmp, 'v4l2-ctl'), os.path.join(tmp, 'v4l2-ctl-broken')
+        Path(fake_ok).write_text(f'#!/bin/sh\necho "$@" >> {log_path}\n')
+        Path(fake_fail).write_text('#!/bin/sh\necho "device busy" >&2\nexit 1\n')
+        os.chmod(fake_ok, 0o755)
+        os.chmod(fake_fail, 0o755)
+
+        camera = CameraController(device='/dev/fake', v4l2_ctl=fake_ok)
+        camera.apply()
+        camera.apply({'exposure': 4000})
+        camera.close()
+        calls = Path(log_path).read_text().splitlines() if os.path.exists(log_path) else []
+
+        broken = CameraController(device='/dev/fake', v4l2_ctl=fake_fail)
+        broken.apply()
+        broken.close()
+
+    cases = [
+        ('one batched v4l2-ctl call per apply', calls == [
+            '-d /dev/fake --set-ctrl auto_exposure=1,exposure=2000,analogue_gain=150',
+            '-d /dev/fake --set-ctrl exposure=4000']),
+        ('applied controls are recorded', camera.apply_count == 2 and camera.applied == {
+            'auto_exposure': 1, 'exposure': 4000, 'analogue_gain': 150}),
+        ('failed v4l2-ctl leaves the state untouched', broken.apply_count == 0 and broken.applied == {}),
+        ('dark scene raises exposure first', camera.compute_update(40.0).get('exposure', 0) > 2000),
+        ('bright scene lowers gain first', camera.compute_update(250.0).get('analogue_gain', 150) < 150),
+    ]
+    for name, ok in cases:
+        print(f"{'✓' if ok else '❌'} {name}")
+    return all(ok for _, ok in cases)
+
 def check_scripts():
     """Check if all scripts exist"""
     print_header("Checking Scripts")
@@ -200,6 +322,8 @@ def main():
     results['pytorch'] = check_pytorch_device()
     results['dataset'] = check_dataset()
     results['scripts'] = check_scripts()
+    results['step3_resume'] = check_step3_resume()
+    results['camera'] = check_camera_control()
     results['hailo'] = check_hailo_wheel()
     results['docker'] = check_docker()  # Optional
     
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Out-of-process detection verification
+Crops are copied into a multiprocessing.shared_memory ring of fixed-size
+slots; only small metadata tuples travel over the queues. CPU-heavy checks
+run in worker processes, away from the GStreamer callback and its GIL.
+"""
+
+import itertools
+import multiprocessing as mp
+import queue
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+
+def is_skin_color(crop_frame, min_percentage=25):
+    """HSV skin-tone check (the earmuff filter from xxx.sh)"""
+    if crop_frame is None or crop_frame.size == 0:
+        return False
+    hsv_frame = cv2.cvtColor(crop_frame, cv2.COLOR_RGB2HSV)
+
+    # Human skin tone range in HSV
+    lower_skin = np.array([0, 20, 70], dtype=np.uint8)
+    upper_skin = np.array([25, 255, 255], dtype=np.uint8)
+
+    mask = cv2.inRange(hsv_frame, lower_skin, upper_skin)
+    skin_percentage = (cv2.countNonZero(mask) / (crop_frame.shape[0] * crop_frame.shape[1])) * 100
+    return skin_percentage > min_percentage
+
+
+def _collect_batch(requests, max_batch, max_wait):
+    """Block for one request, then gather more until the batch is full or max_wait passes"""
+    batch = [requests.get()]
+    deadline = time.monotonic() + max_wait
+    while batch[-1] is not None and len(batch) < max_batch:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(requests.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _worker_main(shm_name, slot_bytes, requests, results, check_fn, max_batch, max_wait):
+    """Worker process loop: read crops from shared slots, post verdicts.
+    With max_batch > 1, check_fn receives a list of crops and returns a list."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        while True:
+            batch = _collect_batch(requests, max_batch, max_wait)
+            stop = batch[-1] is None
+            batch = [m for m in batch if m is not None]
+
+            crops = [np.ndarray((h, w, 3), dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                     for slot, h, w, _ in batch]
+            error = None
+            try:
+                if not crops:
+                    verdicts = []
+                elif max_batch > 1:
+                    verdicts = list(check_fn(crops))
+                else:
+                    verdicts = [check_fn(crops[0])]
+            except Exception as e:
+                verdicts = [None] * len(crops)
+                error = str(e)
+            del crops  # Release the buffer exports before the slots are reused
+
+            for (slot, _, _, token), verdict in zip(batch, verdicts):
+                results.put((slot, token, verdict, error))
+            if stop:
+                break
+    finally:
+        shm.close()
+
+
+class VerificationWorker:
+    """Pool of verification processes fed through a shared-memory slot ring.
+
+    submit() is safe to call from the streaming thread: it grabs a free
+    slot, copies (and if needed downsizes) the crop into it and enqueues a
+    tiny message. poll() returns finished verdicts and recycles their slots.
+    Each worker has its own request queue, so when one dies (OOM, a crash
+    in native code) poll() knows which requests it held: they come back
+    with verdict None, their slots are freed and the worker is respawned.
+    check_fn must be a module-level function so it can be sent to the
+    spawned workers. With max_batch > 1 it is called with up to max_batch
+    crops gathered across frames, waiting at most max_wait seconds.
+    """
+
+    def __init__(self, check_fn=is_skin_color, num_workers=1, num_slots=8, slot_size=(320, 320),
+                 max_batch=1, max_wait=0.02):
+        self.slot_h, self.slot_w = slot_size
+        self.slot_bytes = self.slot_h * self.slot_w * 3
+        self.num_slots = num_slots
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * num_slots)
+        self._free = deque(range(num_slots))
+
+        # spawn: forking a process that runs GStreamer threads is unsafe
+        self._ctx = mp.get_context('spawn')
+        self._worker_args = (check_fn, max_batch, max_wait)
+        self._results = self._ctx.Queue()
+        self._workers = [None] * num_workers  # (process, request queue)
+        self._load = [0] * num_workers
+        self._outstanding = {}  # slot -> (token, worker index, obj_id, meta)
+        self._tokens = itertools.count()
+        for i in range(num_workers):
+            self._start_worker(i)
+
+        self.submitted = 0
+        self.dropped = 0
+        self.restarts = 0
+
+    def _start_worker(self, index):
+        requests = self._ctx.Queue()
+        p = self._ctx.Process(target=_worker_main, daemon=True,
+                              args=(self.shm.name, self.slot_bytes, requests, self._results, *self._worker_args))
+        p.start()
+        self._workers[index] = (p, requests)
+
+    def _slot_view(self, slot, h, w):
+        return np.ndarray((h, w, 3), dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def submit(self, crop, obj_id, meta=None):
+        """Copy a crop into a free slot and queue it. Returns False when full."""
+        if crop is None or crop.size == 0:
+            return False
+        if not self._free:
+            self.dropped += 1
+            return False
+
+        h, w = crop.shape[:2]
+        scale = min(1.0, self.slot_h / h, self.slot_w / w)
+        th, tw = max(1, int(h * scale)), max(1, int(w * scale))
+
+        slot = self._free.popleft()
+        view = self._slot_view(slot, th, tw)
+        if scale < 1.0:
+            cv2.resize(crop, (tw, th), dst=view, interpolation=cv2.INTER_AREA)
+        else:
+            view[...] = crop
+        index = self._load.index(min(self._load))  # Least busy worker
+        token = next(self._tokens)
+        self._outstanding[slot] = (token, index, obj_id, meta)
+        self._load[index] += 1
+        self._workers[index][1].put((slot, th, tw, token))
+        self.submitted += 1
+        return True
+
+    def poll(self):
+        """Non-blocking: return [(obj_id, verdict, meta), ...] for finished checks"""
+        done = []
+        while True:
+            try:
+                slot, token, verdict, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if self._outstanding.get(slot, (None,))[0] != token:
+                continue  # Late result of a request already failed with its dead worker
+            done.append(self._release(slot, verdict, error))
+
+        for index, (p, _) in enumerate(self._workers):
+            if p.is_alive():
+                continue
+            error = f"verification worker exited with code {p.exitcode}"
+            lost = [slot for slot, (_, i, _, _) in self._outstanding.items() if i == index]
+            done.extend(self._release(slot, None, error) for slot in lost)
+            print(f"⚠ Verification worker {index} died (exit code {p.exitcode}), "
+                  f"failed {len(lost)} requests, restarting it")
+            self._start_worker(index)
+            self.restarts += 1
+        return done
+
+    def _release(self, slot, verdict, error):
+        _, index, obj_id, meta = self._outstanding.pop(slot)
+        self._load[index] -= 1
+        self._free.append(slot)
+        if error is not None:
+            meta = dict(meta or {}, error=error)
+        return obj_id, verdict, meta
+
+    def busy_slots(self):
+        return self.num_slots - len(self._free)
+
+    def close(self):
+        for _, requests in self._workers:
+            requests.put(None)
+        for p, _ in self._workers:
+            p.join(timeout=2)
+            if p.is_alive():
+                p.terminate()
+        self.shm.close()
+        self.shm.unlink()
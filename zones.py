@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Polygon detection zones
+Each zone either excludes detections whose centre falls inside it (posters,
+mannequins, mirrors) or gives them their own confidence threshold. Zones
+are rasterised once into a low-resolution label mask, so testing all
+detection centres against all zones is one array lookup per frame.
+
+zones.json (coordinates normalized to the frame, 0..1):
+    [
+      {"name": "poster", "polygon": [[0.70, 0.10], [0.95, 0.10], [0.95, 0.50], [0.70, 0.50]], "exclude": true},
+      {"name": "mirror", "polygon": [[0.00, 0.30], [0.20, 0.30], [0.20, 0.90], [0.00, 0.90]], "min_confidence": 0.90}
+    ]
+
+Usage:
+    python zones.py --image snapshot.jpg   # draw zones over a camera frame
+"""
+
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+
+def load_zones(path):
+    """List of zone dicts from a JSON file ([] if the file does not exist)"""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        zones = json.load(f)
+    for i, zone in enumerate(zones):
+        if len(zone.get('polygon', [])) < 3:
+            raise ValueError(f"Zone {zone.get('name', i)} needs a polygon with at least 3 points")
+        if not zone.get('exclude') and 'min_confidence' not in zone:
+            raise ValueError(f"Zone {zone.get('name', i)} needs 'exclude' or 'min_confidence'")
+    return zones
+
+
+class ZoneMap:
+    """Label mask + threshold lookup table.
+
+    mask[y, x] holds the index of the zone covering that cell (0 = none),
+    and lut[index] its confidence threshold, with +inf for exclusions.
+    Where zones overlap the stricter one wins.
+    """
+
+    def __init__(self, zones, default_threshold, resolution=(256, 144)):
+        self.zones = zones
+        self.width, self.height = resolution
+        self.lut = np.array([default_threshold] + [
+            np.inf if z.get('exclude') else float(z['min_confidence']) for z in zones
+        ], dtype=np.float32)
+
+        self.mask = np.zeros((self.height, self.width), dtype=np.uint8)
+        scale = np.array([self.width, self.height], dtype=np.float32)
+        # Draw the least strict zones first so stricter ones overwrite them
+        for idx in sorted(range(1, len(zones) + 1), key=lambda i: self.lut[i]):
+            polygon = np.round(np.asarray(zones[idx - 1]['polygon'], dtype=np.float32) * scale).astype(np.int32)
+            cv2.fillPoly(self.mask, [polygon], int(idx))
+
+    def zone_indices(self, centers):
+        """Zone index (0 = none) for each normalized (x, y) centre"""
+        centers = np.asarray(centers, dtype=np.float32).reshape(-1, 2)
+        ix = np.clip((centers[:, 0] * self.width).astype(np.intp), 0, self.width - 1)
+        iy = np.clip((centers[:, 1] * self.height).astype(np.intp), 0, self.height - 1)
+        return self.mask[iy, ix]
+
+    def thresholds(self, centers):
+        """Confidence threshold for each centre (+inf inside exclusion zones)"""
+        return self.lut[self.zone_indices(centers)]
+
+    def draw(self, image, alpha=0.35):
+        """Overlay the zones on a BGR image (for checking the configuration)"""
+        h, w = image.shape[:2]
+        labels = cv2.resize(self.mask, (w, h), interpolation=cv2.INTER_NEAREST)
+        overlay = image.copy()
+        overlay[(labels > 0) & np.isinf(self.lut[labels])] = (0, 0, 255)
+        overlay[(labels > 0) & np.isfinite(self.lut[labels])] = (0, 200, 255)
+        out = cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0)
+        for i, zone in enumerate(self.zones, start=1):
+            points = np.round(np.asarray(zone['polygon']) * [w, h]).astype(np.int32)
+            cv2.polylines(out, [points], True, (255, 255, 255), 2)
+            rule = 'excluded' if np.isinf(self.lut[i]) else f">= {self.lut[i]:.2f}"
+            cv2.putText(out, f"{zone.get('name', i)}: {rule}", tuple(int(v) for v in points[0]),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preview detection zones on a camera frame')
+    parser.add_argument('--zones', default='zones.json')
+    parser.add_argument('--image', required=True, help='Camera snapshot to draw on')
+    parser.add_argument('--output', default='zones_preview.jpg')
+    parser.add_argument('--threshold', type=float, default=0.70, help='Global confidence threshold')
+    args = parser.parse_args()
+
+    zones = load_zones(args.zones)
+    if not zones:
+        print(f"❌ No zones found in {args.zones}")
+        return
+    image = cv2.imread(args.image)
+    if image is None:
+        print(f"❌ Cannot read image: {args.image}")
+        return
+
+    zone_map = ZoneMap(zones, args.threshold)
+    cv2.imwrite(args.output, zone_map.draw(image))
+    print(f"✓ {len(zones)} zones drawn to: {args.output}")
+
+if __name__ == '__main__':
+    main()